@@ -1,7 +1,10 @@
-from event_loop import EventLoop
-import queue
+from event_loop import EventLoop, MultiPortfolioEventLoop
+from event import DequeEventQueue
 from abc import ABCMeta, abstractmethod
-from data import HistoricCSVDataHandler
+from data import HistoricCSVDataHandler, ArrayDataHandler
+from vectorised import VectorisedBacktest
+from journal import EventJournal
+from checkpoint import Checkpointer
 from strategy import LongRateStrategy
 from execution import SimulatedExecutionHandler
 from portfolio import NaivePortfolio
@@ -18,51 +21,191 @@ class Backtest(object):
 
         raise NotImplementedError("Should implement run_backtest()")
 
+    def resume(self, checkpoint_path):
+        """
+        Restores the state saved in a checkpoint (see Checkpointer), so that
+        run_backtest() carries on from there. Only for event loop backtests.
+        """
+        self.eventLoop.set_state(Checkpointer.load(checkpoint_path))
+
+def _build_long_rate_strategy(start_date_time, end_date_time, csv_dir, token_list, backtest_frequency,
+                              fixed_rate_lookback, fixed_rate_compounding):
+    """
+    Returns the events queue, the data handler and the LongRateStrategy shared by
+    the long rate backtests, the first bar already read.
+    """
+    if token_list is None:
+        token_list = ["aave_usdc"]
+
+    # backtests run on a single thread, hence need no locking queue
+    events_queue = DequeEventQueue()
+
+    dataHandler = HistoricCSVDataHandler(
+        events=events_queue,
+        csv_dir=csv_dir,
+        token_list=token_list,
+        start_date_time=start_date_time,
+        end_date_time=end_date_time,
+        backtest_frequency=backtest_frequency,
+        fixed_rate_lookback=fixed_rate_lookback,
+        fixed_rate_compounding=fixed_rate_compounding
+    )
+
+    strategy = LongRateStrategy(
+        rates=dataHandler,
+        events=events_queue
+    )
+
+    # one bar needs to pass to enable fixed rate calculations which need at least two historical rate values,
+    # the strategy waits for more with a longer fixed rate lookback
+    dataHandler.update_rates()
+
+    return events_queue, dataHandler, strategy
+
+
 class LongRateStrategyBacktest(Backtest):
 
     def __init__(self, start_date_time='2022-04-01 00:00:00',
                  end_date_time='2022-06-01 00:00:00',
-                 leverage=1.0, initial_capital=1.0):
-
-        self.events_queue = queue.Queue()
+                 leverage=1.0, initial_capital=1.0,
+                 csv_dir="datasets", token_list=None, backtest_frequency='D',
+                 profiler=None, journal_path=None, checkpoint_dir=None, checkpoint_interval=1000,
+                 valuation='book', fixed_rate_lookback=1, fixed_rate_compounding=True):
+
+        self.events_queue, self.dataHandler, self.strategy = _build_long_rate_strategy(
+            start_date_time, end_date_time, csv_dir, token_list, backtest_frequency,
+            fixed_rate_lookback, fixed_rate_compounding
+        )
 
-        self.dataHandler = HistoricCSVDataHandler(
+        self.portfolio = NaivePortfolio(
+            rates=self.dataHandler,
             events=self.events_queue,
-            csv_dir="datasets",
-            token_list=["aave_usdc"],
             start_date_time=start_date_time,
-            end_date_time=end_date_time
+            leverage=leverage,
+            initial_capital=initial_capital,
+            valuation=valuation
         )
 
-        self.strategy = LongRateStrategy(
-            rates=self.dataHandler,
+        self.executionHandler = SimulatedExecutionHandler(
             events=self.events_queue
         )
 
-        self.portfolio = NaivePortfolio(
-            rates=self.dataHandler,
+        self.eventLoop = EventLoop(
             events=self.events_queue,
+            rates=self.dataHandler,
+            strategy=self.strategy,
+            portfolio=self.portfolio,
+            executionHandler=self.executionHandler,
+            profiler=profiler,
+            journal=EventJournal(journal_path, self.dataHandler) if journal_path else None,
+            checkpointer=Checkpointer(checkpoint_dir, checkpoint_interval) if checkpoint_dir else None
+        )
+
+    def run_backtest(self):
+        self.eventLoop.run_outer_loop()
+
+        if self.eventLoop.journal is not None:
+            self.eventLoop.journal.close()
+
+        return self.eventLoop.portfolio
+
+class VectorisedLongRateStrategyBacktest(Backtest):
+    """
+    Runs the same backtest as LongRateStrategyBacktest with a VectorisedBacktest
+    over the rate panel of an ArrayDataHandler instead of the event loop. Its
+    equity curve is laid out as the event loop one (see VectorisedBacktest.event_loop_holdings)
+    and matches it exactly.
+    """
+
+    def __init__(self, start_date_time='2022-04-01 00:00:00',
+                 end_date_time='2022-06-01 00:00:00',
+                 leverage=1.0, initial_capital=1.0,
+                 csv_dir="datasets", token_list=None, backtest_frequency='D',
+                 fixed_rate_lookback=1, fixed_rate_compounding=True):
+
+        if token_list is None:
+            token_list = ["aave_usdc"]
+
+        self.start_date_time = start_date_time
+
+        self.dataHandler = ArrayDataHandler(
+            events=DequeEventQueue(),
+            csv_dir=csv_dir,
+            token_list=token_list,
             start_date_time=start_date_time,
+            end_date_time=end_date_time,
+            backtest_frequency=backtest_frequency,
+            fixed_rate_lookback=fixed_rate_lookback,
+            fixed_rate_compounding=fixed_rate_compounding
+        )
+
+        self.backtest = VectorisedBacktest(
+            timestamps=self.dataHandler.timestamps,
+            liquidity_indices=self.dataHandler.liquidity_indices,
+            token_list=self.dataHandler.token_list,
+            signals=LongRateStrategy.vectorised_signals(self.dataHandler.liquidity_indices, lookback=fixed_rate_lookback),
             leverage=leverage,
-            initial_capital=initial_capital
+            initial_capital=initial_capital,
+            start_date_time=start_date_time,
+            fixed_rate_lookback=fixed_rate_lookback,
+            fixed_rate_compounding=fixed_rate_compounding
         )
 
-        self.executionHandler = SimulatedExecutionHandler(
-            events=self.events_queue
+    def run_backtest(self):
+        self.backtest.run()
+        self.backtest.create_equity_curve_dataframe(event_loop_layout=True)
+
+        return self.backtest.equity_curve
+
+
+class MultiPortfolioLongRateStrategyBacktest(Backtest):
+    """
+    Runs the LongRateStrategyBacktest of several portfolios at once, e.g. to compare
+    leverages, initial capitals or sizing rules: the CSV files are read, the bars
+    advanced and the signals generated a single time for all of them (see
+    MultiPortfolioEventLoop), each portfolio ending up as in a backtest of its own.
+    """
+
+    def __init__(self, portfolio_params, start_date_time='2022-04-01 00:00:00',
+                 end_date_time='2022-06-01 00:00:00',
+                 csv_dir="datasets", token_list=None, backtest_frequency='D', profiler=None,
+                 checkpoint_dir=None, checkpoint_interval=1000,
+                 fixed_rate_lookback=1, fixed_rate_compounding=True):
+        """
+        Parameters:
+        portfolio_params - List of the keyword arguments of every portfolio besides rates,
+                           events and start_date_time, e.g. leverage and initial_capital,
+                           and optionally its portfolio_class (NaivePortfolio by default).
+        """
+        self.events_queue, self.dataHandler, self.strategy = _build_long_rate_strategy(
+            start_date_time, end_date_time, csv_dir, token_list, backtest_frequency,
+            fixed_rate_lookback, fixed_rate_compounding
         )
 
-        # one day needs to pass to enable fixed rate calculations which needs at least two historical rate values
-        self.dataHandler.update_rates()
+        self.portfolios = []
+        executionHandlers = []
+        for params in portfolio_params:
+            params = dict(params)
+            portfolio_class = params.pop('portfolio_class', NaivePortfolio)
 
-        self.eventLoop = EventLoop(
+            # orders and fills of every portfolio go through a queue of its own
+            events = DequeEventQueue()
+            self.portfolios.append(
+                portfolio_class(rates=self.dataHandler, events=events, start_date_time=start_date_time, **params)
+            )
+            executionHandlers.append(SimulatedExecutionHandler(events=events))
+
+        self.eventLoop = MultiPortfolioEventLoop(
             events=self.events_queue,
             rates=self.dataHandler,
             strategy=self.strategy,
-            portfolio=self.portfolio,
-            executionHandler=self.executionHandler
+            portfolios=self.portfolios,
+            executionHandlers=executionHandlers,
+            profiler=profiler,
+            checkpointer=Checkpointer(checkpoint_dir, checkpoint_interval) if checkpoint_dir else None
         )
 
     def run_backtest(self):
         self.eventLoop.run_outer_loop()
 
-        return self.eventLoop.portfolio
\ No newline at end of file
+        return self.portfolios
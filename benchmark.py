@@ -0,0 +1,559 @@
+import os
+import queue
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from backtest import LongRateStrategyBacktest, VectorisedLongRateStrategyBacktest, MultiPortfolioLongRateStrategyBacktest
+from data import DataHandler, HistoricCSVDataHandler, ArrayDataHandler, ScheduledDataHandler, ReplayDataHandler
+from event_loop import EventLoop, AsyncEventLoop
+from execution import SimulatedExecutionHandler
+from portfolio import NaivePortfolio
+from position_book import PositionBook
+from exposure import NetExposure
+from strategy import LongRateStrategy
+from journal import replay_journal
+from ledger import HoldingsLedger, PositionHistory
+from event import MarketEvent, SignalEvent, OrderEvent, FillEvent, DequeEventQueue, MARKET, SIGNAL, ORDER, FILL
+
+
+def _time_bars(dataHandler, token):
+    """
+    Pushes every bar through the data handler, reading the latest
+    rates the same way NaivePortfolio does on each bar, and returns
+    the number of bars and the elapsed wall time in seconds.
+    """
+    n_bars = 0
+    start = time.perf_counter()
+    while dataHandler.continue_backtest:
+        dataHandler.update_rates()
+        latest = dataHandler.get_latest_rates(token, N=1)
+        two_latest = dataHandler.get_latest_rates(token, N=2)
+        if len(two_latest) == 2:
+            latest[0][2] / two_latest[0][2]
+        dataHandler.events.get(False)
+        n_bars += 1
+    return n_bars, time.perf_counter() - start
+
+
+def benchmark_data_handlers(token='lido_stETH', backtest_frequency='H'):
+    """
+    Compares the bar throughput (bars/sec) of the iterrows based
+    HistoricCSVDataHandler against the array backed ArrayDataHandler.
+    """
+    results = []
+    for data_handler_class in (HistoricCSVDataHandler, ArrayDataHandler):
+        dataHandler = data_handler_class(
+            events=queue.Queue(),
+            csv_dir="datasets",
+            token_list=[token],
+            backtest_frequency=backtest_frequency
+        )
+        n_bars, elapsed = _time_bars(dataHandler, token)
+        results.append((data_handler_class.__name__, n_bars, elapsed, n_bars / elapsed))
+
+    print("Data handler throughput on %s.csv (backtest frequency %s):" % (token, backtest_frequency))
+    for name, n_bars, elapsed, bars_per_second in results:
+        print("%-24s %8d bars %8.3fs %12.0f bars/sec" % (name, n_bars, elapsed, bars_per_second))
+
+    return results
+
+
+def benchmark_parallel_ingestion(csv_dir="datasets", max_workers=None):
+    """
+    Compares the wall time of loading and preprocessing every CSV file
+    in csv_dir serially and in a process pool.
+    """
+    token_list = sorted(f[:-len('.csv')] for f in os.listdir(csv_dir) if f.endswith('.csv'))
+    max_workers = max_workers or max(os.cpu_count() or 1, 2)
+
+    results = []
+    for workers in (1, max_workers):
+        start = time.perf_counter()
+        HistoricCSVDataHandler(
+            events=queue.Queue(),
+            csv_dir=csv_dir,
+            token_list=token_list,
+            max_workers=workers
+        )
+        results.append((workers, time.perf_counter() - start))
+
+    print("Ingestion wall time of %d files in %s:" % (len(token_list), csv_dir))
+    for workers, elapsed in results:
+        print("%-24s %8.3fs" % ("serial" if workers == 1 else "%d processes" % workers, elapsed))
+
+    return results
+
+
+class _DictEvent(object):
+    """
+    Stand-in for the former event representation: a per-instance
+    __dict__ holding a string type.
+    """
+
+    def __init__(self, type, **kwargs):
+        self.type = type
+        self.__dict__.update(kwargs)
+
+
+def _events_per_second(make_event, events, dispatch, drain, n_events):
+    start = time.perf_counter()
+    for i in range(n_events):
+        events.put(make_event(i))
+        drain(events, dispatch)
+    return n_events / (time.perf_counter() - start)
+
+
+def _drain_queue(events, dispatch):
+    while True:
+        try:
+            event = events.get(False)
+        except queue.Empty:
+            break
+        dispatch(event)
+
+
+def _drain_deque(events, dispatch):
+    while events:
+        dispatch(events.popleft())
+
+
+def benchmark_event_queue(n_events=200000):
+    """
+    Compares the throughput (events/sec) of creating, queueing and dispatching
+    events in the EventLoop fashion, with __dict__ events on a queue.Queue drained
+    until queue.Empty versus slotted events on a DequeEventQueue.
+    """
+    types = ('MARKET', 'SIGNAL', 'ORDER', 'FILL')
+    fields = dict(token='aave_usdc', timestamp=None, direction='LONG', notional=1.0, margin=1.0, fee=0.0)
+
+    def make_dict_event(i):
+        return _DictEvent(types[i & 3], **fields)
+
+    slotted = (
+        lambda: MarketEvent(),
+        lambda: SignalEvent('aave_usdc', 'LONG', None),
+        lambda: OrderEvent('aave_usdc', 'LONG', None, 1.0, 1.0),
+        lambda: FillEvent('aave_usdc', 0.0, None, 1.0, 1.0, 'LONG')
+    )
+
+    def make_slotted_event(i):
+        return slotted[i & 3]()
+
+    counts = [0, 0, 0, 0]
+
+    def dispatch_type(event):
+        counts[types.index(event.type)] += 1
+
+    def dispatch_type_id(event):
+        type_id = event.type_id
+        if type_id == MARKET:
+            counts[0] += 1
+        elif type_id == SIGNAL:
+            counts[1] += 1
+        elif type_id == ORDER:
+            counts[2] += 1
+        elif type_id == FILL:
+            counts[3] += 1
+
+    results = [
+        ("dict events, Queue", sys.getsizeof(make_dict_event(3)) + sys.getsizeof(make_dict_event(3).__dict__),
+         _events_per_second(make_dict_event, queue.Queue(), dispatch_type, _drain_queue, n_events)),
+        ("slotted events, deque", sys.getsizeof(make_slotted_event(3)),
+         _events_per_second(make_slotted_event, DequeEventQueue(), dispatch_type_id, _drain_deque, n_events)),
+    ]
+
+    print("Event queue throughput over %d events:" % n_events)
+    for name, event_size, events_per_second in results:
+        print("%-24s %8d bytes/event %12.0f events/sec" % (name, event_size, events_per_second))
+
+    return results
+
+
+def benchmark_vectorised_backtest(token='compound_usdc', backtest_frequency='H',
+                                  start_date_time='2019-06-01 00:00:00', end_date_time='2022-06-01 00:00:00'):
+    """
+    Compares the wall time of LongRateStrategyBacktest (event loop) and
+    VectorisedLongRateStrategyBacktest over multi-year hourly rates, data
+    loading excluded, and checks that their equity curves are identical.
+    """
+    results = []
+    equity_curves = []
+    for backtest_class in (LongRateStrategyBacktest, VectorisedLongRateStrategyBacktest):
+        backtest = backtest_class(
+            start_date_time=start_date_time,
+            end_date_time=end_date_time,
+            token_list=[token],
+            backtest_frequency=backtest_frequency
+        )
+
+        start = time.perf_counter()
+        output = backtest.run_backtest()
+        if backtest_class is LongRateStrategyBacktest:
+            output.create_equity_curve_dataframe()
+            output = output.equity_curve
+        elapsed = time.perf_counter() - start
+
+        equity_curves.append(output)
+        results.append((backtest_class.__name__, len(output), elapsed))
+
+    print("Backtest wall time on %s.csv (backtest frequency %s), identical equity curves: %s" % (
+        token, backtest_frequency, equity_curves[0].equals(equity_curves[1])))
+    for name, n_bars, elapsed in results:
+        print("%-36s %8d bars %8.3fs %8.1fx" % (name, n_bars, elapsed, results[0][2] / elapsed))
+
+    return results
+
+
+def benchmark_journal_replay(token='compound_usdc', backtest_frequency='H',
+                             start_date_time='2019-06-01 00:00:00', end_date_time='2022-06-01 00:00:00'):
+    """
+    Compares the wall time of a full event loop run (data loading included), which
+    records an event journal, with the replay of that journal through a portfolio.
+    """
+    tmp_dir = tempfile.mkdtemp()
+    journal_path = os.path.join(tmp_dir, 'journal.bin')
+    try:
+        start = time.perf_counter()
+        portfolio = LongRateStrategyBacktest(
+            start_date_time=start_date_time,
+            end_date_time=end_date_time,
+            token_list=[token],
+            backtest_frequency=backtest_frequency,
+            journal_path=journal_path
+        ).run_backtest()
+        run_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        replayed = replay_journal(journal_path, start_date_time=start_date_time, leverage=1.0, initial_capital=1.0)
+        replay_time = time.perf_counter() - start
+
+        journal_size = os.path.getsize(journal_path)
+    finally:
+        os.remove(journal_path)
+        os.rmdir(tmp_dir)
+
+    portfolio.create_equity_curve_dataframe()
+    replayed.create_equity_curve_dataframe()
+
+    print("Journal replay on %s.csv (backtest frequency %s, %d bytes journal), identical equity curves: %s" % (
+        token, backtest_frequency, journal_size, replayed.equity_curve.equals(portfolio.equity_curve)))
+    print("%-24s %8.3fs" % ("full run", run_time))
+    print("%-24s %8.3fs %8.1fx" % ("replay", replay_time, run_time / replay_time))
+
+    return run_time, replay_time
+
+
+def benchmark_scheduled_feeds(daily_token='aave_usdc', block_token='lido_stETH_50_blocks', finest_frequency='15T',
+                              start_date_time='2022-03-01 00:00:00', end_date_time='2022-06-01 00:00:00'):
+    """
+    Compares the wall time of a LongRateStrategy event loop (data loading excluded) over
+    a daily token and a block level token, either both forward filled onto the finest_frequency
+    grid by HistoricCSVDataHandler, or each fed at its own frequency by ScheduledDataHandler,
+    where the block level token keeps all its raw observations. Flat regions are kept in
+    both runs, so that they process the same observations.
+    """
+    kwargs = dict(
+        csv_dir="datasets",
+        token_list=[daily_token, block_token],
+        start_date_time=start_date_time,
+        end_date_time=end_date_time
+    )
+    dataHandlers = [
+        HistoricCSVDataHandler(events=DequeEventQueue(), backtest_frequency=finest_frequency, **kwargs),
+        ScheduledDataHandler(events=DequeEventQueue(), backtest_frequencies={block_token: None}, **kwargs)
+    ]
+
+    results = []
+    for dataHandler in dataHandlers:
+        events = dataHandler.events
+        dataHandler.update_rates()
+        portfolio = NaivePortfolio(rates=dataHandler, events=events, start_date_time=start_date_time, leverage=1.0)
+        eventLoop = EventLoop(
+            events=events,
+            rates=dataHandler,
+            strategy=LongRateStrategy(rates=dataHandler, events=events),
+            portfolio=portfolio,
+            executionHandler=SimulatedExecutionHandler(events=events)
+        )
+
+        start = time.perf_counter()
+        eventLoop.run_outer_loop()
+        elapsed = time.perf_counter() - start
+
+        results.append((type(dataHandler).__name__, eventLoop.n_bars, elapsed))
+
+    print("Event loop wall time on %s.csv (daily) and %s.csv (block level):" % (daily_token, block_token))
+    for name, n_bars, elapsed in results:
+        print("%-24s %8d market events %8.3fs %8.1fx" % (name, n_bars, elapsed, results[0][2] / elapsed))
+
+    return results
+
+
+def benchmark_replay_capacity(token_list=('aave_usdc', 'lido_stETH_50_blocks'), speed=864000.0,
+                              start_date_time='2022-03-01 00:00:00', end_date_time='2022-03-11 00:00:00',
+                              n_consumers=(1, 4, 16, 64)):
+    """
+    Replays the raw rates of the tokens in accelerated real time (by default ten
+    days in one second) to a growing number of strategy and portfolio pairs
+    subscribed to the market events of one AsyncEventLoop, and reports the rates
+    dropped and late and the consumer lag, i.e. when the process falls behind.
+    """
+    results = []
+    for n in n_consumers:
+        dataHandler = ReplayDataHandler(
+            events=DequeEventQueue(), csv_dir="datasets", token_list=list(token_list), speed=speed,
+            start_date_time=start_date_time, end_date_time=end_date_time
+        )
+        eventLoop = AsyncEventLoop(events=dataHandler.events, rates=dataHandler)
+        for _ in range(n):
+            strategy = LongRateStrategy(rates=dataHandler, events=DequeEventQueue())
+            portfolio = NaivePortfolio(rates=dataHandler, events=DequeEventQueue(), start_date_time=None, leverage=1.0)
+            eventLoop.subscribe(MARKET, strategy.calculate_signals)
+            eventLoop.subscribe(MARKET, portfolio.update_timeindex)
+
+        eventLoop.run_outer_loop()
+
+        report = dataHandler.report()['total']
+        results.append((n, report['emitted'], report['dropped'], report['late'], report['lag']['p99']))
+
+    print("Replay of %s at %.0fx:" % (", ".join(token_list), speed))
+    for n, emitted, dropped, late, lag in results:
+        print("%4d consumers %8d emitted %8d dropped %8d late %10.2f ms p99 lag" % (n, emitted, dropped, late, lag * 1e3))
+
+    return results
+
+
+def benchmark_position_valuation(n_positions=(1, 10, 100, 1000), n_bars=1000):
+    """
+    Compares the wall time of valuing a growing number of positions of a token on
+    every bar, with the per position loop of NaivePortfolio.compute_total_value_of_positions,
+    with the vectorised PositionBook and with the running sums of NetExposure.
+    """
+    portfolio = NaivePortfolio.__new__(NaivePortfolio)
+    start = pd.Timestamp('2022-01-01 00:00:00')
+    rates = [('aave_usdc', start + pd.Timedelta(days=1 + i), 1e27 * (1.1 + 1e-4 * i)) for i in range(n_bars)]
+
+    results = []
+    for n in n_positions:
+        positions = [{
+            'timestamp': start + pd.Timedelta(hours=i), 'direction': 'LONG' if i % 2 else 'SHORT',
+            'notional': 1000.0, 'margin': 100.0, 'fixedRate': 0.05, 'startingRateValue': 1.1e27, 'fee': 0.0
+        } for i in range(n)]
+        book = PositionBook.from_positions(positions)
+        exposure = NetExposure.from_positions(positions)
+
+        start_time = time.perf_counter()
+        for rate in rates:
+            portfolio.compute_total_value_of_positions(positions, rate)
+        loop_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for rate in rates:
+            book.value(rate)
+        book_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for rate in rates:
+            exposure.value(rate)
+        exposure_time = time.perf_counter() - start_time
+
+        results.append((n, loop_time, book_time, exposure_time))
+
+    print("Valuation of the positions of a token over %d bars:" % n_bars)
+    for n, loop_time, book_time, exposure_time in results:
+        print("%6d positions %10.4fs loop %10.4fs position book %8.1fx %10.4fs netted %8.1fx" % (
+            n, loop_time, book_time, loop_time / book_time, exposure_time, loop_time / exposure_time))
+
+    return results
+
+
+def benchmark_holdings_ledger(token_list=('aave_usdc', 'compound_usdc'), n_bars=100000):
+    """
+    Compares the memory per bar and the equity curve DataFrame build time of the
+    holdings history kept as a list of dictionaries and as a HoldingsLedger.
+    """
+    columns = ['cash', 'fee', 'total']
+    for t in token_list:
+        columns += [t, f'fixedRate_{t}', f'liquidityIndex_{t}']
+
+    start = pd.Timestamp('2022-01-01 00:00:00')
+    datetimes = [start + pd.Timedelta(hours=i) for i in range(n_bars)]
+    rows = [[1.0, 0.0, 1.0 + 1e-6 * i] + [1e-6 * i, 0.05, 1.1 + 1e-9 * i] * len(token_list) for i in range(n_bars)]
+
+    start_time = time.perf_counter()
+    holdings = []
+    for datetime, values in zip(datetimes, rows):
+        d = dict(zip(columns, values))
+        d['datetime'] = datetime
+        holdings.append(d)
+    list_append_time = time.perf_counter() - start_time
+
+    list_bytes = sys.getsizeof(holdings) + sum(
+        sys.getsizeof(d) + sum(sys.getsizeof(v) for v in d.values()) for d in holdings
+    )
+
+    start_time = time.perf_counter()
+    curve = pd.DataFrame(holdings)
+    curve.set_index('datetime', inplace=True)
+    list_frame_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    ledger = HoldingsLedger(columns)
+    for datetime, values in zip(datetimes, rows):
+        ledger.append_values(datetime, values)
+    ledger_append_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    ledger.to_frame()
+    ledger_frame_time = time.perf_counter() - start_time
+
+    print("Holdings history of %d bars with %d columns:" % (n_bars, len(columns)))
+    print("list of dicts   %8.1f bytes/bar append %.3fs DataFrame %.4fs" % (
+        list_bytes / n_bars, list_append_time, list_frame_time))
+    print("holdings ledger %8.1f bytes/bar append %.3fs DataFrame %.4fs (%.1f bytes/bar allocated)" % (
+        ledger.nbytes / n_bars, ledger_append_time, ledger_frame_time, ledger.allocated_nbytes / n_bars))
+
+    return list_bytes, ledger.nbytes, list_frame_time, ledger_frame_time
+
+
+def benchmark_fixed_rates(token='lido_stETH', backtest_frequency='H', lookbacks=(1, 24)):
+    """
+    Compares the wall time of the fixed rate lookups of a backtest, annualising
+    the latest rates on every bar and reading the series precomputed at load.
+    """
+    results = []
+    for data_handler_class in (HistoricCSVDataHandler, ArrayDataHandler):
+        for lookback in lookbacks:
+            dataHandler = data_handler_class(
+                events=DequeEventQueue(), csv_dir="datasets", token_list=[token],
+                backtest_frequency=backtest_frequency, is_liquid_staking=True, fixed_rate_lookback=lookback
+            )
+
+            window_time, lookup_time, n_bars = 0.0, 0.0, 0
+            while dataHandler.continue_backtest:
+                dataHandler.update_rates()
+
+                start_time = time.perf_counter()
+                DataHandler.get_latest_fixed_rate(dataHandler, token)
+                window_time += time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                dataHandler.get_latest_fixed_rate(token)
+                lookup_time += time.perf_counter() - start_time
+                n_bars += 1
+
+            results.append((data_handler_class.__name__, lookback, n_bars, window_time, lookup_time))
+
+    print("Fixed rate lookups of %s at frequency %s:" % (token, backtest_frequency))
+    for name, lookback, n_bars, window_time, lookup_time in results:
+        print("%-24s lookback %3d %7d bars %8.4fs latest rates %8.4fs precomputed %6.1fx" % (
+            name, lookback, n_bars, window_time, lookup_time, window_time / lookup_time))
+
+    return results
+
+
+def benchmark_position_history(token_list=('aave_usdc', 'compound_usdc'), n_bars=100000, trade_interval=100):
+    """
+    Compares the memory of the position history kept as per bar rows of position
+    list copies and as a PositionHistory of deltas, with a trade every trade_interval
+    bars, and times the reconstruction of the positions as of random bars.
+    """
+    start = pd.Timestamp('2022-01-01 00:00:00')
+    current = dict((t, []) for t in token_list)
+    history = PositionHistory(token_list)
+
+    rows_bytes = 0
+    for bar in range(n_bars):
+        timestamp = start + pd.Timedelta(hours=bar)
+        history.mark_bar(timestamp)
+
+        # a row copying the position lists, as needed for a correct snapshot per bar
+        row = dict((t, list(current[t])) for t in token_list)
+        rows_bytes += sys.getsizeof(row) + sum(sys.getsizeof(positions) for positions in row.values())
+
+        if bar % trade_interval == 0:
+            t = token_list[(bar // trade_interval) % len(token_list)]
+            position = {'timestamp': timestamp, 'direction': 'LONG', 'notional': 1.0, 'margin': 1.0,
+                        'fixedRate': 0.05, 'startingRateValue': 1e27, 'fee': 0.0}
+            current[t].append(position)
+            history.open(t, timestamp, position)
+
+    bars = [(7919 * i) % n_bars for i in range(1000)]
+    start_time = time.perf_counter()
+    for bar in bars:
+        history.positions_at(bar)
+    reconstruction_time = time.perf_counter() - start_time
+
+    print("Position history of %d bars, %d tokens and %d trades:" % (n_bars, len(token_list), history.n_deltas))
+    print("per bar rows     %12d bytes" % rows_bytes)
+    print("position history %12d bytes, %.1fus per positions_at()" % (
+        history.nbytes, 1e6 * reconstruction_time / len(bars)))
+
+    return rows_bytes, history.nbytes, reconstruction_time
+
+
+def benchmark_multi_portfolio(n_portfolios=(1, 2, 4, 8, 16), backtest_frequency='H',
+                              start_date_time='2022-04-01 00:00:00', end_date_time='2022-06-01 00:00:00'):
+    """
+    Compares the throughput in portfolio-bars per second of running portfolios with
+    different leverages as separate LongRateStrategyBacktests and in a single
+    MultiPortfolioLongRateStrategyBacktest, data loading included.
+    """
+    kwargs = dict(start_date_time=start_date_time, end_date_time=end_date_time, backtest_frequency=backtest_frequency)
+
+    results = []
+    for n in n_portfolios:
+        portfolio_params = [{'leverage': 1.0 + i, 'initial_capital': 1.0} for i in range(n)]
+
+        start_time = time.perf_counter()
+        n_bars = 0
+        for params in portfolio_params:
+            portfolio = LongRateStrategyBacktest(**dict(kwargs, **params)).run_backtest()
+            n_bars += len(portfolio.all_holdings)
+        separate_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        portfolios = MultiPortfolioLongRateStrategyBacktest(portfolio_params, **kwargs).run_backtest()
+        multi_time = time.perf_counter() - start_time
+
+        assert n_bars == sum(len(portfolio.all_holdings) for portfolio in portfolios)
+        results.append((n, n_bars, separate_time, multi_time))
+
+    print("Portfolios over %s bars from %s to %s:" % (backtest_frequency, start_date_time, end_date_time))
+    for n, n_bars, separate_time, multi_time in results:
+        print("%3d portfolios %10.0f portfolio-bars/s separate %10.0f portfolio-bars/s single pass %6.1fx" % (
+            n, n_bars / separate_time, n_bars / multi_time, separate_time / multi_time))
+
+    return results
+
+
+BENCHMARKS = {
+    'data_handlers': benchmark_data_handlers,
+    'event_queue': benchmark_event_queue,
+    'fixed_rates': benchmark_fixed_rates,
+    'holdings_ledger': benchmark_holdings_ledger,
+    'journal_replay': benchmark_journal_replay,
+    'multi_portfolio': benchmark_multi_portfolio,
+    'parallel_ingestion': benchmark_parallel_ingestion,
+    'position_history': benchmark_position_history,
+    'position_valuation': benchmark_position_valuation,
+    'replay_capacity': benchmark_replay_capacity,
+    'scheduled_feeds': benchmark_scheduled_feeds,
+    'vectorised_backtest': benchmark_vectorised_backtest,
+}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+
+    parser.add_argument("-b", "--benchmark", type=str, choices=sorted(BENCHMARKS), action="append",
+                        help="Benchmark to run (repeatable), all benchmarks by default")
+
+    params = parser.parse_args()
+
+    for name in (params.benchmark or sorted(BENCHMARKS)):
+        BENCHMARKS[name]()
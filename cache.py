@@ -0,0 +1,239 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ingestion import ChunkedPreprocessingState, to_epoch_nanos, from_epoch_nanos
+
+# bump whenever the preprocessing pipeline changes in a way that alters its output
+CACHE_VERSION = 1
+
+
+class RateCache(object):
+    """
+    RateCache persists the fully preprocessed liquidity index series of a token
+    (i.e. after flat region removal, interpolation and resampling to the backtest
+    frequency) in a compact binary .npz file, so that data handlers built repeatedly
+    over the same CSV files can skip parsing and resampling altogether.
+
+    An entry is keyed by the CSV file content hash together with the preprocessing
+    parameters (interpolation frequency and method, backtest frequency and liquid staking flag),
+    hence editing or re-exporting a dataset invalidates its entry automatically.
+
+    Entries written together with a ChunkedPreprocessingState also record how much
+    of the file was consumed, so that when rows are merely appended to the file
+    (as with a daily download) refresh() only parses the new rows and recomputes
+    the trailing bars instead of preprocessing the whole file again.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Initialises the cache, creating the cache directory if needed.
+
+        Parameters:
+        cache_dir - Directory path where the cache entries are stored.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_digest(csv_path, block_size=1 << 20):
+        """
+        Returns the sha256 hex digest of the file contents.
+        """
+        h = hashlib.sha256()
+        with open(csv_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def prefix_digests(csv_path, prefix_size, block_size=1 << 20):
+        """
+        Returns the sha256 hex digests of the first prefix_size bytes of the file
+        (None if the file is shorter) and of the whole file, in a single pass.
+        """
+        h = hashlib.sha256()
+        prefix_digest = None
+        read = 0
+        with open(csv_path, 'rb') as f:
+            while True:
+                if prefix_digest is None and read == prefix_size:
+                    prefix_digest = h.hexdigest()
+                block = f.read(block_size if prefix_digest is not None else min(block_size, prefix_size - read))
+                if not block:
+                    break
+                h.update(block)
+                read += len(block)
+        return prefix_digest, h.hexdigest()
+
+    @staticmethod
+    def preprocessing_params(preprocessor):
+        """
+        Returns the parameters of a LiquidityIndexPreprocessor that key the cache entries.
+        """
+        return {
+            'interpolation_frequency': preprocessor.interpolation_frequency,
+            'backtest_frequency': preprocessor.backtest_frequency,
+            'is_liquid_staking': preprocessor.is_liquid_staking,
+            'interpolation_method': preprocessor.interpolation_method
+        }
+
+    def entry_path(self, csv_path, interpolation_frequency, backtest_frequency, is_liquid_staking,
+                   interpolation_method='resample'):
+        """
+        Returns the path of the cache entry for a given CSV file and set of
+        preprocessing parameters. The content digest is validated on load,
+        so a single entry is kept (and overwritten) per file and parameter set.
+        """
+        params = repr((
+            os.path.realpath(csv_path), interpolation_frequency, interpolation_method,
+            backtest_frequency, bool(is_liquid_staking), CACHE_VERSION
+        ))
+        params_digest = hashlib.sha256(params.encode('utf-8')).hexdigest()[:16]
+        token = os.path.splitext(os.path.basename(csv_path))[0]
+
+        return os.path.join(self.cache_dir, '%s-%s.npz' % (token, params_digest))
+
+    def load(self, csv_path, digest, interpolation_frequency, backtest_frequency, is_liquid_staking,
+             interpolation_method='resample'):
+        """
+        Returns the cached preprocessed DataFrame (indexed on date, with a single
+        liquidityIndex column) or None if there is no valid entry for the given
+        file content digest and parameters.
+        """
+        path = self.entry_path(csv_path, interpolation_frequency, backtest_frequency, is_liquid_staking,
+                               interpolation_method)
+
+        entry = self._read_entry(path)
+        if entry is None or entry['digest'] != digest:
+            return None
+
+        return entry['df']
+
+    def _read_entry(self, path):
+        """
+        Returns the contents of an entry, or None if it is missing or unreadable.
+        """
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {key: npz[key] for key in npz.files}
+            entry = {
+                'digest': str(arrays['digest']),
+                'tz': str(arrays['tz']),
+                'df': pd.DataFrame(
+                    {'liquidityIndex': arrays['liquidityIndex']},
+                    index=from_epoch_nanos(arrays['dates'], str(arrays['tz']))
+                )
+            }
+        except (OSError, KeyError, ValueError):
+            return None
+
+        if 'state_n_emitted' in arrays:
+            entry['state'] = {key[len('state_'):]: value for key, value in arrays.items() if key.startswith('state_')}
+
+        return entry
+
+    def save(self, csv_path, digest, df, interpolation_frequency, backtest_frequency, is_liquid_staking,
+             interpolation_method='resample', state=None):
+        """
+        Writes the preprocessed DataFrame to the cache, along with the
+        ChunkedPreprocessingState it was computed with if given. The entry is written
+        to a temporary file first and then moved into place, so concurrent readers never
+        observe a partially written entry.
+        """
+        path = self.entry_path(csv_path, interpolation_frequency, backtest_frequency, is_liquid_staking,
+                               interpolation_method)
+
+        tz = '' if df.index.tz is None else str(df.index.tz)
+
+        state_arrays = {}
+        if state is not None:
+            state_arrays = {'state_' + key: value for key, value in state.to_arrays().items()}
+            state_arrays['state_n_emitted'] = np.array(state.n_emitted, dtype='int64')
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    digest=np.array(digest),
+                    tz=np.array(tz),
+                    dates=to_epoch_nanos(df.index),
+                    liquidityIndex=df['liquidityIndex'].to_numpy(dtype='float64'),
+                    **state_arrays
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def extend(self, csv_path, preprocessor):
+        """
+        Folds the rows appended to the CSV file since its entry was written into the
+        saved preprocessing state and updates the entry, parsing only the new rows.
+        Returns the updated DataFrame and the number of leading bars left unchanged,
+        or None if the entry has no state or the file was modified otherwise than by
+        appending rows.
+        """
+        params = self.preprocessing_params(preprocessor)
+        entry = self._read_entry(self.entry_path(csv_path, **params))
+        if entry is None or 'state' not in entry:
+            return None
+
+        consumed_bytes = int(entry['state']['consumed_bytes'])
+        if os.path.getsize(csv_path) <= consumed_bytes:
+            return None
+
+        prefix_digest, digest = self.prefix_digests(csv_path, consumed_bytes)
+        if prefix_digest != entry['digest']:
+            return None
+
+        if not bool(entry['state']['ends_with_newline']):
+            # the last row read may have been cut short: only continue if it was complete after all
+            with open(csv_path, 'rb') as f:
+                f.seek(consumed_bytes)
+                if f.read(1) not in (b'\n', b'\r'):
+                    return None
+
+        n_emitted = int(entry['state']['n_emitted'])
+        state = ChunkedPreprocessingState.from_arrays(
+            preprocessor, entry['state'], entry['tz'], emitted=entry['df'].iloc[:n_emitted]
+        )
+
+        try:
+            preprocessor.feed_csv(state, csv_path, offset=consumed_bytes)
+        except ValueError:
+            # e.g. the appended rows go back in time
+            return None
+
+        df = state.finalize()
+        self.save(csv_path, digest, df, state=state, **params)
+
+        return df, n_emitted
+
+    def refresh(self, csv_path, preprocessor, recompute=True):
+        """
+        Returns the preprocessed DataFrame of a CSV file, together with the number of
+        leading bars unchanged since the entry was last written: from the entry as is
+        if the file did not change, by extending it if rows were appended to the file,
+        or else by preprocessing the whole file again (unless recompute is False, in
+        which case None is returned).
+        """
+        params = self.preprocessing_params(preprocessor)
+
+        digest = self.file_digest(csv_path)
+        df = self.load(csv_path, digest, **params)
+        if df is not None:
+            return df, len(df)
+
+        extended = self.extend(csv_path, preprocessor)
+        if extended is not None or not recompute:
+            return extended
+
+        df, state = preprocessor.preprocess_with_state(csv_path)
+        self.save(csv_path, digest, df, state=state, **params)
+
+        return df, 0
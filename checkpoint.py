@@ -0,0 +1,73 @@
+import os
+import pickle
+import tempfile
+
+
+class Checkpointer(object):
+    """
+    Checkpointer writes the state of an EventLoop (data handler position, strategy
+    and portfolio state, pending events) every given number of bars, so that a long
+    backtest can be resumed after a crash, or forked at a point in time, with
+    Backtest.resume(). Each checkpoint is a pickle file named after its bar, written
+    to a temporary file first and then moved into place.
+    """
+
+    def __init__(self, checkpoint_dir, interval=1000, keep=None):
+        """
+        Parameters:
+        checkpoint_dir - Directory path where the checkpoints are written, created if needed.
+        interval - Number of bars between two checkpoints.
+        keep - Number of most recent checkpoints kept, all of them by default.
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.interval = interval
+        self.keep = keep
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+
+    def checkpoint_path(self, bar):
+        return os.path.join(self.checkpoint_dir, 'checkpoint-%010d.pkl' % bar)
+
+    def checkpoints(self):
+        """
+        Returns the paths of the checkpoints, oldest first.
+        """
+        return [
+            os.path.join(self.checkpoint_dir, f) for f in sorted(os.listdir(self.checkpoint_dir))
+            if f.startswith('checkpoint-') and f.endswith('.pkl')
+        ]
+
+    def latest(self):
+        """
+        Returns the path of the most recent checkpoint, or None if there is none.
+        """
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def save(self, state):
+        """
+        Writes the state returned by EventLoop.get_state() and returns its path.
+        """
+        path = self.checkpoint_path(state['bar'])
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        if self.keep is not None:
+            for old_path in self.checkpoints()[:-self.keep]:
+                os.remove(old_path)
+
+        return path
+
+    @staticmethod
+    def load(path):
+        """
+        Returns the state saved in a checkpoint.
+        """
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -1,10 +1,20 @@
+import asyncio
+import heapq
 import os, os.path
+import time
+from array import array
 import pandas as pd
 import numpy as np
 
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 
-from event import MarketEvent
+from cache import RateCache
+from event import MarketEvent, DequeEventQueue
+from ingestion import LiquidityIndexPreprocessor
+from profiling import latency_stats
+from utils import annualize_variable_rate, fixed_rate_series
+from store import RateStore
 
 
 class DataHandler(object):
@@ -22,6 +32,11 @@ class DataHandler(object):
 
     __metaclass__ = ABCMeta
 
+    # the fixed rate of a token is annualised from its variable rate over the
+    # last fixed_rate_lookback bars, with or without compounding
+    fixed_rate_lookback = 1
+    fixed_rate_compounding = True
+
     @abstractmethod
     def get_latest_rates(self, token, N=1):
         """
@@ -30,6 +45,24 @@ class DataHandler(object):
         """
         raise NotImplementedError("Should implement get_latest_rates()")
 
+    def get_latest_fixed_rate(self, token):
+        """
+        Returns the fixed rate of the token at its latest rate, or None
+        until more than fixed_rate_lookback rates are available.
+
+        Handlers with the whole history at hand precompute the series
+        (see fixed_rate_series) and look it up instead.
+        """
+        rates = self.get_latest_rates(token=token, N=self.fixed_rate_lookback + 1)
+        if rates is None or len(rates) <= self.fixed_rate_lookback:
+            return None
+
+        return annualize_variable_rate(
+            variableRate=(rates[-1][2] / rates[0][2]) - 1.0,
+            timeDelta=rates[-1][1] - rates[0][1],
+            compounding=self.fixed_rate_compounding
+        )
+
     @abstractmethod
     def update_rates(self):
         """
@@ -49,7 +82,9 @@ class HistoricCSVDataHandler(DataHandler):
     """
 
     def __init__(self, events, csv_dir, token_list, start_date_time=None, end_date_time=None,
-                 interpolation_frequency='H', backtest_frequency='D', is_liquid_staking=False):
+                 interpolation_frequency='H', backtest_frequency='D', is_liquid_staking=False,
+                 cache_dir=None, chunksize=None, max_workers=1, interpolation_method='resample',
+                 fixed_rate_lookback=1, fixed_rate_compounding=True):
         """
         Initialises the historic data handler by requesting
         the location of the CSV files and a list of tokens.
@@ -61,11 +96,27 @@ class HistoricCSVDataHandler(DataHandler):
         events - The Event Queue.
         csv_dir - Absolute directory path to the CSV files.
         token_list - A list of token strings.
+        cache_dir - Optional directory for the on-disk cache of preprocessed
+                    rates (see RateCache), None disables caching.
+        chunksize - Optional number of CSV rows per chunk, streams the CSV files
+                    with bounded memory instead of loading them in one go.
+        max_workers - Number of processes used to preprocess the CSV files
+                      concurrently, 1 preprocesses them serially.
+        interpolation_method - 'resample' (default) interpolates on the interpolation_frequency
+                               grid before sampling the backtest_frequency grid, 'direct' and
+                               'equivalent' compute the backtest grid directly from the raw
+                               observations, see LiquidityIndexPreprocessor.
+        fixed_rate_lookback - Number of bars the fixed rates are annualised over.
+        fixed_rate_compounding - Whether the fixed rates are annualised with compounding.
         """
         self.events = events
         self.csv_dir = csv_dir
         self.token_list = token_list
 
+        self.fixed_rate_lookback = fixed_rate_lookback
+        self.fixed_rate_compounding = fixed_rate_compounding
+        self.fixed_rates = {}
+
         self.token_data = {}
         self.latest_token_data = {}
         self.continue_backtest = True
@@ -74,11 +125,22 @@ class HistoricCSVDataHandler(DataHandler):
         self.end_date_time = end_date_time
         self.interpolation_frequency = interpolation_frequency
         self.backtest_frequency = backtest_frequency
-
-        self._open_convert_csv_files(
-            is_liquid_staking=is_liquid_staking
+        self.interpolation_method = interpolation_method
+        self.is_liquid_staking = is_liquid_staking
+        self.max_workers = max_workers
+
+        self.preprocessor = LiquidityIndexPreprocessor(
+            interpolation_frequency=interpolation_frequency,
+            backtest_frequency=backtest_frequency,
+            is_liquid_staking=is_liquid_staking,
+            chunksize=chunksize,
+            interpolation_method=interpolation_method
         )
 
+        self.cache = RateCache(cache_dir) if cache_dir is not None else None
+
+        self._open_convert_csv_files()
+
     def update_rates(self):
         """
         Pushes the latest rate to the latest_symbol_data structure
@@ -106,6 +168,24 @@ class HistoricCSVDataHandler(DataHandler):
         else:
             return rates_list[-N:]
 
+    def get_latest_fixed_rate(self, token):
+        """
+        Returns the precomputed fixed rate of the token at its latest rate,
+        or None until more than fixed_rate_lookback rates are available.
+        """
+        n_rates = len(self.latest_token_data[token])
+        if n_rates <= self.fixed_rate_lookback:
+            return None
+        return self.fixed_rates[token][n_rates - 1]
+
+    def _fixed_rate_series(self, timestamps, liquidity_indices):
+        """
+        Returns the fixed rates of a liquidity index series, see fixed_rate_series.
+        """
+        return fixed_rate_series(
+            timestamps, liquidity_indices, lookback=self.fixed_rate_lookback, compounding=self.fixed_rate_compounding
+        ).tolist()
+
     def _get_new_rate(self, token):
         """
         Returns the latest rate (liquidityIndex) from the data feed as a tuple of
@@ -114,72 +194,70 @@ class HistoricCSVDataHandler(DataHandler):
         for b in self.token_data[token]:
             yield tuple([token, b[0], b[1]['liquidityIndex']])
 
-    def _interpolate_liquidity_index(self, df):
+    def _load_token_data(self, token):
+        """
+        Returns the preprocessed rates of a token, served from the on-disk
+        cache when a valid entry exists for the current file contents.
+        """
+        return self._load_tokens_data([token])[token]
 
-        # resample to follow consistent frequency
-        df = df.resample(self.interpolation_frequency).mean()
+    def _load_tokens_data(self, token_list, preprocessor=None):
+        """
+        Returns a dictionary of the preprocessed rates of the given tokens.
+        Valid cache entries are served first (extended with the rows appended
+        to their CSV files if any) and the remaining CSV files are preprocessed,
+        in a pool of max_workers processes if more than one.
 
-        # fill in the gaps by interpolating between adjacent known values of the liquidity index
-        df = df.interpolate(method='linear')
+        Parameters:
+        token_list - The tokens to load.
+        preprocessor - The LiquidityIndexPreprocessor applied, the one of the handler by default.
+        """
+        preprocessor = preprocessor or self.preprocessor
+        csv_paths = dict((t, os.path.join(self.csv_dir, '%s.csv' % t)) for t in token_list)
 
-        return df
+        tokens_data = {}
+        digests = {}
 
-    def _removeFlatRegions(self, df):
+        if self.cache is not None:
+            for t in token_list:
+                refreshed = self.cache.refresh(csv_paths[t], preprocessor, recompute=False)
+                if refreshed is not None:
+                    tokens_data[t] = refreshed[0]
+                else:
+                    digests[t] = self.cache.file_digest(csv_paths[t])
 
-        # remove observations that are equal to the previous timestep
-        df.loc[:, "isNotFlat"] = np.where(
-            df.loc[:, "liquidityIndex"] == df.loc[:, "liquidityIndex"].shift(1),
-            False,
-            True
-        )
+        missing = [t for t in token_list if t not in tokens_data]
 
-        df = df.loc[df.loc[:, "isNotFlat"], ["liquidityIndex"]]
-        return df
+        # cached preprocessing keeps the incremental state needed to extend the entries later on
+        preprocess = preprocessor.preprocess if self.cache is None else preprocessor.preprocess_with_state
 
-    def _adjust_liquidity_index_frequency(self, df):
+        if self.max_workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                results = list(executor.map(preprocess, [csv_paths[t] for t in missing]))
+        else:
+            results = [preprocess(csv_paths[t]) for t in missing]
 
-        df = df.resample(self.backtest_frequency).ffill()
-        df = df.dropna()
+        if self.cache is None:
+            tokens_data.update(zip(missing, results))
+        else:
+            params = self.cache.preprocessing_params(preprocessor)
+            for t, (df, state) in zip(missing, results):
+                self.cache.save(csv_paths[t], digests[t], df, state=state, **params)
+                tokens_data[t] = df
 
-        return df
+        return tokens_data
 
-    def _open_convert_csv_files(self, is_liquid_staking=False):
+    def _open_convert_csv_files(self):
         """
         Opens the CSV files from the data directory, converting
         them into pandas DataFrames within a token dictionary.
 .
         """
 
+        self.token_data = self._load_tokens_data(self.token_list)
+
         comb_index = None
         for t in self.token_list:
-            # Load the CSV file with no header information, indexed on date
-
-            self.token_data[t] = pd.io.parsers.read_csv(
-                                      os.path.join(self.csv_dir, '%s.csv' % t),
-                                      header=0, index_col=0,
-                                      names=['date', 'liquidityIndex'],
-                                      parse_dates=['date'],
-                                      dtype={
-                                          'liquidityIndex': "float64"
-                                      }
-                                  )
-
-            if is_liquid_staking:
-                self.token_data[t] = self._removeFlatRegions(
-                    df=self.token_data[t]
-                )
-
-            # interpolate the liquidity index
-            self.token_data[t] = self._interpolate_liquidity_index(
-                df=self.token_data[t]
-            )
-
-            # change dataset frequency to the one specified by the data handler
-            # todo: add frequency to the data handler init function
-            self.token_data[t] = self._adjust_liquidity_index_frequency(
-                df=self.token_data[t]
-            )
-
             # apply start and end datetime filters if they exist
 
             if (self.start_date_time and self.end_date_time):
@@ -198,11 +276,713 @@ class HistoricCSVDataHandler(DataHandler):
             if comb_index is None:
                 comb_index = self.token_data[t].index
             else:
-                comb_index.union(self.token_data[t].index)
+                comb_index = comb_index.union(self.token_data[t].index)
 
             # Set the latest symbol_data to None
             self.latest_token_data[t] = []
 
-        # Reindex the dataframes
+        self._align_token_data(comb_index=comb_index)
+
+    def _align_token_data(self, comb_index):
+        """
+        Reindexes the DataFrames of all tokens onto the combined index,
+        padding forward values, and converts them into the generators
+        of bars consumed by update_rates().
+        """
         for s in self.token_list:
-            self.token_data[s] = self.token_data[s].reindex(index=comb_index, method='pad').iterrows()
\ No newline at end of file
+            df = self.token_data[s].reindex(index=comb_index, method='pad')
+            self.fixed_rates[s] = self._fixed_rate_series(df.index.values, df['liquidityIndex'].values)
+            self.token_data[s] = df.iterrows()
+
+    def get_state(self):
+        """
+        Returns the position of the handler in the rates streams, for
+        checkpointing: the number of rates pushed per token.
+        """
+        return {
+            'n_rates': dict((t, len(self.latest_token_data[t])) for t in self.token_list),
+            'continue_backtest': self.continue_backtest
+        }
+
+    def set_state(self, state):
+        """
+        Restores a position returned by get_state(), pushing the rates
+        again from the (reopened if needed) CSV files.
+        """
+        n_rates = state['n_rates']
+        if any(len(self.latest_token_data[t]) > n_rates[t] for t in self.token_list):
+            self._open_convert_csv_files()
+
+        for t in self.token_list:
+            for _ in range(n_rates[t] - len(self.latest_token_data[t])):
+                self.latest_token_data[t].append(next(self._get_new_rate(t)))
+
+        self.continue_backtest = state['continue_backtest']
+
+
+class RateWindow(object):
+    """
+    RateWindow is a read-only window over the latest rates of a token,
+    backed by views of the arrays held by an ArrayDataHandler.
+
+    Indexing returns (token, datetime, liquidityIndex) tuples, so a window
+    is interchangeable with the list of rate tuples returned by
+    HistoricCSVDataHandler.get_latest_rates(). The underlying arrays are
+    exposed (without copying) as the timestamps and liquidity_indices attributes.
+    """
+
+    __slots__ = ('token', 'timestamps', 'liquidity_indices')
+
+    def __init__(self, token, timestamps, liquidity_indices):
+        """
+        Parameters:
+        token - The token string.
+        timestamps - datetime64[ns] array view of the window dates.
+        liquidity_indices - float64 array view of the window liquidity indices.
+        """
+        self.token = token
+        self.timestamps = timestamps
+        self.liquidity_indices = liquidity_indices
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RateWindow(self.token, self.timestamps[i], self.liquidity_indices[i])
+
+        return (self.token, pd.Timestamp(self.timestamps[i]), self.liquidity_indices[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, RateWindow)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "RateWindow(%r)" % list(self)
+
+
+class ArrayDataHandler(HistoricCSVDataHandler):
+    """
+    ArrayDataHandler preprocesses the CSV files exactly like
+    HistoricCSVDataHandler, but aligns all tokens once into a single
+    rates panel: a shared array of timestamps and a 2D (token x time)
+    array of liquidity indices, with each token row contiguous in memory.
+
+    Advancing a bar moves one integer cursor for all tokens at once and
+    get_latest_rates() returns a RateWindow over array views, so the cost
+    of a bar does not depend on the history length. It is a drop-in
+    replacement for HistoricCSVDataHandler wherever only update_rates()
+    and get_latest_rates() are used.
+    """
+
+    GAP_POLICIES = ('ffill', 'intersect', 'none')
+
+    def __init__(self, events, csv_dir, token_list, gap_policy='ffill', **kwargs):
+        """
+        Initialises the array data handler, see HistoricCSVDataHandler
+        for the remaining keyword arguments.
+
+        Parameters:
+        gap_policy - How tokens are aligned on the union of their dates:
+                     'ffill' forward fills gaps and drops the leading bars
+                     until every token has a rate, 'intersect' keeps only
+                     the dates observed by every token and 'none' keeps
+                     all dates, leaving gaps as NaN.
+        """
+        if gap_policy not in self.GAP_POLICIES:
+            raise ValueError("gap_policy must be one of %s" % (self.GAP_POLICIES,))
+
+        self.gap_policy = gap_policy
+
+        super(ArrayDataHandler, self).__init__(events, csv_dir, token_list, **kwargs)
+
+    def _align_token_data(self, comb_index):
+        """
+        Builds the rates panel on the union of the token dates,
+        applying the gap policy.
+        """
+        panel = pd.concat(
+            [self.token_data[t]['liquidityIndex'] for t in self.token_list],
+            axis=1, keys=self.token_list
+        ).sort_index()
+
+        if self.gap_policy == 'ffill':
+            panel = panel.ffill().dropna()
+        elif self.gap_policy == 'intersect':
+            panel = panel.dropna()
+
+        self.token_index = dict((t, j) for j, t in enumerate(self.token_list))
+        self.timestamps = np.ascontiguousarray(panel.index.values, dtype='datetime64[ns]')
+        self.liquidity_indices = np.ascontiguousarray(panel.values.T, dtype='float64')
+        self.fixed_rates = self._fixed_rate_panel()
+
+        # number of bars pushed so far, the latest bar is at cursor - 1
+        self.cursor = 0
+        self.n_bars = len(self.timestamps)
+
+    def _fixed_rate_panel(self):
+        """
+        Returns the (token x time) array of the fixed rates of the rates panel.
+        """
+        return np.array([
+            fixed_rate_series(
+                self.timestamps, row, lookback=self.fixed_rate_lookback, compounding=self.fixed_rate_compounding
+            ) for row in self.liquidity_indices
+        ]).reshape(len(self.token_list), -1)
+
+    def get_state(self):
+        """
+        Returns the position of the handler in the rates panel, for checkpointing.
+        """
+        return {'cursor': self.cursor, 'continue_backtest': self.continue_backtest}
+
+    def set_state(self, state):
+        """
+        Restores a position returned by get_state().
+        """
+        self.cursor = state['cursor']
+        self.continue_backtest = state['continue_backtest']
+
+    def update_rates(self):
+        """
+        Advances the cursor by one bar for all tokens in the token list.
+        """
+        if self.cursor < self.n_bars:
+            self.cursor += 1
+        else:
+            self.continue_backtest = False
+        self.events.put(MarketEvent())
+
+    def get_latest_rates(self, token, N=1):
+        """
+        Returns a RateWindow over the last N rates,
+        or N-k if less available.
+        """
+        try:
+            j = self.token_index[token]
+        except KeyError:
+            print("That token is not available in the historical data set.")
+        else:
+            start = max(self.cursor - N, 0)
+            return RateWindow(
+                token,
+                self.timestamps[start:self.cursor],
+                self.liquidity_indices[j][start:self.cursor]
+            )
+
+    def get_latest_fixed_rate(self, token):
+        """
+        Returns the precomputed fixed rate of the token at the latest bar,
+        or None until more than fixed_rate_lookback bars are available.
+        """
+        if self.cursor <= self.fixed_rate_lookback:
+            return None
+        return float(self.fixed_rates[self.token_index[token], self.cursor - 1])
+
+    def get_latest_rates_panel(self, N=1):
+        """
+        Returns views of the last N timestamps and the matching
+        (token x N) block of liquidity indices, or N-k if less available.
+        Rows follow the order of the token list.
+        """
+        start = max(self.cursor - N, 0)
+        return self.timestamps[start:self.cursor], self.liquidity_indices[:, start:self.cursor]
+
+
+class MemoryMappedDataHandler(ArrayDataHandler):
+    """
+    MemoryMappedDataHandler serves the rates of a RateStore instead of
+    parsing CSV files, so it opens instantly whatever the dataset size.
+
+    The start and end datetimes are located by binary search and the
+    rates are handed out as zero-copy slices of the read-only memory maps,
+    so concurrent backtests over the same store share the OS page cache.
+    Tokens whose windows have different dates are aligned like in
+    ArrayDataHandler, which requires a (private) copy of the aligned panel.
+    """
+
+    def __init__(self, events, store_dir, token_list, start_date_time=None, end_date_time=None,
+                 gap_policy='ffill', fixed_rate_lookback=1, fixed_rate_compounding=True):
+        """
+        Initialises the memory mapped data handler.
+
+        Parameters:
+        events - The Event Queue.
+        store_dir - Directory path of the RateStore.
+        token_list - A list of token strings.
+        start_date_time - Optional start of the backtest window (inclusive).
+        end_date_time - Optional end of the backtest window (inclusive).
+        gap_policy - Alignment policy when token dates differ, see ArrayDataHandler.
+        fixed_rate_lookback - Number of bars the fixed rates are annualised over.
+        fixed_rate_compounding - Whether the fixed rates are annualised with compounding.
+        """
+        if gap_policy not in self.GAP_POLICIES:
+            raise ValueError("gap_policy must be one of %s" % (self.GAP_POLICIES,))
+
+        self.events = events
+        self.store = RateStore(store_dir)
+        self.token_list = token_list
+
+        self.fixed_rate_lookback = fixed_rate_lookback
+        self.fixed_rate_compounding = fixed_rate_compounding
+
+        self.token_data = {}
+        self.continue_backtest = True
+
+        self.start_date_time = start_date_time
+        self.end_date_time = end_date_time
+        self.gap_policy = gap_policy
+
+        self._open_store()
+
+    def _open_store(self):
+        """
+        Maps the rates of every token within the backtest window.
+        """
+        # same convention as HistoricCSVDataHandler, the window applies when both ends are given
+        if self.start_date_time and self.end_date_time:
+            bounds = (self.start_date_time, self.end_date_time)
+        else:
+            bounds = (None, None)
+
+        windows = [self.store.open_window(t, *bounds) for t in self.token_list]
+
+        if all(np.array_equal(windows[0][0], w[0]) for w in windows[1:]):
+            # shared dates, the panel rows are the memory mapped windows themselves
+            self.token_index = dict((t, j) for j, t in enumerate(self.token_list))
+            self.timestamps = windows[0][0].view('datetime64[ns]')
+            if len(windows) == 1:
+                self.liquidity_indices = windows[0][1][np.newaxis, :]
+            else:
+                self.liquidity_indices = [w[1] for w in windows]
+            self.fixed_rates = self._fixed_rate_panel()
+
+            self.cursor = 0
+            self.n_bars = len(self.timestamps)
+        else:
+            for t, (timestamps, liquidity_indices) in zip(self.token_list, windows):
+                self.token_data[t] = pd.DataFrame(
+                    {'liquidityIndex': liquidity_indices},
+                    index=pd.DatetimeIndex(timestamps.view('datetime64[ns]'), name='date')
+                )
+            self._align_token_data(comb_index=None)
+
+    def get_latest_rates_panel(self, N=1):
+        """
+        Returns the last N timestamps and the matching (token x N) block of
+        liquidity indices, or N-k if less available. The block is a view
+        unless the panel rows are separate memory maps.
+        """
+        if isinstance(self.liquidity_indices, np.ndarray):
+            return super(MemoryMappedDataHandler, self).get_latest_rates_panel(N=N)
+
+        start = max(self.cursor - N, 0)
+        return (
+            self.timestamps[start:self.cursor],
+            np.array([row[start:self.cursor] for row in self.liquidity_indices])
+        )
+
+
+class ScheduledDataHandler(HistoricCSVDataHandler):
+    """
+    ScheduledDataHandler feeds every token at its own frequency, e.g. block
+    level stETH observations alongside daily Aave and Compound rates, rather
+    than forward filling all tokens onto a common grid.
+
+    The per-token series are k-way merged by timestamp through a heap holding
+    the next observation of every token: update_rates() advances the clock to the
+    earliest pending observation, pushes the rates of the tokens observed at that
+    time only and puts a MarketEvent carrying these tokens and the timestamp. The
+    cost of a backtest hence scales with the number of observations rather than
+    with the number of tokens times the bars of the finest grid. Tokens without
+    any observation yet have no latest rates.
+    """
+
+    def __init__(self, events, csv_dir, token_list, backtest_frequencies=None, liquid_staking_tokens=(), **kwargs):
+        """
+        Initialises the scheduled data handler, see HistoricCSVDataHandler
+        for the remaining keyword arguments. Its backtest_frequency and
+        is_liquid_staking apply to the tokens not listed below.
+
+        Parameters:
+        backtest_frequencies - Dictionary of the backtest frequency of some tokens,
+                               None feeding the raw observations of a token as they are.
+        liquid_staking_tokens - Tokens whose flat regions are removed.
+        """
+        self.backtest_frequencies = dict(backtest_frequencies or {})
+        self.liquid_staking_tokens = set(liquid_staking_tokens)
+
+        super(ScheduledDataHandler, self).__init__(events, csv_dir, token_list, **kwargs)
+
+    def _read_raw_feed(self, token, is_liquid_staking):
+        """
+        Returns the raw observations of a token sorted by date,
+        keeping the last one of duplicated dates.
+        """
+        df = self.preprocessor.read_csv(os.path.join(self.csv_dir, '%s.csv' % token))
+        df = df.sort_index(kind='mergesort')
+        df = df[~df.index.duplicated(keep='last')]
+
+        if is_liquid_staking:
+            df = self.preprocessor.remove_flat_regions(df=df)
+
+        return df
+
+    def _load_tokens_data(self, token_list, preprocessor=None):
+        """
+        Loads the tokens grouped by backtest frequency, each group being
+        preprocessed (and cached) with its own LiquidityIndexPreprocessor.
+        """
+        if preprocessor is not None:
+            return super(ScheduledDataHandler, self)._load_tokens_data(token_list, preprocessor)
+
+        groups = {}
+        for t in token_list:
+            key = (
+                self.backtest_frequencies.get(t, self.backtest_frequency),
+                self.is_liquid_staking or t in self.liquid_staking_tokens
+            )
+            groups.setdefault(key, []).append(t)
+
+        tokens_data = {}
+        for (backtest_frequency, is_liquid_staking), tokens in groups.items():
+            if backtest_frequency is None:
+                for t in tokens:
+                    tokens_data[t] = self._read_raw_feed(t, is_liquid_staking)
+                continue
+
+            preprocessor = LiquidityIndexPreprocessor(
+                interpolation_frequency=self.interpolation_frequency,
+                backtest_frequency=backtest_frequency,
+                is_liquid_staking=is_liquid_staking,
+                chunksize=self.preprocessor.chunksize,
+                interpolation_method=self.interpolation_method
+            )
+            tokens_data.update(super(ScheduledDataHandler, self)._load_tokens_data(tokens, preprocessor))
+
+        return tokens_data
+
+    def _align_token_data(self, comb_index):
+        """
+        Converts the series of every token into arrays of its own dates
+        and liquidity indices, without any alignment, and schedules
+        the first observation of every token.
+        """
+        self.timestamps = {}
+        self.liquidity_indices = {}
+        self.cursors = {}
+
+        # epoch nanoseconds as Python ints, compared by the heap
+        self._nanos = {}
+
+        for t in self.token_list:
+            self.timestamps[t] = np.ascontiguousarray(self.token_data[t].index.values, dtype='datetime64[ns]')
+            self.liquidity_indices[t] = np.ascontiguousarray(self.token_data[t]['liquidityIndex'].values, dtype='float64')
+            self.fixed_rates[t] = self._fixed_rate_series(self.timestamps[t], self.liquidity_indices[t])
+            self._nanos[t] = self.timestamps[t].view('int64').tolist()
+            self.cursors[t] = 0
+
+        self._schedule_next_rates()
+
+    def _schedule_next_rates(self):
+        """
+        Rebuilds the heap of the next (timestamp, token order, token)
+        observations from the cursors.
+        """
+        self.schedule = [
+            (self._nanos[t][self.cursors[t]], j, t)
+            for j, t in enumerate(self.token_list) if self.cursors[t] < len(self._nanos[t])
+        ]
+        heapq.heapify(self.schedule)
+
+    def get_state(self):
+        """
+        Returns the position of the handler in every feed, for checkpointing.
+        """
+        return {'cursors': dict(self.cursors), 'continue_backtest': self.continue_backtest}
+
+    def set_state(self, state):
+        """
+        Restores a position returned by get_state().
+        """
+        self.cursors = dict(state['cursors'])
+        self.continue_backtest = state['continue_backtest']
+        self._schedule_next_rates()
+
+    def update_rates(self):
+        """
+        Pushes the next rates of the tokens observed at the earliest
+        pending timestamp, in the order of the token list.
+        """
+        schedule = self.schedule
+        if not schedule:
+            self.continue_backtest = False
+            return
+
+        nanos = schedule[0][0]
+        tokens = []
+        while schedule and schedule[0][0] == nanos:
+            _, j, t = schedule[0]
+            cursor = self.cursors[t] + 1
+            self.cursors[t] = cursor
+            if cursor < len(self._nanos[t]):
+                heapq.heapreplace(schedule, (self._nanos[t][cursor], j, t))
+            else:
+                heapq.heappop(schedule)
+            tokens.append(t)
+
+        if not schedule:
+            self.continue_backtest = False
+
+        self.events.put(MarketEvent(tokens=tuple(tokens), timestamp=pd.Timestamp(nanos)))
+
+    def get_latest_rates(self, token, N=1):
+        """
+        Returns a RateWindow over the last N rates of the token,
+        or N-k if less available.
+        """
+        try:
+            cursor = self.cursors[token]
+        except KeyError:
+            print("That token is not available in the historical data set.")
+        else:
+            start = max(cursor - N, 0)
+            return RateWindow(token, self.timestamps[token][start:cursor], self.liquidity_indices[token][start:cursor])
+
+    def get_latest_fixed_rate(self, token):
+        """
+        Returns the precomputed fixed rate of the token at its latest rate,
+        or None until more than fixed_rate_lookback rates are available.
+        """
+        cursor = self.cursors[token]
+        if cursor <= self.fixed_rate_lookback:
+            return None
+        return self.fixed_rates[token][cursor - 1]
+
+
+class AsyncDataHandler(DataHandler):
+    """
+    AsyncDataHandler is an abstract base class for the data handlers whose
+    rates arrive asynchronously, one feed per token, e.g. live oracles or
+    paper trading feeds. Rather than being advanced by update_rates(), it is
+    driven by an AsyncEventLoop awaiting all its feeds concurrently, which
+    pushes every rate as it arrives and handles the events it triggers.
+
+    The MarketEvents it puts list the updated token and the time of the rate,
+    as the ones of ScheduledDataHandler, so strategies and portfolios treat a
+    live feed and a merged historic one identically.
+    """
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self, events, token_list):
+        """
+        Parameters:
+        events - The Event Queue.
+        token_list - A list of token strings.
+        """
+        self.events = events
+        self.token_list = token_list
+
+        self.latest_token_data = dict((t, []) for t in token_list)
+        self.continue_backtest = True
+
+    @abstractmethod
+    def stream_rates(self, token):
+        """
+        Returns an asynchronous iterator over the rates of a token, as
+        (token, datetime, liquidityIndex) tuples, in their order of arrival.
+        """
+        raise NotImplementedError("Should implement stream_rates()")
+
+    def push_rate(self, rate):
+        """
+        Pushes a rate received from a feed to the latest_token_data
+        structure and puts a MarketEvent for its token.
+        """
+        self.latest_token_data[rate[0]].append(rate)
+        self.events.put(MarketEvent(tokens=(rate[0],), timestamp=rate[1]))
+
+    def get_latest_rates(self, token, N=1):
+        """
+        Returns the last N rates from the latest_token list,
+        or N-k if less available.
+        """
+        try:
+            rates_list = self.latest_token_data[token]
+        except KeyError:
+            print("That token is not available in the data feeds.")
+        else:
+            return rates_list[-N:]
+
+    def update_rates(self):
+        raise NotImplementedError("Asynchronous data handlers are driven by an AsyncEventLoop")
+
+
+class SimulatedFeedDataHandler(AsyncDataHandler):
+    """
+    SimulatedFeedDataHandler is an in-process stand-in for live rate feeds:
+    every token streams given rates, waiting a fixed interval before each
+    of them, so that the AsyncEventLoop can be exercised without any network.
+    """
+
+    def __init__(self, events, token_data, intervals=0.0):
+        """
+        Parameters:
+        events - The Event Queue.
+        token_data - Dictionary of the rates streamed per token, as DataFrames
+                     indexed on date with a liquidityIndex column (e.g. preprocessed rates).
+        intervals - Seconds waited before every rate, a number for all the tokens
+                    or a dictionary per token.
+        """
+        super(SimulatedFeedDataHandler, self).__init__(events, list(token_data))
+
+        self.token_data = token_data
+        self.intervals = intervals if isinstance(intervals, dict) else dict((t, intervals) for t in token_data)
+
+    async def stream_rates(self, token):
+        interval = self.intervals.get(token, 0.0)
+        df = self.token_data[token]
+        for timestamp, liquidity_index in zip(df.index, df['liquidityIndex'].values):
+            await asyncio.sleep(interval)
+            yield (token, timestamp, liquidity_index)
+
+
+class ReplayDataHandler(AsyncDataHandler):
+    """
+    ReplayDataHandler behaves like live oracle feeds, but replays the observations
+    of the dataset CSV files in (scaled) real time: a rate observed t seconds after
+    the first observation of all the tokens is emitted t / speed seconds after the
+    replay starts, e.g. speed=100 replays a day in under 15 minutes, and speed=None
+    emits the rates as fast as they are consumed.
+
+    Every token is emitted by its own producer into a bounded asyncio.Queue read by
+    stream_rates(). As with a live feed, the producers do not wait for the consumer:
+    a rate arriving while the queue of its token is full is dropped, and a rate
+    emitted later than late_tolerance after its due time is counted as late (the
+    process did not get back to the producer in time). The consumer lag, from the
+    due time of a rate to its consumption, is recorded for every rate. These
+    figures tell how much strategy and portfolio work one process keeps up with.
+    """
+
+    def __init__(self, events, csv_dir, token_list, speed=1.0, max_queue_size=1000, late_tolerance=0.01,
+                 backtest_frequencies=None, **kwargs):
+        """
+        Initialises the replay data handler, the rates being loaded by a
+        ScheduledDataHandler, see its keyword arguments (e.g. start_date_time,
+        end_date_time or liquid_staking_tokens).
+
+        Parameters:
+        events - The Event Queue.
+        csv_dir - Absolute directory path to the CSV files.
+        token_list - A list of token strings.
+        speed - Replay speed factor, None replays as fast as possible (without dropping rates).
+        max_queue_size - Number of rates per token waiting for the consumer before new ones are dropped.
+        late_tolerance - Delay in seconds after which an emitted rate is counted as late.
+        backtest_frequencies - Backtest frequency per token, the raw observations of every token by default.
+        """
+        super(ReplayDataHandler, self).__init__(events, token_list)
+
+        if backtest_frequencies is None:
+            backtest_frequencies = dict((t, None) for t in token_list)
+
+        feeds = ScheduledDataHandler(
+            DequeEventQueue(), csv_dir, token_list, backtest_frequencies=backtest_frequencies, **kwargs
+        )
+        self.timestamps = feeds.timestamps
+        self.liquidity_indices = feeds.liquidity_indices
+
+        self.speed = speed
+        self.max_queue_size = max_queue_size
+        self.late_tolerance = late_tolerance
+
+        first = [self.timestamps[t][0] for t in token_list if len(self.timestamps[t]) > 0]
+        self.origin = min(first).astype('int64') if first else 0
+        self.start_time = None
+
+        self.n_emitted = dict((t, 0) for t in token_list)
+        self.n_dropped = dict((t, 0) for t in token_list)
+        self.n_late = dict((t, 0) for t in token_list)
+        self.lags = dict((t, array('d')) for t in token_list)
+
+    async def _produce(self, token, rates_queue):
+
+        clock = time.perf_counter
+        nanos = self.timestamps[token].view('int64')
+
+        for i in range(len(nanos)):
+            rate = (token, pd.Timestamp(self.timestamps[token][i]), self.liquidity_indices[token][i])
+
+            if self.speed is None:
+                await rates_queue.put((rate, clock()))
+                self.n_emitted[token] += 1
+                continue
+
+            due = self.start_time + (nanos[i] - self.origin) / 1e9 / self.speed
+            delay = due - clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > self.late_tolerance:
+                self.n_late[token] += 1
+
+            try:
+                rates_queue.put_nowait((rate, due))
+            except asyncio.QueueFull:
+                self.n_dropped[token] += 1
+            else:
+                self.n_emitted[token] += 1
+
+        await rates_queue.put(None)
+
+    async def stream_rates(self, token):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+
+        rates_queue = asyncio.Queue(maxsize=self.max_queue_size)
+        producer = asyncio.ensure_future(self._produce(token, rates_queue))
+
+        lags = self.lags[token]
+        clock = time.perf_counter
+        try:
+            while True:
+                item = await rates_queue.get()
+                if item is None:
+                    break
+                rate, due = item
+                lags.append(clock() - due)
+                yield rate
+        finally:
+            producer.cancel()
+
+    def report(self):
+        """
+        Returns the replay figures per token and in total: rates emitted,
+        dropped and late, and the consumer lag statistics in seconds.
+        """
+        report = {}
+        for t in self.token_list:
+            report[t] = {
+                'emitted': self.n_emitted[t],
+                'dropped': self.n_dropped[t],
+                'late': self.n_late[t],
+                'lag': latency_stats(self.lags[t]) if len(self.lags[t]) > 0 else None
+            }
+
+        lags = array('d')
+        for t in self.token_list:
+            lags.extend(self.lags[t])
+        report['total'] = {
+            'emitted': sum(self.n_emitted.values()),
+            'dropped': sum(self.n_dropped.values()),
+            'late': sum(self.n_late.values()),
+            'lag': latency_stats(lags) if len(lags) > 0 else None
+        }
+
+        return report
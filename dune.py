@@ -1,5 +1,12 @@
 from duneanalytics import DuneAnalytics # ref: https://github.com/itzmestar/duneanalytics
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import requests
 import pandas as pd
+import numpy as np
+import tempfile
+import json
+import time
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -7,11 +14,27 @@ load_dotenv()
 
 class Dune:
 
-    def __init__(self, username, password):
+    def __init__(self, username=None, password=None, client=None, cache_dir=None):
+        """
+        Parameters:
+        username - Dune Analytics username.
+        password - Dune Analytics password.
+        client - Already authenticated client exposing query_result_id_v2 and query_result
+                 (a DuneAnalytics client logging in with username and password by default).
+        cache_dir - Directory path where query results are cached, keyed by query id
+                    and result id. Results are not cached by default.
+        """
 
-        self.dune = DuneAnalytics(username, password)
-        self.dune.login()
-        self.dune.fetch_auth_token()
+        if client is None:
+            client = DuneAnalytics(username, password)
+            client.login()
+            client.fetch_auth_token()
+
+        self.dune = client
+        self.cache_dir = cache_dir
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
 
     def query_result(self, query_id):
         # fetch query result id using query id
@@ -20,33 +43,116 @@ class Dune:
         # https://duneanalytics.com/queries/4494/8769 => 4494
         # https://duneanalytics.com/queries/3705/7192 => 3705
         # https://duneanalytics.com/queries/3751/7276 => 3751
-        result_id = self.dune.query_result_id_v2(query_id=query_id)
-        data = self.dune.query_result(result_id)
-        return data
+        query_result_id = getattr(self.dune, 'query_result_id_v2', None) or self.dune.query_result_id
+        result_id = query_result_id(query_id=query_id)
 
-    def query_euler_interest_rates(self, coin='usdc'):
+        # a result id identifies one execution of the query, so its payload never changes
+        cache_path = None
+        if self.cache_dir is not None and result_id is not None:
+            cache_path = os.path.join(self.cache_dir, '%s-%s.json' % (query_id, result_id))
+            if os.path.exists(cache_path):
+                with open(cache_path) as f:
+                    return json.load(f)
 
-        # coin universe for euler: weth, dai, usdc, wbtc, usdt
-
-        raw_data = self.query_result(query_id=695308)['data']['get_result_by_result_id']
+        data = self.dune.query_result(result_id)
 
-        df = pd.DataFrame(columns=['date', 'apy'])
+        if cache_path is not None and data and 'errors' not in data:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, cache_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
 
-        for i in range(len(raw_data)):
+        return data
 
-            symbol = raw_data[i]['data']['symbol']
+    @staticmethod
+    def result_to_frame(raw_data, columns, where=None):
+        """
+        Converts the rows of a get_result_by_result_id payload into a DataFrame
+        in a single pass, column by column.
+
+        Parameters:
+        raw_data - List of {'data': {...}} rows of the query result.
+        columns - Dictionary mapping the result columns to the DataFrame columns.
+        where - Optional predicate on the row data selecting the rows to keep.
+        """
+        rows = [row['data'] for row in raw_data]
+        if where is not None:
+            rows = [row for row in rows if where(row)]
+
+        return pd.DataFrame(
+            dict((name, [row[column] for row in rows]) for column, name in columns.items()),
+            columns=list(columns.values())
+        )
+
+    @staticmethod
+    def last_date(csv_path, block_size=4096):
+        """
+        Returns the date of the last row of a dataset CSV file, reading only
+        the end of the file, or None if the file is missing or has no rows.
+        """
+        if not os.path.exists(csv_path):
+            return None
+
+        with open(csv_path, 'rb') as f:
+            end = f.seek(0, os.SEEK_END)
+            tail = b''
+            while end > 0 and tail.strip().count(b'\n') < 1:
+                start = max(end - block_size, 0)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                end = start
+
+        lines = tail.strip().splitlines()
+        if len(lines) < 2 and end == 0:
+            # header only
+            return None
+
+        return pd.Timestamp(lines[-1].split(b',')[0].decode('utf-8'))
+
+    def sync_csv(self, df, csv_path):
+        """
+        Appends to a dataset CSV file the rows of df dated after its last row,
+        sorted by date, writing the whole DataFrame if the file does not exist yet.
+        Returns the number of rows written.
+        """
+        last_date = self.last_date(csv_path)
+        if last_date is None:
+            df.to_csv(csv_path, index=False)
+            return len(df)
+
+        dates = pd.to_datetime(df['date'], utc=True)
+        if last_date.tz is None:
+            last_date = last_date.tz_localize('UTC')
+
+        is_newer = (dates > last_date).values
+        newer = df[is_newer].iloc[np.argsort(dates.values[is_newer], kind='mergesort')]
+        if len(newer) == 0:
+            return 0
+
+        with open(csv_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) not in (b'\n', b'\r'):
+                f.write(b'\n')
+
+        newer.to_csv(csv_path, mode='a', header=False, index=False)
+
+        return len(newer)
 
-            if symbol == coin.upper():
-                date = raw_data[i]['data']['date_trunc']
-                apy = raw_data[i]['data'][coin]
+    def query_euler_interest_rates(self, coin='usdc'):
 
-                df = df.append({
-                    'date': date,
-                    'apy': apy,
-                }, ignore_index=True)
+        # coin universe for euler: weth, dai, usdc, wbtc, usdt
 
-        return df
+        raw_data = self.query_result(query_id=695308)['data']['get_result_by_result_id']
 
+        return self.result_to_frame(
+            raw_data,
+            columns={'date_trunc': 'date', coin: 'apy'},
+            where=lambda row: row['symbol'] == coin.upper()
+        )
 
     def query_aave_liquidity_index(self, query_id=891837, column_name="liquidityIndexUSDC"):
 
@@ -58,26 +164,78 @@ class Dune:
 
         raw_data = self.query_result(query_id=query_id)['data']['get_result_by_result_id']
 
-        df = pd.DataFrame(columns=['date', 'liquidityIndex'])
-
-        for i in range(len(raw_data)):
-
-            date = raw_data[i]['data']['date']
-            liquidityIndex = raw_data[i]['data'][column_name]
-
-            df = df.append({
-                'date': date,
-                'liquidityIndex': liquidityIndex,
-            }, ignore_index=True)
-
-        return df
-
+        return self.result_to_frame(raw_data, columns={'date': 'date', column_name: 'liquidityIndex'})
+
+    def fetch_aave_liquidity_indices(self, jobs, max_workers=4, retries=3, backoff=1.0):
+        """
+        Fetches the liquidity indices of many Aave pools concurrently over the
+        authenticated session of the client, and writes each of them to its CSV file
+        atomically (i.e. a dataset is either fully refreshed or left untouched).
+        Returns the dictionary of the number of rows written per CSV file.
+
+        Parameters:
+        jobs - List of (query_id, column_name, csv_path) tuples,
+               e.g. (891837, "liquidityIndexUSDC", "datasets/aave_usdc.csv").
+        max_workers - Maximum number of queries in flight, which is also the
+                      size of the connection pool of the session.
+        retries - Number of times a failed query is retried.
+        backoff - Delay in seconds before the first retry, doubled on every retry.
+        """
+        session = getattr(self.dune, 'session', None)
+        if session is not None:
+            # one keep-alive connection per worker, shared by all the queries
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+
+        def fetch(job):
+            query_id, column_name, csv_path = job
+            for attempt in range(retries + 1):
+                try:
+                    df = self.query_aave_liquidity_index(query_id=query_id, column_name=column_name)
+                    break
+                except (KeyError, TypeError, requests.RequestException):
+                    # failed requests come back as empty (or error) payloads from the client
+                    if attempt == retries:
+                        raise
+                    time.sleep(backoff * 2 ** attempt)
+
+            csv_dir = os.path.dirname(os.path.abspath(csv_path))
+            fd, tmp_path = tempfile.mkstemp(dir=csv_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', newline='') as f:
+                    df.to_csv(f, index=False)
+                os.replace(tmp_path, csv_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+            return csv_path, len(df)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(executor.map(fetch, jobs))
+
+    def sync_aave_liquidity_index(self, token='usdc', query_id=891837, column_name="liquidityIndexUSDC",
+                                  csv_dir="datasets"):
+        """
+        Appends the latest liquidity indices of an Aave pool to datasets/aave_<token>.csv
+        and returns the number of new rows.
+        """
+        df = self.query_aave_liquidity_index(query_id=query_id, column_name=column_name)
+        return self.sync_csv(df, os.path.join(csv_dir, 'aave_%s.csv' % token))
+
+    def sync_euler_interest_rates(self, coin='usdc', csv_dir="datasets"):
+        """
+        Appends the latest interest rates of an Euler pool to datasets/euler_<coin>.csv
+        and returns the number of new rows.
+        """
+        df = self.query_euler_interest_rates(coin=coin)
+        return self.sync_csv(df, os.path.join(csv_dir, 'euler_%s.csv' % coin))
 
 
 if __name__ == '__main__':
     # dune = Dune(username=os.environ.get('USERNAME'), password=os.environ.get("PASSWORD"))
     dune = Dune(username=os.environ.get('USERNAME'), password=os.environ.get("PASSWORD"))
     # df = dune.query_euler_interest_rates(coin='usdc')
-    aave_liquidity_index_df = dune.query_aave_liquidity_index(query_id=905965, column_name="liquidityIndexDAI")
-    aave_liquidity_index_df.to_csv("datasets/aave_dai.csv", index=False)
+    dune.sync_aave_liquidity_index(token='dai', query_id=905965, column_name="liquidityIndexDAI")
 
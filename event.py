@@ -1,24 +1,75 @@
+from collections import deque
+import queue
+
+# integer type tags of the events, cheaper to compare than their string type
+MARKET, SIGNAL, ORDER, FILL = range(4)
+EVENT_TYPES = ('MARKET', 'SIGNAL', 'ORDER', 'FILL')
+
 
 class Event(object):
     """
     Event is base class providing an interface for all subsequent
     (inherited) events, that will trigger further events in the
     trading infrastructure.
+
+    Events declare their attributes in __slots__, so they carry no per-instance
+    __dict__, and expose both a string type and an integer type_id as class attributes.
+    """
+
+    __slots__ = ()
+
+
+class DequeEventQueue(deque):
     """
-    pass
+    Drop-in replacement of queue.Queue for single-threaded backtests, backed
+    by a deque without any locking. The EventLoop drains it with popleft()
+    rather than catching queue.Empty on every bar.
+    """
+
+    put = deque.append
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns the next event, raising queue.Empty if there is none
+        (nothing else can put events while a single thread is waiting for one).
+        """
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty
+
+    def qsize(self):
+        return len(self)
+
+    def empty(self):
+        return not self
 
 
 class MarketEvent(Event):
     """
     Handles the event of receiving a new market update with
     corresponding rates data.
+
+    Data handlers advancing all tokens in lockstep leave tokens and timestamp
+    to None, scheduled data handlers set them to the tokens that updated and
+    the time of the update.
     """
 
-    def __init__(self):
+    __slots__ = ('tokens', 'timestamp')
+
+    type = 'MARKET'
+    type_id = MARKET
+
+    def __init__(self, tokens=None, timestamp=None):
         """
         Initialises the MarketEvent.
+
+        Parameters:
+        tokens - The tokens with a new rate, None if all tokens updated.
+        timestamp - The time of the update, None if not known by the data handler.
         """
-        self.type = 'MARKET'
+        self.tokens = tokens
+        self.timestamp = timestamp
 
 
 
@@ -29,6 +80,11 @@ class SignalEvent(Event):
     This is received by a Portfolio object and acted upon.
     """
 
+    __slots__ = ('token', 'timestamp', 'direction')
+
+    type = 'SIGNAL'
+    type_id = SIGNAL
+
     def __init__(self, token, direction, timestamp):
         """
         Initialises the SignalEvent.
@@ -39,7 +95,6 @@ class SignalEvent(Event):
         direction - 'LONG' or 'SHORT'.
         """
 
-        self.type = 'SIGNAL'
         self.token = token
         self.timestamp = timestamp
         self.direction = direction
@@ -54,6 +109,11 @@ class OrderEvent(Event):
     IRS Swap notional and a direction.
     """
 
+    __slots__ = ('token', 'timestamp', 'direction', 'notional', 'margin')
+
+    type = 'ORDER'
+    type_id = ORDER
+
     def __init__(self, token, direction, timestamp, notional, margin):
         """
         Initialises the order event which has
@@ -71,7 +131,6 @@ class OrderEvent(Event):
         margin   - Non-negative integer for margin amount (i.e. collateral to support the IRS position)
         """
 
-        self.type = 'ORDER'
         self.token = token
         self.timestamp = timestamp
         self.direction = direction
@@ -98,6 +157,11 @@ class FillEvent(Event):
     In addition, stores the fees of the trade collected by liquidity providers.
     """
 
+    __slots__ = ('token', 'timestamp', 'direction', 'notional', 'margin', 'fee')
+
+    type = 'FILL'
+    type_id = FILL
+
     def __init__(self, token, fee, timestamp, notional, margin, direction):
         """
         Initialises the FillEvent object. Sets the token, slippage,
@@ -112,7 +176,6 @@ class FillEvent(Event):
         fee      - fee paid by the trader to the liquidity providers in the IRS Pool
         """
 
-        self.type = 'FILL'
         self.token = token
         self.timestamp = timestamp
         self.direction = direction
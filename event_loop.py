@@ -1,11 +1,15 @@
+import asyncio
 import queue
 
+from event import MARKET, SIGNAL, ORDER, FILL, EVENT_TYPES, DequeEventQueue
+
 
 class EventLoop(object):
 
     # todo: add docs
 
-    def __init__(self, events, rates, strategy, portfolio, executionHandler):
+    def __init__(self, events, rates, strategy=None, portfolio=None, executionHandler=None, profiler=None,
+                 journal=None, checkpointer=None):
 
         self.events = events
         self.rates = rates
@@ -13,37 +17,274 @@ class EventLoop(object):
         self.portfolio = portfolio
         self.executionHandler = executionHandler
 
+        # optional EventLoopProfiler, instrumenting the loop only when set
+        self.profiler = profiler
+
+        # optional Checkpointer, saving the state every checkpointer.interval bars
+        self.checkpointer = checkpointer
+        self.n_bars = 0
+
+        # dispatch table: the handlers subscribed to each event type, indexed by type_id
+        self.handlers = [[] for _ in EVENT_TYPES]
+
+        if strategy is not None:
+            self.subscribe(MARKET, strategy.calculate_signals)
+        if portfolio is not None:
+            self.subscribe(MARKET, portfolio.update_timeindex)
+            self.subscribe(SIGNAL, portfolio.update_signal)
+            self.subscribe(FILL, portfolio.update_fill)
+        if executionHandler is not None:
+            self.subscribe(ORDER, executionHandler.execute_order)
+
+        # optional EventJournal, recording every event before it is handled
+        self.journal = journal
+        if journal is not None:
+            for handlers in self.handlers:
+                handlers.insert(0, journal.record)
+
+    @staticmethod
+    def _type_id(event_type):
+        return EVENT_TYPES.index(event_type) if isinstance(event_type, str) else event_type
+
+    def subscribe(self, event_type, handler):
+        """
+        Registers a handler called with every event of the given type, after the
+        handlers already subscribed to it. Several strategies, portfolios, risk checks
+        or recorders can hence consume the same events in a single pass.
+
+        Parameters:
+        event_type - Event type_id (e.g. event.MARKET) or string type (e.g. 'MARKET').
+        handler - Callable taking the event as its only argument.
+        """
+        self.handlers[self._type_id(event_type)].append(handler)
+
+    def unsubscribe(self, event_type, handler):
+        """
+        Removes a handler previously subscribed to the given event type.
+        """
+        self.handlers[self._type_id(event_type)].remove(handler)
+
+    def _pending_events(self):
+        if isinstance(self.events, DequeEventQueue):
+            return list(self.events)
+
+        pending = []
+        while True:
+            try:
+                pending.append(self.events.get(False))
+            except queue.Empty:
+                break
+        for event in pending:
+            self.events.put(event)
+        return pending
+
+    def get_state(self):
+        """
+        Returns the state of the run, for checkpointing: the number of bars run,
+        the states of the data handler, strategy and portfolio, and the events
+        still pending in the queue.
+        """
+        return {
+            'bar': self.n_bars,
+            'rates': self.rates.get_state(),
+            'strategy': None if self.strategy is None else self.strategy.get_state(),
+            'portfolio': None if self.portfolio is None else self.portfolio.get_state(),
+            'events': self._pending_events()
+        }
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state(), replacing the pending events.
+        """
+        self.n_bars = state['bar']
+        self.rates.set_state(state['rates'])
+        if self.strategy is not None:
+            self.strategy.set_state(state['strategy'])
+        if self.portfolio is not None:
+            self.portfolio.set_state(state['portfolio'])
+
+        self._restore_events(state['events'])
+
+    def _restore_events(self, events):
+        while not self.events.empty():
+            self.events.get(False)
+        for event in events:
+            self.events.put(event)
+
     def run_outer_loop(self):
 
+        update_rates = self.rates.update_rates
+        handlers = self.handlers
+
+        if self.profiler is not None:
+            update_rates, handlers = self.profiler.start(self)
+
         while True:
             # Update the rates (specific backtest code, as opposed to live trading)
             if self.rates.continue_backtest:
-                self.rates.update_rates()
+                update_rates()
             else:
                 break
 
-            self.run_inner_loop()
+            self.run_inner_loop(handlers)
+
+            self.n_bars += 1
+            if self.checkpointer is not None and self.n_bars % self.checkpointer.interval == 0:
+                self.checkpointer.save(self.get_state())
 
-    def run_inner_loop(self):
+        if self.profiler is not None:
+            self.profiler.stop(self)
+
+        if self.journal is not None:
+            self.journal.flush()
+
+    def run_inner_loop(self, handlers=None):
 
         # Handle the events
 
+        if handlers is None:
+            handlers = self.handlers
+
+        if isinstance(self.events, DequeEventQueue):
+            # single-threaded queue: drain it without locks or exceptions
+            events = self.events
+            while events:
+                self.handle_event(events.popleft(), handlers)
+            return
+
         while True:
             try:
                 event = self.events.get(False)
             except queue.Empty:
                 break
 
-            if event is not None:
-                if event.type == 'MARKET':
-                    self.strategy.calculate_signals(event=event)
-                    self.portfolio.update_timeindex(event=event)
+            self.handle_event(event, handlers)
+
+    def handle_event(self, event, handlers=None):
+
+        if event is not None:
+            for handler in (self.handlers if handlers is None else handlers)[event.type_id]:
+                handler(event)
+
+
+class AsyncEventLoop(EventLoop):
+    """
+    AsyncEventLoop drives the components of an EventLoop from an AsyncDataHandler:
+    the rate feeds of all tokens are awaited concurrently and every rate is handled
+    as soon as it arrives, running the inner loop over the events it triggers
+    before awaiting the next rate, which is how a live or paper trading system runs.
+    """
+
+    def __init__(self, events, rates, strategy=None, portfolio=None, executionHandler=None, journal=None,
+                 latency_tracker=None):
+        """
+        Parameters:
+        latency_tracker - Optional LatencyTracker measuring the tick-to-signal and
+                          signal-to-order latencies, see EventLoop for the others.
+        """
+        super(AsyncEventLoop, self).__init__(
+            events, rates, strategy=strategy, portfolio=portfolio, executionHandler=executionHandler, journal=journal
+        )
+
+        self.latency_tracker = latency_tracker
+        if latency_tracker is not None:
+            latency_tracker.attach(self)
+
+    async def _consume(self, token):
+
+        record_tick = None if self.latency_tracker is None else self.latency_tracker.record_tick
+
+        async for rate in self.rates.stream_rates(token):
+            if record_tick is not None:
+                record_tick(token)
+            self.rates.push_rate(rate)
+            self.run_inner_loop()
+            self.n_bars += 1
+
+    async def run(self):
+        """
+        Handles the rates of all the feeds until every one of them is exhausted.
+        """
+        await asyncio.gather(*[self._consume(t) for t in self.rates.token_list])
+        self.rates.continue_backtest = False
+
+        if self.journal is not None:
+            self.journal.flush()
+
+    def run_outer_loop(self):
+
+        asyncio.run(self.run())
+
+
+class MultiPortfolioEventLoop(EventLoop):
+    """
+    MultiPortfolioEventLoop runs several portfolios, e.g. with different leverages,
+    initial capitals or sizing rules, over a single pass of a DataHandler and a single
+    strategy: every bar is advanced and its signals generated once, then handed to
+    all the portfolios.
+
+    Each portfolio trades through its own event queue and execution handler, whose
+    ORDER and FILL events are handled once the shared MARKET and SIGNAL events of
+    the bar are, so every portfolio ends up exactly as in an EventLoop of its own.
+    """
+
+    def __init__(self, events, rates, strategy, portfolios, executionHandlers, profiler=None, checkpointer=None):
+        """
+        Parameters:
+        events - The Event Queue shared by the DataHandler and the Strategy.
+        rates - The DataHandler object.
+        strategy - The Strategy object.
+        portfolios - The Portfolio objects, each built with an event queue of its own.
+        executionHandlers - The ExecutionHandler objects of the portfolios, putting
+                            their fills into the event queue of their portfolio.
+        profiler - Optional EventLoopProfiler, see EventLoop.
+        checkpointer - Optional Checkpointer, see EventLoop.
+        """
+        if len(portfolios) != len(executionHandlers):
+            raise ValueError("Every portfolio needs an execution handler")
+        if any(portfolio.events is events for portfolio in portfolios):
+            raise ValueError("Every portfolio needs an event queue of its own")
+
+        super(MultiPortfolioEventLoop, self).__init__(
+            events, rates, strategy=strategy, profiler=profiler, checkpointer=checkpointer
+        )
+
+        self.portfolios = list(portfolios)
+
+        # the loops handling the orders and fills of every portfolio
+        self.portfolio_loops = []
+        for portfolio, executionHandler in zip(self.portfolios, executionHandlers):
+            self.subscribe(MARKET, portfolio.update_timeindex)
+            self.subscribe(SIGNAL, portfolio.update_signal)
+
+            portfolio_loop = EventLoop(events=portfolio.events, rates=rates, executionHandler=executionHandler)
+            portfolio_loop.subscribe(FILL, portfolio.update_fill)
+            self.portfolio_loops.append(portfolio_loop)
+
+    def get_state(self):
+        """
+        Returns the state of the run (see EventLoop.get_state), with the state
+        and the pending events of every portfolio.
+        """
+        state = super(MultiPortfolioEventLoop, self).get_state()
+        state['portfolios'] = [portfolio.get_state() for portfolio in self.portfolios]
+        state['portfolio_events'] = [portfolio_loop._pending_events() for portfolio_loop in self.portfolio_loops]
+        return state
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state().
+        """
+        super(MultiPortfolioEventLoop, self).set_state(state)
+
+        for portfolio, portfolio_state in zip(self.portfolios, state['portfolios']):
+            portfolio.set_state(portfolio_state)
+        for portfolio_loop, events in zip(self.portfolio_loops, state['portfolio_events']):
+            portfolio_loop._restore_events(events)
 
-                elif event.type == 'SIGNAL':
-                    self.portfolio.update_signal(event=event)
+    def run_inner_loop(self, handlers=None):
 
-                elif event.type == 'ORDER':
-                    self.executionHandler.execute_order(event=event)
+        super(MultiPortfolioEventLoop, self).run_inner_loop(handlers)
 
-                elif event.type == 'FILL':
-                    self.portfolio.update_fill(event=event)
\ No newline at end of file
+        for portfolio_loop in self.portfolio_loops:
+            portfolio_loop.run_inner_loop()
@@ -0,0 +1,112 @@
+import pandas as pd
+
+from strategy import SECONDS_IN_YEAR
+
+DIRECTIONS = ('LONG', 'SHORT')
+
+
+class NetExposure(object):
+    """
+    NetExposure folds the IRS positions of a token into running sums per
+    direction, so that valuing them at a bar takes constant time whatever
+    the number of trades.
+
+    The value of a position is linear in its notional, in the liquidity index
+    over its starting liquidity index and in its fixed rate times the time
+    elapsed since it started. Summing over the positions of a direction gives
+
+    sign * (index * sum(notional / startingRate) - sum(notional)
+            - years * sum(notional * fixedRate) + sum(notional * fixedRate * startYears)) + sum(margin)
+
+    where years are counted from the start of the first position, which keeps the
+    two time terms small. The value matches the per position loop up to floating
+    point rounding (not bit for bit, as the sums are taken in another order).
+
+    It has the interface of PositionBook: positions are appended as the
+    dictionaries of NaivePortfolio.current_positions, which remain the per
+    trade audit log.
+    """
+
+    def __init__(self):
+
+        self.n_positions = 0
+
+        # epoch nanoseconds the position start times are counted from
+        self.reference = None
+
+        self.notional = dict((d, 0.0) for d in DIRECTIONS)
+        self.margin = dict((d, 0.0) for d in DIRECTIONS)
+        self.notional_over_starting_rate = dict((d, 0.0) for d in DIRECTIONS)
+        self.notional_fixed_rate = dict((d, 0.0) for d in DIRECTIONS)
+        self.notional_fixed_rate_start = dict((d, 0.0) for d in DIRECTIONS)
+
+    def __len__(self):
+        return self.n_positions
+
+    def _years(self, nanos):
+        # Timedelta.total_seconds() has a microsecond resolution
+        return (nanos - self.reference) // 1000 / 1e6 / SECONDS_IN_YEAR
+
+    def append(self, position):
+        """
+        Folds a position dictionary, as stored in NaivePortfolio.current_positions,
+        into the sums of its direction.
+        """
+        start = pd.Timestamp(position['timestamp']).value
+        if self.reference is None:
+            self.reference = start
+
+        d = "SHORT" if position['direction'] == "SHORT" else "LONG"
+        notional = position['notional']
+        notional_fixed_rate = notional * position['fixedRate']
+
+        self.notional[d] += notional
+        self.margin[d] += position['margin']
+        self.notional_over_starting_rate[d] += notional / position['startingRateValue']
+        self.notional_fixed_rate[d] += notional_fixed_rate
+        self.notional_fixed_rate_start[d] += notional_fixed_rate * self._years(start)
+        self.n_positions += 1
+
+    @classmethod
+    def from_positions(cls, positions):
+        """
+        Returns the exposure of a list of position dictionaries.
+        """
+        exposure = cls()
+        for position in positions:
+            exposure.append(position)
+        return exposure
+
+    def value(self, currentRateTuple):
+        """
+        Returns the total value (margins and IRS cashflows from initiation)
+        of the positions at a (token, datetime, liquidityIndex) rate tuple.
+        """
+        if self.n_positions == 0:
+            return 0
+
+        years = self._years(pd.Timestamp(currentRateTuple[1]).value)
+        rate = currentRateTuple[2]
+
+        total = 0.0
+        for d, sign in (("LONG", 1.0), ("SHORT", -1.0)):
+            variable = rate * self.notional_over_starting_rate[d] - self.notional[d]
+            fixed = years * self.notional_fixed_rate[d] - self.notional_fixed_rate_start[d]
+            total += sign * (variable - fixed) + self.margin[d]
+        return total
+
+    def exposure(self):
+        """
+        Returns the aggregated exposure per direction (notional, margin and
+        notional weighted fixed rate) and the net notional, long minus short.
+        """
+        summary = {}
+        for d in DIRECTIONS:
+            notional = self.notional[d]
+            summary[d] = {
+                'notional': notional,
+                'margin': self.margin[d],
+                'fixedRate': self.notional_fixed_rate[d] / notional if notional else None
+            }
+        summary['net_notional'] = self.notional["LONG"] - self.notional["SHORT"]
+        return summary
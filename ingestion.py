@@ -0,0 +1,465 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries.offsets import Tick
+
+
+def to_epoch_nanos(index):
+    """
+    Returns the int64 epoch nanoseconds (UTC for tz-aware dates) of a DatetimeIndex.
+    """
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.values.astype('datetime64[ns]').view('int64')
+
+
+def from_epoch_nanos(nanos, tz='', name='date'):
+    """
+    Inverse of to_epoch_nanos, tz being the time zone name ('' for naive dates).
+    """
+    index = pd.DatetimeIndex(np.asarray(nanos, dtype='int64'), name=name)
+    if tz:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    return index
+
+
+class LiquidityIndexPreprocessor(object):
+    """
+    LiquidityIndexPreprocessor converts the raw (irregular, on-chain)
+    liquidity index observations of a token into a series sampled at
+    the backtest frequency:
+
+    1) for liquid staking tokens, observations equal to the previous
+       one are removed (flat regions),
+    2) observations are averaged into interpolation_frequency buckets
+       and the empty buckets are linearly interpolated,
+    3) the interpolated series is forward filled onto the backtest_frequency grid.
+
+    Steps 2) and 3) materialise the whole interpolation grid. With
+    interpolation_method='direct', the liquidity index is instead linearly
+    interpolated in time from the raw observations directly at the backtest
+    timestamps. interpolation_method='equivalent' also skips the intermediate
+    grid, but reproduces the numbers of the default 'resample' method exactly
+    (bucket means computed only for non-empty buckets, interpolated between
+    bucket positions and sampled at the backtest timestamps), which is meant for
+    regression tests against results produced with the default method.
+    Both direct methods require fixed frequencies (e.g. 'H', '15T', 'D').
+
+    The file can either be processed in memory in one go, or streamed in chunks
+    of chunksize rows, in which case peak memory is bounded by the chunk size
+    (plus the rows of a single interpolation bucket) rather than by the file
+    size. Both paths produce identical output, the chunked path additionally
+    requires the observations to be sorted by date.
+    """
+
+    INTERPOLATION_METHODS = ('resample', 'direct', 'equivalent')
+
+    def __init__(self, interpolation_frequency='H', backtest_frequency='D',
+                 is_liquid_staking=False, chunksize=None, interpolation_method='resample'):
+        """
+        Parameters:
+        interpolation_frequency - Frequency of the intermediate interpolation grid.
+        backtest_frequency - Frequency of the output series.
+        is_liquid_staking - Whether flat regions should be removed.
+        chunksize - Number of CSV rows per chunk, None processes the file in memory.
+        interpolation_method - 'resample', 'direct' or 'equivalent', see above.
+        """
+        if interpolation_method not in self.INTERPOLATION_METHODS:
+            raise ValueError("interpolation_method must be one of %s" % (self.INTERPOLATION_METHODS,))
+        if chunksize is not None and interpolation_method != 'resample':
+            raise ValueError("Chunked preprocessing only supports the 'resample' interpolation method")
+
+        self.interpolation_frequency = interpolation_frequency
+        self.backtest_frequency = backtest_frequency
+        self.is_liquid_staking = is_liquid_staking
+        self.chunksize = chunksize
+        self.interpolation_method = interpolation_method
+
+    def read_csv(self, csv_path, chunksize=None, header=0):
+        """
+        Loads the CSV file (a path or a file object), indexed on date, ignoring
+        the header row if any. Returns an iterator of DataFrames if chunksize is given.
+        """
+        return pd.io.parsers.read_csv(
+            csv_path,
+            header=header, index_col=0,
+            names=['date', 'liquidityIndex'],
+            parse_dates=['date'],
+            dtype={
+                'liquidityIndex': "float64"
+            },
+            chunksize=chunksize
+        )
+
+    def remove_flat_regions(self, df, previous_value=np.nan):
+        """
+        Removes the observations that are equal to the previous
+        observation (previous_value for the first row).
+        """
+        previous = df.loc[:, "liquidityIndex"].shift(1)
+        if len(previous) > 0:
+            previous.iloc[0] = previous_value
+
+        df.loc[:, "isNotFlat"] = np.where(
+            df.loc[:, "liquidityIndex"] == previous,
+            False,
+            True
+        )
+
+        df = df.loc[df.loc[:, "isNotFlat"], ["liquidityIndex"]]
+        return df
+
+    def interpolate_liquidity_index(self, df):
+
+        # resample to follow consistent frequency
+        df = df.resample(self.interpolation_frequency).mean()
+
+        # fill in the gaps by interpolating between adjacent known values of the liquidity index
+        df = df.interpolate(method='linear')
+
+        return df
+
+    def adjust_liquidity_index_frequency(self, df):
+
+        df = df.resample(self.backtest_frequency).ffill()
+        df = df.dropna()
+
+        return df
+
+    def _fixed_frequency_nanos(self, frequency):
+
+        offset = to_offset(frequency)
+        if not isinstance(offset, Tick):
+            raise ValueError("The %r interpolation method requires fixed frequencies, got %r"
+                             % (self.interpolation_method, frequency))
+        return offset.nanos
+
+    def _backtest_grid(self, origin, first, last):
+        """
+        Returns the backtest timestamps (epoch nanoseconds) aligned on origin
+        that lie between first and last (inclusive).
+        """
+        step = self._fixed_frequency_nanos(self.backtest_frequency)
+
+        first_bar = -((origin - first) // step)
+        last_bar = (last - origin) // step
+
+        return origin + step * np.arange(first_bar, last_bar + 1, dtype='int64')
+
+    def interpolate_to_backtest_grid(self, df):
+        """
+        Computes the liquidity index directly at the backtest timestamps
+        from the raw observations, without materialising the interpolation
+        grid (see the 'direct' and 'equivalent' interpolation methods).
+        """
+        df = df.sort_index(kind='mergesort')
+
+        dates = df.index
+        timestamps = dates.values.view('int64')
+        values = df['liquidityIndex'].values
+
+        # both paths align their buckets on the midnight of the first observation
+        origin = dates[0].normalize().value
+
+        if self.interpolation_method == 'direct':
+            grid = self._backtest_grid(origin, timestamps[0], timestamps[-1])
+            # seconds since origin keep the interpolation weights well conditioned
+            liquidity_index = np.interp((grid - origin) / 1e9, (timestamps - origin) / 1e9, values)
+        else:
+            step = self._fixed_frequency_nanos(self.interpolation_frequency)
+
+            # means of the non-empty buckets only, like resample(...).mean() does for them
+            buckets = (timestamps - origin) // step
+            means = df['liquidityIndex'].groupby(buckets).mean()
+            positions = means.index.values.astype('float64')
+
+            # the resampled series starts at the first bucket and ends at the last one,
+            # each backtest bar takes the value of the bucket it falls in
+            grid = self._backtest_grid(origin, origin + means.index[0] * step, origin + means.index[-1] * step)
+            liquidity_index = np.interp(((grid - origin) // step).astype('float64'), positions, means.values)
+
+        index = pd.DatetimeIndex(grid, name=dates.name)
+        if dates.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(dates.tz)
+
+        return pd.DataFrame({'liquidityIndex': liquidity_index}, index=index)
+
+    def preprocess(self, csv_path):
+        """
+        Returns the preprocessed DataFrame (indexed on date, with a single
+        liquidityIndex column) of the given CSV file.
+        """
+        if self.chunksize is not None:
+            return self.preprocess_in_chunks(csv_path)
+
+        df = self.read_csv(csv_path)
+
+        if self.is_liquid_staking:
+            df = self.remove_flat_regions(df=df)
+
+        if self.interpolation_method != 'resample':
+            return self.interpolate_to_backtest_grid(df=df)
+
+        df = self.interpolate_liquidity_index(df=df)
+
+        return self.adjust_liquidity_index_frequency(df=df)
+
+    def preprocess_in_chunks(self, csv_path):
+        """
+        Streams the CSV file in chunks through a ChunkedPreprocessingState
+        and returns the preprocessed DataFrame.
+        """
+        state = ChunkedPreprocessingState(self)
+        self.feed_csv(state, csv_path)
+
+        return state.finalize()
+
+    def preprocess_with_state(self, csv_path):
+        """
+        Returns the preprocessed DataFrame together with the ChunkedPreprocessingState
+        reached after the last row, which can be extended later on with the rows
+        appended to the file. The state is None when the file cannot be streamed
+        (unsorted observations, non fixed interpolation frequency or a direct
+        interpolation method), the DataFrame being then preprocessed in memory.
+        """
+        if self.interpolation_method == 'resample':
+            try:
+                state = ChunkedPreprocessingState(self)
+                self.feed_csv(state, csv_path)
+            except ValueError:
+                pass
+            else:
+                return state.finalize(), state
+
+        return self.preprocess(csv_path), None
+
+    def feed_csv(self, state, csv_path, offset=0):
+        """
+        Feeds the rows of the CSV file found after the given byte offset
+        (0 being the start of the file, header included) to a
+        ChunkedPreprocessingState, in chunks of chunksize rows if set.
+        """
+        with open(csv_path, 'rb') as f:
+            f.seek(offset)
+            try:
+                chunks = self.read_csv(f, chunksize=self.chunksize, header=0 if offset == 0 else None)
+            except pd.errors.EmptyDataError:
+                chunks = []
+
+            for chunk in ([chunks] if isinstance(chunks, pd.DataFrame) else chunks):
+                state.feed(chunk)
+
+            # remember where the next rows appended to the file will start
+            state.consumed_bytes = f.seek(0, os.SEEK_END)
+            if state.consumed_bytes > 0:
+                f.seek(-1, os.SEEK_END)
+                state.ends_with_newline = f.read(1) in (b'\n', b'\r')
+
+
+class ChunkedPreprocessingState(object):
+    """
+    Incremental state of the LiquidityIndexPreprocessor pipeline, fed with
+    consecutive chunks of raw observations.
+
+    Every stage only holds back what a later chunk can still change, i.e.
+    the raw rows of the last (open) interpolation bucket, the run of empty
+    buckets after the last known value that still awaits its right
+    interpolation anchor, and the last interpolated value needed to forward
+    fill the backtest grid. Buckets are aligned on the same origin as the
+    in-memory path (midnight of the first observation), so that bucket
+    boundaries falling across chunks are handled identically.
+
+    finalize() does not alter the state, which can hence be kept (or saved
+    with to_arrays() and restored with from_arrays()) and fed later on with
+    newly appended observations: only the trailing bars are then recomputed.
+    """
+
+    TIMESTAMPS = ('origin', 'last_timestamp', 'last_label')
+    FRAMES = ('open_bucket', 'pending_buckets', 'last_bucket')
+
+    def __init__(self, preprocessor):
+
+        if not isinstance(to_offset(preprocessor.interpolation_frequency), Tick):
+            raise ValueError("Chunked preprocessing requires a fixed interpolation frequency, e.g. 'H'")
+
+        self.preprocessor = preprocessor
+
+        self.origin = None
+        self.last_timestamp = None
+        self.last_raw_value = np.nan
+
+        # raw rows of the last, still open, interpolation bucket
+        self.open_bucket = None
+
+        # last known interpolation bucket followed by the empty buckets awaiting interpolation
+        self.pending_buckets = None
+
+        # last interpolated bucket, used to forward fill the next backtest bars
+        self.last_bucket = None
+        self.last_label = None
+
+        self.output = []
+
+        # extent of the CSV file fed so far, see LiquidityIndexPreprocessor.feed_csv()
+        self.consumed_bytes = 0
+        self.ends_with_newline = True
+
+    @property
+    def n_emitted(self):
+        """
+        Number of bars that later observations can no longer change.
+        """
+        return sum(len(df) for df in self.output)
+
+    def to_arrays(self):
+        """
+        Returns the state, except for the emitted bars, as a dictionary of
+        NumPy arrays (timestamps as UTC epoch nanoseconds).
+        """
+        arrays = {
+            'last_raw_value': np.array(self.last_raw_value, dtype='float64'),
+            'consumed_bytes': np.array(self.consumed_bytes, dtype='int64'),
+            'ends_with_newline': np.array(self.ends_with_newline)
+        }
+
+        for name in self.TIMESTAMPS:
+            timestamp = getattr(self, name)
+            arrays[name] = np.array(pd.NaT.value if timestamp is None else timestamp.value, dtype='int64')
+
+        for name in self.FRAMES:
+            df = getattr(self, name)
+            arrays[name + '_present'] = np.array(df is not None)
+            arrays[name + '_dates'] = np.empty(0, dtype='int64') if df is None else to_epoch_nanos(df.index)
+            arrays[name + '_values'] = np.empty(0) if df is None else df['liquidityIndex'].to_numpy(dtype='float64')
+
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, preprocessor, arrays, tz='', emitted=None):
+        """
+        Restores a state saved with to_arrays(), emitted being the
+        DataFrame of the bars emitted before it was saved.
+        """
+        state = cls(preprocessor)
+
+        state.last_raw_value = float(arrays['last_raw_value'])
+        state.consumed_bytes = int(arrays['consumed_bytes'])
+        state.ends_with_newline = bool(arrays['ends_with_newline'])
+
+        for name in cls.TIMESTAMPS:
+            nanos = int(arrays[name])
+            setattr(state, name, None if nanos == pd.NaT.value else from_epoch_nanos([nanos], tz)[0])
+
+        for name in cls.FRAMES:
+            if bool(arrays[name + '_present']):
+                setattr(state, name, pd.DataFrame(
+                    {'liquidityIndex': arrays[name + '_values']},
+                    index=from_epoch_nanos(arrays[name + '_dates'], tz)
+                ))
+
+        if emitted is not None and len(emitted) > 0:
+            state.output = [emitted]
+
+        return state
+
+    def feed(self, chunk):
+        """
+        Processes the next chunk of raw observations.
+        """
+        if len(chunk) == 0:
+            return
+
+        if not chunk.index.is_monotonic_increasing or \
+                (self.last_timestamp is not None and chunk.index[0] < self.last_timestamp):
+            raise ValueError("Chunked preprocessing requires observations sorted by date")
+
+        if self.origin is None:
+            self.origin = chunk.index[0].normalize()
+        self.last_timestamp = chunk.index[-1]
+
+        if self.preprocessor.is_liquid_staking:
+            last_raw_value = chunk.iloc[-1]["liquidityIndex"]
+            chunk = self.preprocessor.remove_flat_regions(df=chunk, previous_value=self.last_raw_value)
+            self.last_raw_value = last_raw_value
+
+        rows = chunk if self.open_bucket is None else pd.concat([self.open_bucket, chunk])
+        if len(rows) == 0:
+            return
+
+        buckets = rows.resample(self.preprocessor.interpolation_frequency, origin=self.origin).mean()
+
+        # the last bucket may still receive observations from the next chunk
+        self.open_bucket = rows[rows.index >= buckets.index[-1]]
+        self._interpolate(buckets.iloc[:-1])
+
+    def finalize(self):
+        """
+        Closes the last bucket and returns the preprocessed DataFrame,
+        leaving the state itself untouched.
+        """
+        # the stages only rebind their attributes, so closing a shallow copy is enough
+        closing = copy.copy(self)
+        closing.output = []
+
+        if closing.open_bucket is not None:
+            buckets = closing.open_bucket.resample(self.preprocessor.interpolation_frequency, origin=self.origin).mean()
+            closing.open_bucket = None
+            closing._interpolate(buckets, final=True)
+
+        output = self.output + closing.output
+        if not output:
+            return pd.DataFrame({'liquidityIndex': []}, index=pd.DatetimeIndex([], name='date'))
+
+        return pd.concat(output)
+
+    def _interpolate(self, buckets, final=False):
+        """
+        Linearly interpolates the empty buckets whose right anchor is known.
+        """
+        if len(buckets) == 0 and not final:
+            return
+
+        anchored = self.pending_buckets is not None
+        if anchored:
+            buckets = pd.concat([self.pending_buckets, buckets])
+
+        known = np.flatnonzero(buckets['liquidityIndex'].notna().values)
+        if len(known) == 0 or (anchored and known[-1] == 0):
+            self.pending_buckets = buckets
+            if final:
+                self._adjust_frequency(buckets.iloc[:0], final=True)
+            return
+
+        last_known = known[-1]
+        interpolated = buckets.iloc[:last_known + 1].interpolate(method='linear')
+        self.pending_buckets = buckets.iloc[last_known:]
+
+        # the anchor was already passed on with the previous buckets
+        self._adjust_frequency(interpolated.iloc[1:] if anchored else interpolated, final=final)
+
+    def _adjust_frequency(self, buckets, final=False):
+        """
+        Forward fills the interpolated buckets onto the backtest grid, emitting the
+        bars whose value can no longer change.
+        """
+        if self.last_bucket is not None:
+            buckets = pd.concat([self.last_bucket, buckets])
+        if len(buckets) == 0:
+            return
+
+        bars = buckets.resample(self.preprocessor.backtest_frequency, origin=self.origin).ffill()
+
+        if self.last_label is not None:
+            bars = bars[bars.index > self.last_label]
+        if not final:
+            bars = bars[bars.index <= buckets.index[-1]]
+
+        if len(bars) > 0:
+            self.last_label = bars.index[-1]
+            self.output.append(bars.dropna())
+
+        self.last_bucket = buckets.iloc[-1:]
@@ -0,0 +1,267 @@
+import struct
+
+import numpy as np
+import pandas as pd
+
+from event import MarketEvent, SignalEvent, OrderEvent, FillEvent, DequeEventQueue, MARKET, SIGNAL, ORDER, FILL
+from portfolio import NaivePortfolio
+
+JOURNAL_MAGIC = b'SBFJ'
+JOURNAL_VERSION = 3
+
+DIRECTIONS = ('LONG', 'SHORT', 'EXIT')
+
+# int64 epoch nanoseconds of a missing timestamp
+NAT = np.iinfo('int64').min
+
+_HEADER = struct.Struct('<4sB?H')
+_TYPE = struct.Struct('<B')
+_TRADE = struct.Struct('<HBq')
+_RATE = struct.Struct('<qd')
+
+
+def _nanos(timestamp):
+    return NAT if timestamp is None else pd.Timestamp(timestamp).value
+
+
+def _timestamp(nanos):
+    return None if nanos == NAT else pd.Timestamp(nanos)
+
+
+def _mask_size(n_tokens):
+    return (n_tokens + 7) // 8
+
+
+def _market_struct(n_tokens):
+    # flag of the updated tokens, event time, updated tokens bitmask, bitmask of the
+    # tokens with a fixed rate, then the latest rate and the fixed rate of every token
+    return struct.Struct('<?q%ds%ds' % (_mask_size(n_tokens), _mask_size(n_tokens)) + 'qdd' * n_tokens)
+
+
+class EventJournal(object):
+    """
+    EventJournal records every event dispatched by an EventLoop into a compact
+    append-only binary file, made of a header with the fixed rate annualisation of the
+    DataHandler and the tokens, followed by one fixed size little-endian record per event:
+
+    MARKET - the event time and a bitmask of the updated tokens when the event carries them
+             (see ScheduledDataHandler), followed by the latest (timestamp, liquidity index)
+             rate and the fixed rate of every token, i.e. what the portfolio reads from the
+             DataHandler when valuing the positions and filling orders.
+    SIGNAL - token, direction and timestamp.
+    ORDER - token, direction, timestamp, notional and margin.
+    FILL - token, direction, timestamp, notional, margin and fee.
+
+    Numbers are stored as doubles, with a flag per number restoring Python ints,
+    so that replay_journal() reproduces the portfolio of the recorded run bit for bit.
+    """
+
+    def __init__(self, path, rates):
+        """
+        Parameters:
+        path - Path of the journal file, overwritten if it exists.
+        rates - The DataHandler object driving the recorded EventLoop.
+        """
+        self.path = path
+        self.rates = rates
+        self.token_list = list(rates.token_list)
+        self.token_index = dict((t, i) for i, t in enumerate(self.token_list))
+
+        self._market = _market_struct(len(self.token_list))
+
+        self.file = open(path, 'wb')
+        self.file.write(_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, rates.fixed_rate_compounding, len(self.token_list)))
+        for t in self.token_list:
+            name = t.encode('utf-8')
+            self.file.write(struct.pack('<H', len(name)) + name)
+
+    @staticmethod
+    def _numbers(values):
+        flags = 0
+        for i, value in enumerate(values):
+            if isinstance(value, int):
+                flags |= 1 << i
+        return struct.pack('<B%dd' % len(values), flags, *values)
+
+    def _trade(self, event):
+        try:
+            return _TRADE.pack(self.token_index[event.token], DIRECTIONS.index(event.direction), _nanos(event.timestamp))
+        except (KeyError, ValueError):
+            raise ValueError("Cannot journal event on token %s with direction %s" % (event.token, event.direction))
+
+    def record(self, event):
+        """
+        Appends an event to the journal. Subscribed first to every event type by
+        an EventLoop built with this journal.
+        """
+        type_id = event.type_id
+
+        if type_id == MARKET:
+            mask = bytearray(_mask_size(len(self.token_list)))
+            if event.tokens is not None:
+                for t in event.tokens:
+                    i = self.token_index[t]
+                    mask[i // 8] |= 1 << (i % 8)
+            fixed_rate_mask = bytearray(len(mask))
+            rates = []
+            for i, t in enumerate(self.token_list):
+                latest_rates = self.rates.get_latest_rates(t, N=1) or [(t, None, np.nan)]
+                fixed_rate = self.rates.get_latest_fixed_rate(t)
+                if fixed_rate is not None:
+                    fixed_rate_mask[i // 8] |= 1 << (i % 8)
+                rates += [_nanos(latest_rates[0][1]), latest_rates[0][2], np.nan if fixed_rate is None else fixed_rate]
+
+            values = [event.tokens is not None, _nanos(event.timestamp), bytes(mask), bytes(fixed_rate_mask)]
+            record = self._market.pack(*(values + rates))
+
+        elif type_id == SIGNAL:
+            record = self._trade(event)
+
+        elif type_id == ORDER:
+            record = self._trade(event) + self._numbers((event.notional, event.margin))
+
+        elif type_id == FILL:
+            record = self._trade(event) + self._numbers((event.notional, event.margin, event.fee))
+
+        self.file.write(_TYPE.pack(type_id) + record)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def read(path):
+        """
+        Returns the token list of a journal and an iterator over its events,
+        as (event, rates) pairs where, at MARKET events, rates is a tuple of
+        dictionaries mapping every token to its latest rate tuples and to its
+        fixed rate, and is None otherwise.
+        """
+        token_list, _, events = EventJournal.read_with_settings(path)
+        return token_list, events
+
+    @staticmethod
+    def read_with_settings(path):
+        """
+        Returns the token list of a journal, whether the fixed rates of the
+        recorded run were annualised with compounding, and an iterator over
+        its events as returned by read().
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        magic, version, fixed_rate_compounding, n_tokens = _HEADER.unpack_from(data, 0)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError("%s is not a version %d event journal" % (path, JOURNAL_VERSION))
+
+        offset = _HEADER.size
+        token_list = []
+        for _ in range(n_tokens):
+            length, = struct.unpack_from('<H', data, offset)
+            token_list.append(data[offset + 2:offset + 2 + length].decode('utf-8'))
+            offset += 2 + length
+
+        return token_list, fixed_rate_compounding, EventJournal._events(data, offset, token_list)
+
+    @staticmethod
+    def _events(data, offset, token_list):
+        market = _market_struct(len(token_list))
+        numbers = dict((n, struct.Struct('<B%dd' % n)) for n in (2, 3))
+
+        def unpack_numbers(n):
+            unpacked = numbers[n].unpack_from(data, offset)
+            flags, values = unpacked[0], unpacked[1:]
+            return [int(v) if flags & (1 << i) else v for i, v in enumerate(values)]
+
+        while offset < len(data):
+            type_id, = _TYPE.unpack_from(data, offset)
+            offset += _TYPE.size
+
+            if type_id == MARKET:
+                unpacked = market.unpack_from(data, offset)
+                (has_tokens, nanos, mask, fixed_rate_mask), values = unpacked[:4], unpacked[4:]
+                offset += market.size
+                rates, fixed_rates = {}, {}
+                for i, t in enumerate(token_list):
+                    k = 3 * i
+                    rates[t] = [(t, pd.Timestamp(values[k]), np.float64(values[k + 1]))] if values[k] != NAT else []
+                    fixed_rates[t] = values[k + 2] if fixed_rate_mask[i // 8] & (1 << (i % 8)) else None
+                tokens = None
+                if has_tokens:
+                    tokens = tuple(t for i, t in enumerate(token_list) if mask[i // 8] & (1 << (i % 8)))
+                yield MarketEvent(tokens=tokens, timestamp=_timestamp(nanos)), (rates, fixed_rates)
+                continue
+
+            token, direction, nanos = _TRADE.unpack_from(data, offset)
+            offset += _TRADE.size
+            token, direction, timestamp = token_list[token], DIRECTIONS[direction], _timestamp(nanos)
+
+            if type_id == SIGNAL:
+                yield SignalEvent(token, direction, timestamp), None
+
+            elif type_id == ORDER:
+                notional, margin = unpack_numbers(2)
+                offset += numbers[2].size
+                yield OrderEvent(token, direction, timestamp, notional, margin), None
+
+            elif type_id == FILL:
+                notional, margin, fee = unpack_numbers(3)
+                offset += numbers[3].size
+                yield FillEvent(token, fee, timestamp, notional, margin, direction), None
+
+            else:
+                raise ValueError("Unknown event type %d in journal" % type_id)
+
+
+class JournalRates(object):
+    """
+    Stands in for the DataHandler of a portfolio replaying a journal,
+    serving the rates and fixed rates recorded with the last MARKET event.
+    """
+
+    def __init__(self, token_list, fixed_rate_compounding=True):
+
+        self.token_list = token_list
+        self.fixed_rate_compounding = fixed_rate_compounding
+        self.continue_backtest = False
+        self.latest_token_data = dict((t, []) for t in token_list)
+        self.fixed_rates = dict((t, None) for t in token_list)
+
+    def get_latest_rates(self, token, N=1):
+
+        return self.latest_token_data[token][-N:]
+
+    def get_latest_fixed_rate(self, token):
+
+        return self.fixed_rates[token]
+
+
+def replay_journal(path, portfolio_class=NaivePortfolio, **portfolio_kwargs):
+    """
+    Feeds the MARKET and FILL events of a journal to a new portfolio, without any
+    DataHandler, Strategy or ExecutionHandler, and returns the portfolio. As the
+    fills are those recorded, the replay isolates the portfolio accounting: it is
+    deterministic and matches the recorded run bit for bit for an unchanged portfolio.
+
+    Parameters:
+    path - Path of the journal file.
+    portfolio_class - The Portfolio class replayed.
+    portfolio_kwargs - The arguments of the portfolio besides rates and events,
+                       e.g. start_date_time, leverage and initial_capital.
+    """
+    token_list, fixed_rate_compounding, events = EventJournal.read_with_settings(path)
+
+    rates = JournalRates(token_list, fixed_rate_compounding=fixed_rate_compounding)
+    portfolio = portfolio_class(rates=rates, events=DequeEventQueue(), **portfolio_kwargs)
+
+    for event, market_rates in events:
+        type_id = event.type_id
+        if type_id == MARKET:
+            rates.latest_token_data, rates.fixed_rates = market_rates
+            portfolio.update_timeindex(event)
+        elif type_id == FILL:
+            portfolio.update_fill(event)
+
+    return portfolio
@@ -0,0 +1,335 @@
+from array import array
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+# int64 epoch nanoseconds of a missing datetime
+NAT = np.iinfo('int64').min
+
+
+def _to_nanos(datetime):
+    """
+    Returns the epoch nanoseconds (UTC for timezone aware datetimes) and
+    the timezone of a datetime, NAT and None for a missing one.
+    """
+    if datetime is None:
+        return NAT, None
+
+    timestamp = datetime if isinstance(datetime, pd.Timestamp) else pd.Timestamp(datetime)
+    return timestamp.value, getattr(timestamp, 'tz', None)
+
+
+def _from_nanos(nanos, tz=None):
+    """
+    Returns the Timestamp of epoch nanoseconds in a timezone, NaT for NAT.
+    """
+    if nanos == NAT:
+        return pd.NaT
+    timestamp = pd.Timestamp(nanos)
+    return timestamp if tz is None else timestamp.tz_localize('UTC').tz_convert(tz)
+
+
+class HoldingsLedger(object):
+    """
+    HoldingsLedger stores the holdings history of a portfolio in columns: an
+    int64 array of epoch nanoseconds for the datetimes and a single float64 block
+    with one row per field (cash, fee, total and, per token, the market value,
+    fixed rate and liquidity index), preallocated and grown by doubling.
+
+    A bar costs a few array writes rather than a dictionary, and to_frame() wraps
+    the filled part of the arrays in a DataFrame without copying them. Missing
+    values (the token fields of the initial holdings, fixed rates that cannot be
+    calculated yet) are stored as NaN.
+
+    The ledger can still be used as the list of holdings dictionaries it replaces:
+    it supports len(), indexing (rows are returned as dictionaries), iteration
+    and append().
+    """
+
+    def __init__(self, columns, capacity=256):
+        """
+        Parameters:
+        columns - The names of the float64 fields, in DataFrame column order.
+        capacity - Number of rows preallocated.
+        """
+        self.columns = list(columns)
+        self.column_index = dict((c, i) for i, c in enumerate(self.columns))
+        self.n_rows = 0
+
+        self.nanos = np.empty(capacity, dtype='int64')
+        self.values = np.empty((len(self.columns), capacity), dtype='float64')
+
+        # timezone of the datetimes, taken from the first timezone aware one
+        self.tz = None
+
+    def __len__(self):
+        return self.n_rows
+
+    @property
+    def nbytes(self):
+        """
+        Bytes taken by the rows of the ledger.
+        """
+        return self.n_rows * (self.nanos.itemsize + len(self.columns) * self.values.itemsize)
+
+    @property
+    def allocated_nbytes(self):
+        """
+        Bytes allocated for the ledger arrays, spare capacity included.
+        """
+        return self.nanos.nbytes + self.values.nbytes
+
+    def _grow(self):
+        capacity = 2 * len(self.nanos)
+
+        nanos = np.empty(capacity, dtype='int64')
+        nanos[:self.n_rows] = self.nanos[:self.n_rows]
+        values = np.empty((len(self.columns), capacity), dtype='float64')
+        values[:, :self.n_rows] = self.values[:, :self.n_rows]
+
+        self.nanos, self.values = nanos, values
+
+    def _to_nanos(self, datetime):
+        nanos, tz = _to_nanos(datetime)
+        if self.tz is None:
+            self.tz = tz
+        return nanos
+
+    def append_values(self, datetime, values):
+        """
+        Appends a row from its datetime and the values of all
+        the fields in column order, None standing for missing values.
+        """
+        if self.n_rows == len(self.nanos):
+            self._grow()
+
+        i = self.n_rows
+        self.nanos[i] = self._to_nanos(datetime)
+        if None in values:
+            values = [np.nan if v is None else v for v in values]
+        self.values[:, i] = values
+        self.n_rows += 1
+
+    def append(self, row):
+        """
+        Appends a holdings dictionary, the missing fields being NaN.
+        """
+        self.append_values(row.get('datetime'), [row.get(c) for c in self.columns])
+
+    def _row(self, i):
+        row = {'datetime': _from_nanos(self.nanos[i], self.tz)}
+        row.update(zip(self.columns, self.values[:, i].tolist()))
+        return row
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(self.n_rows))]
+
+        if i < 0:
+            i += self.n_rows
+        if not 0 <= i < self.n_rows:
+            raise IndexError("ledger index out of range")
+        return self._row(i)
+
+    def __iter__(self):
+        for i in range(self.n_rows):
+            yield self._row(i)
+
+    def datetime_index(self):
+        """
+        Returns the datetimes of the rows as a DatetimeIndex named datetime.
+        """
+        index = pd.DatetimeIndex(self.nanos[:self.n_rows].view('datetime64[ns]'), name='datetime')
+        if self.tz is not None:
+            index = index.tz_localize('UTC').tz_convert(self.tz)
+        return index
+
+    def to_frame(self):
+        """
+        Returns the holdings as a DataFrame indexed on datetime, whose single
+        float64 block is a view of the ledger values (no copy is made).
+        """
+        return pd.DataFrame(
+            self.values[:, :self.n_rows].T, index=self.datetime_index(), columns=self.columns, copy=False
+        )
+
+
+class PositionHistory(object):
+    """
+    PositionHistory records the positions of a portfolio as an append-only
+    stream of deltas (a position opened, closed or modified, with its timestamp)
+    and the number of deltas at every bar, so its memory grows with the number
+    of trades rather than with the number of bars times the number of tokens.
+
+    Position ids only increase and closes are explicit, hence every token keeps
+    the delta index at which each of its positions was opened and closed (and
+    modified, if ever). positions_at() rebuilds the positions as of any bar from
+    these arrays, without replaying the deltas nor storing any snapshot.
+
+    The history can still be used as the list of per bar position rows it
+    replaces: it supports len(), indexing (rows are rebuilt as dictionaries
+    of the datetime and the position list of every token) and iteration.
+    """
+
+    OPEN, CLOSE, MODIFY = 0, 1, 2
+
+    # closing delta index of the positions still open
+    STILL_OPEN = np.iinfo('int64').max
+
+    def __init__(self, token_list):
+        """
+        Parameters:
+        token_list - A list of token strings.
+        """
+        self.token_list = list(token_list)
+        self.token_index = dict((t, i) for i, t in enumerate(self.token_list))
+
+        # deltas, the position being None for closes
+        self.actions = array('b')
+        self.tokens = array('H')
+        self.position_ids = array('q')
+        self.timestamps = array('q')
+        self.positions = []
+
+        # per token and position id, the delta indices of its opening and closing,
+        # and of its modifications for the positions modified
+        self.open_deltas = [array('q') for _ in self.token_list]
+        self.close_deltas = [array('q') for _ in self.token_list]
+        self.modify_deltas = {}
+
+        # epoch nanoseconds and number of deltas recorded at every bar
+        self.bar_nanos = array('q')
+        self.bar_offsets = array('q')
+
+        # timezone of the datetimes, taken from the first timezone aware one
+        self.tz = None
+
+    def __len__(self):
+        return len(self.bar_offsets)
+
+    @property
+    def n_deltas(self):
+        return len(self.actions)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes taken by the deltas, position indices and bars, besides the position dictionaries.
+        """
+        arrays = [self.actions, self.tokens, self.position_ids, self.timestamps, self.bar_nanos, self.bar_offsets]
+        arrays += self.open_deltas + self.close_deltas
+        n_modifications = sum(len(deltas) for deltas in self.modify_deltas.values())
+        return sum(a.itemsize * len(a) for a in arrays) + 8 * (len(self.positions) + n_modifications)
+
+    def _to_nanos(self, datetime):
+        nanos, tz = _to_nanos(datetime)
+        if self.tz is None:
+            self.tz = tz
+        return nanos
+
+    def _record(self, action, j, position_id, timestamp, position):
+        self.actions.append(action)
+        self.tokens.append(j)
+        self.position_ids.append(position_id)
+        self.timestamps.append(self._to_nanos(timestamp))
+        self.positions.append(position)
+
+    def _check_open(self, j, position_id):
+        if not 0 <= position_id < len(self.open_deltas[j]) or self.close_deltas[j][position_id] != self.STILL_OPEN:
+            raise KeyError("No open position %d in token %s" % (position_id, self.token_list[j]))
+
+    def open(self, token, timestamp, position):
+        """
+        Records a new position of a token and returns its id.
+        """
+        j = self.token_index[token]
+        position_id = len(self.open_deltas[j])
+        self.open_deltas[j].append(self.n_deltas)
+        self.close_deltas[j].append(self.STILL_OPEN)
+        self._record(self.OPEN, j, position_id, timestamp, position)
+        return position_id
+
+    def close(self, token, position_id, timestamp):
+        """
+        Records the closing of an open position.
+        """
+        j = self.token_index[token]
+        self._check_open(j, position_id)
+        self.close_deltas[j][position_id] = self.n_deltas
+        self._record(self.CLOSE, j, position_id, timestamp, None)
+
+    def modify(self, token, position_id, timestamp, position):
+        """
+        Records the new state of an open position, e.g. resized or with added margin.
+        """
+        j = self.token_index[token]
+        self._check_open(j, position_id)
+        self.modify_deltas.setdefault((j, position_id), array('q')).append(self.n_deltas)
+        self._record(self.MODIFY, j, position_id, timestamp, position)
+
+    def mark_bar(self, datetime):
+        """
+        Records a bar, whose positions are the ones resulting from the deltas so far.
+        """
+        self.bar_nanos.append(self._to_nanos(datetime))
+        self.bar_offsets.append(self.n_deltas)
+
+    def positions_at(self, bar):
+        """
+        Returns a dictionary of the position lists of every token as of a bar,
+        positions being listed in their opening order.
+        """
+        if bar < 0:
+            bar += len(self)
+        if not 0 <= bar < len(self):
+            raise IndexError("bar index out of range")
+
+        offset = self.bar_offsets[bar]
+        positions = {}
+        for j, t in enumerate(self.token_list):
+            # positions are opened in id order, so the ones opened so far are a prefix
+            n_opened = bisect_right(self.open_deltas[j], offset - 1)
+            if n_opened == 0:
+                positions[t] = []
+                continue
+
+            close_deltas = np.frombuffer(self.close_deltas[j], dtype='int64', count=n_opened)
+            open_deltas = self.open_deltas[j]
+
+            token_positions = []
+            for position_id in np.flatnonzero(close_deltas >= offset).tolist():
+                k = open_deltas[position_id]
+                modifications = self.modify_deltas.get((j, position_id))
+                if modifications is not None:
+                    i = bisect_right(modifications, offset - 1)
+                    if i > 0:
+                        k = modifications[i - 1]
+                token_positions.append(self.positions[k])
+            positions[t] = token_positions
+
+        return positions
+
+    def deltas(self):
+        """
+        Returns an iterator over the deltas as (action, token, position id,
+        timestamp, position) tuples, action being 'OPEN', 'CLOSE' or 'MODIFY'.
+        """
+        names = ('OPEN', 'CLOSE', 'MODIFY')
+        for k in range(self.n_deltas):
+            yield (
+                names[self.actions[k]], self.token_list[self.tokens[k]], self.position_ids[k],
+                _from_nanos(self.timestamps[k], self.tz), self.positions[k]
+            )
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        row = self.positions_at(i)
+        row['datetime'] = _from_nanos(self.bar_nanos[i if i >= 0 else i + len(self)], self.tz)
+        return row
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -1,9 +1,14 @@
+import numpy as np
 import pandas as pd
 
 from abc import ABCMeta, abstractmethod
 from performance import PerformanceMetricsCalculator
 from event import OrderEvent
+from exposure import NetExposure
+from ledger import HoldingsLedger, PositionHistory
+from position_book import PositionBook
 from strategy import SECONDS_IN_YEAR
+from utils import annualize_variable_rate
 
 
 class Portfolio(object):
@@ -40,7 +45,9 @@ class NaivePortfolio(Portfolio):
     used to test simpler strategies such as LongRateStrategy.
     """
 
-    def __init__(self, rates, events, start_date_time, leverage, initial_capital=1.0):
+    VALUATIONS = ('book', 'netted')
+
+    def __init__(self, rates, events, start_date_time, leverage, initial_capital=1.0, valuation='book'):
         """
         Initialises the portfolio with rates and an event queue.
         Also includes a starting datetime index and initial capital
@@ -51,7 +58,14 @@ class NaivePortfolio(Portfolio):
         events - The Event Queue object.
         start_date - The start date (bar) of the portfolio.
         initial_capital - The starting capital in USD.
+        valuation - How the positions of a token are valued at every bar: 'book' (default)
+                    values every position with vectorised arithmetic identical to
+                    compute_total_value_of_positions (see PositionBook), 'netted' values
+                    running sums per direction in constant time whatever the number of
+                    trades, up to floating point rounding (see NetExposure).
         """
+        if valuation not in self.VALUATIONS:
+            raise ValueError("valuation must be one of %s" % (self.VALUATIONS,))
 
         self.rates = rates
         self.events = events
@@ -59,35 +73,50 @@ class NaivePortfolio(Portfolio):
         self.start_date_time = start_date_time
         self.initial_capital = initial_capital
         self.leverage = leverage
+        self.valuation = valuation
 
         self.all_positions = self.construct_all_positions()
         self.current_positions = dict((k, v) for k, v in [(s, []) for s in self.token_list])
 
+        # the current positions as NumPy columns or running sums, valued at every bar
+        self._book_class = PositionBook if valuation == 'book' else NetExposure
+        self.position_books = dict((t, self._book_class()) for t in self.token_list)
+
         self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
 
+        # latest (market value, fixed rate, liquidity index) of every token, and the tokens
+        # to revalue at the next time index update besides the updated ones (all at first)
+        self._token_holdings = {}
+        self._stale_tokens = set(self.token_list)
+
     def construct_all_positions(self):
         """
-        Constructs the positions list using the start_date
+        Constructs the position history using the start_date
         to determine when the time index will begin.
         """
-
-        d = dict((k,v) for k, v in [(s, []) for s in self.token_list])
-        d['datetime'] = self.start_date_time
-        return [d]
+        history = PositionHistory(self.token_list)
+        history.mark_bar(self.start_date_time)
+        return history
 
     def construct_all_holdings(self):
         """
-        Constructs the holdings list using the start_date
+        Constructs the holdings ledger using the start_date
         to determine when the time index will begin.
         """
-        # d = dict((k,v) for k, v in [(s, 0.0) for s in self.token_list])
+        columns = ['cash', 'fee', 'total']
+        for t in self.token_list:
+            columns += [t, f'fixedRate_{t}', f'liquidityIndex_{t}']
+
         d = {}
         d['datetime'] = self.start_date_time
         d['cash'] = self.initial_capital
         d['fee'] = 0.0
         d['total'] = self.initial_capital
-        return [d]
+
+        ledger = HoldingsLedger(columns)
+        ledger.append(d)
+        return ledger
 
     def construct_current_holdings(self):
         """
@@ -101,6 +130,32 @@ class NaivePortfolio(Portfolio):
         d['total'] = self.initial_capital
         return d
 
+    def get_state(self):
+        """
+        Returns the positions and holdings of the portfolio, for checkpointing.
+        The position history shares the position dictionaries of the current
+        positions, which is preserved when the state is pickled as a whole.
+        """
+        return {
+            'all_positions': self.all_positions,
+            'current_positions': self.current_positions,
+            'all_holdings': self.all_holdings,
+            'current_holdings': self.current_holdings
+        }
+
+    def set_state(self, state):
+        """
+        Restores positions and holdings returned by get_state().
+        """
+        self.all_positions = state['all_positions']
+        self.current_positions = state['current_positions']
+        self.position_books = dict(
+            (t, self._book_class.from_positions(self.current_positions[t])) for t in self.token_list
+        )
+        self.all_holdings = state['all_holdings']
+        self.current_holdings = state['current_holdings']
+        self._stale_tokens = set(self.token_list)
+
     def years_since_swap_start(self, positionStartTimestamp, currentTimestamp):
 
         time_delta_in_years = (currentTimestamp - positionStartTimestamp).total_seconds() / 31536000 # 31536000 is the number of seconds in a year
@@ -139,69 +194,69 @@ class NaivePortfolio(Portfolio):
         market data rate. This reflects the PREVIOUS bar, i.e. all
         current market rate data at this stage is known.
 
-        Makes use of a MarketEvent from the events queue.
+        Makes use of a MarketEvent from the events queue. When the event lists
+        the tokens that updated (see ScheduledDataHandler), the record is dated
+        at the event time and only these tokens, and the ones filled since the
+        last record, are revalued. The other tokens keep their last valuation,
+        tokens without any rate yet being valued at zero.
         """
-        rates = {}
-        for token in self.token_list:
-            rates[token] = self.rates.get_latest_rates(token, N=1)
+        tokens = getattr(event, 'tokens', None)
 
-        # Update positions
-        dp = dict((k,v) for k, v in [(s, []) for s in self.token_list])
-        dp['datetime'] = rates[self.token_list[0]][0][1]
+        if tokens is None:
+            datetime = self.rates.get_latest_rates(self.token_list[0], N=1)[0][1]
+            stale_tokens = self.token_list
+        else:
+            datetime = event.timestamp
+            self._stale_tokens.update(tokens)
+            stale_tokens = self._stale_tokens
 
-        for t in self.token_list:
-            dp[t] = self.current_positions[t]
+        for t in stale_tokens:
+            self._token_holdings[t] = self.compute_token_holdings(t)
+        self._stale_tokens = set()
 
-        # Append the current positions
-        self.all_positions.append(dp)
+        # Update positions, the history holding the position deltas since the previous bar
+        self.all_positions.mark_bar(datetime)
 
-        # Update holdings
-        dh = {}
-        dh['datetime'] = rates[self.token_list[0]][0][1]
-        dh['cash'] = self.current_holdings['cash']
-        dh['fee'] = self.current_holdings['fee']
-        dh['total'] = self.current_holdings['cash']
+        # Update holdings, in the column order of the ledger
+        total = self.current_holdings['cash']
+        values = [self.current_holdings['cash'], self.current_holdings['fee'], None]
 
         for t in self.token_list:
-            # current way of computing current value (note, the sum below is across all the positions in token t):
-            # market_value = sum(position margin + irs cashflow of the position until current timestamp)
-            market_value = self.compute_total_value_of_positions(self.current_positions[t], rates[t][0])
-            dh[t] = market_value
-            dh[f'fixedRate_{t}'] = self.get_current_fixed_rate(t)
-            dh[f'liquidityIndex_{t}'] = (self.rates.get_latest_rates(token=t, N=1)[0][2] / 1e27)
-            dh['total'] += market_value
+            market_value, fixed_rate, liquidity_index = self._token_holdings[t]
+            values += [market_value, fixed_rate, liquidity_index]
+            total += market_value
+        values[2] = total
 
         # Append the current holdings
-        self.all_holdings.append(dh)
-
-    def annualize_variable_rate(self, variableRate, timeDelta):
-
-        # todo: move to utils
-        # have two ways to annualise: with and without compounding
-
-        # with compounding
-        numberOfCompoundingPeriodsInYear = 31536000 /  timeDelta.total_seconds() # 31536000 is number of seconds in a year
-        annualizedVariableRate = (1 + variableRate)**(numberOfCompoundingPeriodsInYear) - 1
-
-        return annualizedVariableRate
+        self.all_holdings.append_values(datetime, values)
 
-    def get_current_fixed_rate(self, token):
+    def compute_token_holdings(self, token):
+        """
+        Returns the market value of the positions in a token, with the current
+        fixed rate and liquidity index of the token, all as of its latest rate.
+        """
+        latest_rates = self.rates.get_latest_rates(token, N=1)
+        if not latest_rates:
+            # no rate yet, hence no position either
+            return 0, None, np.nan
 
-        # todo: we might want to set N to a higher period
-        two_latest_rates = self.rates.get_latest_rates(token=token, N=2)
+        # current way of computing current value (note, the sum below is across all the positions in token t):
+        # market_value = sum(position margin + irs cashflow of the position until current timestamp)
+        market_value = self.position_books[token].value(latest_rates[0])
 
-        fr = None
+        return market_value, self.get_current_fixed_rate(token), latest_rates[0][2] / 1e27
 
-        if len(two_latest_rates) == 2:
-            liquidityIndex1 = two_latest_rates[0][2]
-            liquidityIndex2 = two_latest_rates[1][2]
+    def annualize_variable_rate(self, variableRate, timeDelta):
 
-            variableRate = (liquidityIndex2 / liquidityIndex1) - 1.0
+        return annualize_variable_rate(
+            variableRate=variableRate, timeDelta=timeDelta, compounding=self.rates.fixed_rate_compounding
+        )
 
-            # assume the fixed rate is equal to the annualizedVariableRate calculated from the variableFactor based on the last two bars
-            fr = self.annualize_variable_rate(variableRate=variableRate, timeDelta=two_latest_rates[1][1] - two_latest_rates[0][1])
+    def get_current_fixed_rate(self, token):
 
-        return fr
+        # assume the fixed rate is equal to the annualized variable rate over the lookback of the
+        # data handler, precomputed when the rates are loaded (see DataHandler.get_latest_fixed_rate)
+        return self.rates.get_latest_fixed_rate(token)
 
     def get_current_rate_value(self, token):
 
@@ -224,7 +279,8 @@ class NaivePortfolio(Portfolio):
 
         # Update the list of current positions with the newly traded IRS contract
 
-        if self.get_current_fixed_rate(token=fill.token) is None:
+        fixed_rate = self.get_current_fixed_rate(token=fill.token)
+        if fixed_rate is None:
             raise Exception("Cannot calculate the fixed rate")
 
         new_position = {}
@@ -232,11 +288,14 @@ class NaivePortfolio(Portfolio):
         new_position['direction'] = fill.direction
         new_position['notional'] = fill.notional
         new_position['margin'] = fill.margin
-        new_position['fixedRate'] = self.get_current_fixed_rate(token=fill.token)
+        new_position['fixedRate'] = fixed_rate
         new_position['startingRateValue'] = self.get_current_rate_value(token=fill.token)
         new_position['fee'] = fill.fee
 
         self.current_positions[fill.token].append(new_position)
+        self.all_positions.open(fill.token, fill.timestamp, new_position)
+        self.position_books[fill.token].append(new_position)
+        self._stale_tokens.add(fill.token)
 
     def update_holdings_from_fill(self, fill):
         """
@@ -303,11 +362,9 @@ class NaivePortfolio(Portfolio):
 
     def create_equity_curve_dataframe(self):
         """
-        Creates a pandas DataFrame from the all_holdings
-        list of dictionaries.
+        Creates a pandas DataFrame from the all_holdings ledger.
         """
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index('datetime', inplace=True)
+        curve = self.all_holdings.to_frame()
         curve['returns'] = curve['total'].pct_change()
         curve['equity_curve'] = (1.0+curve['returns']).cumprod()
 
@@ -0,0 +1,234 @@
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from event import EVENT_TYPES, SIGNAL, ORDER
+
+PERCENTILES = (50, 90, 99)
+
+
+def latency_stats(latencies):
+    """
+    Returns the number, total, mean, percentiles and maximum
+    of an array('d') of latencies in seconds.
+    """
+    values = np.frombuffer(latencies, dtype='float64')
+    stats = {'calls': len(values), 'total': float(values.sum()), 'mean': float(values.mean())}
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats['p%d' % q] = float(value)
+    stats['max'] = float(values.max())
+    return stats
+
+
+def _handler_name(handler):
+    """
+    Returns a readable name for a handler, e.g. 'NaivePortfolio.update_timeindex'.
+    """
+    owner = getattr(handler, '__self__', None)
+    name = getattr(handler, '__name__', repr(handler))
+    return name if owner is None else '%s.%s' % (type(owner).__name__, name)
+
+
+class EventLoopProfiler(object):
+    """
+    EventLoopProfiler instruments an EventLoop run: it counts the dispatched
+    events per type, records the latency of every data advance and handler call
+    (the strategy signals, portfolio time index update, order generation, fills...)
+    and the throughput in bars per second, and samples the growth of the portfolio
+    all_holdings and all_positions lists.
+
+    The EventLoop only routes its calls through the timing wrappers of the profiler
+    when one is attached, so that an EventLoop without profiler runs at full speed.
+    """
+
+    PERCENTILES = PERCENTILES
+
+    def __init__(self, memory_interval=1000):
+        """
+        Parameters:
+        memory_interval - Number of bars between two samples of the portfolio memory.
+        """
+        self.memory_interval = memory_interval
+
+        self.event_counts = [0] * len(EVENT_TYPES)
+        self.latencies = {}
+        self.memory = []
+
+        self.n_bars = 0
+        self.wall_time = 0.0
+
+        self._portfolio = None
+        self._measured = {}
+        self._start = None
+
+    def _timed(self, name, function):
+        latencies = self.latencies.setdefault(name, array('d'))
+        clock = time.perf_counter
+
+        def timed(*args):
+            start = clock()
+            result = function(*args)
+            latencies.append(clock() - start)
+            return result
+
+        return timed
+
+    def _timed_dispatch(self, type_id, handlers):
+        event_counts = self.event_counts
+        timed_handlers = [self._timed(_handler_name(handler), handler) for handler in handlers]
+
+        def dispatch(event):
+            event_counts[type_id] += 1
+            for handler in timed_handlers:
+                handler(event)
+
+        return dispatch
+
+    def start(self, event_loop):
+        """
+        Starts profiling a run of the EventLoop, returning the instrumented data
+        advance function and dispatch table the loop is then driven with.
+        """
+        self._portfolio = event_loop.portfolio
+        self._start = time.perf_counter()
+
+        update_rates = self._timed('%s.update_rates' % type(event_loop.rates).__name__, event_loop.rates.update_rates)
+
+        def advance():
+            update_rates()
+            self.n_bars += 1
+            if self.n_bars % self.memory_interval == 0:
+                self.sample_memory()
+
+        handlers = [[self._timed_dispatch(type_id, handlers)] for type_id, handlers in enumerate(event_loop.handlers)]
+
+        return advance, handlers
+
+    def stop(self, event_loop):
+        """
+        Stops profiling the run, taking a last memory sample.
+        """
+        self.wall_time += time.perf_counter() - self._start
+        self.sample_memory()
+
+    def _measure(self, name, rows):
+        if hasattr(rows, 'nbytes'):
+            # columnar rows report their own size
+            return len(rows), rows.nbytes
+
+        # rows are only ever appended, so only the new ones are measured
+        n_measured, n_bytes = self._measured.get(name, (0, 0))
+        for row in rows[n_measured:]:
+            n_bytes += sys.getsizeof(row)
+            if isinstance(row, dict):
+                n_bytes += sum(sys.getsizeof(value) for value in row.values())
+        self._measured[name] = (len(rows), n_bytes)
+        return len(rows), sys.getsizeof(rows) + n_bytes
+
+    def sample_memory(self):
+        """
+        Records the number of rows and approximate size in bytes
+        of the all_holdings and all_positions lists of the portfolio.
+        """
+        sample = {'bar': self.n_bars}
+        for name in ('all_holdings', 'all_positions'):
+            rows = getattr(self._portfolio, name, None)
+            if rows is not None:
+                sample['%s_rows' % name], sample['%s_bytes' % name] = self._measure(name, rows)
+        self.memory.append(sample)
+
+    def report(self):
+        """
+        Returns the profile as a dictionary: bars, wall time and bars per second,
+        dispatched events per type, latency statistics (in seconds) per handler,
+        and memory samples.
+        """
+        handlers = {}
+        for name, latencies in self.latencies.items():
+            if len(latencies) == 0:
+                continue
+            handlers[name] = latency_stats(latencies)
+
+        return {
+            'bars': self.n_bars,
+            'wall_time': self.wall_time,
+            'bars_per_second': self.n_bars / self.wall_time if self.wall_time > 0 else 0.0,
+            'events': dict(zip(EVENT_TYPES, self.event_counts)),
+            'handlers': handlers,
+            'memory': list(self.memory)
+        }
+
+    def format_report(self):
+        """
+        Returns the profile as a human readable table.
+        """
+        report = self.report()
+
+        lines = ["%d bars in %.3fs (%.0f bars/sec)" % (report['bars'], report['wall_time'], report['bars_per_second'])]
+        lines.append("Events: " + ", ".join("%s=%d" % item for item in report['events'].items()))
+
+        lines.append("%-44s %8s %10s %10s %10s %10s %10s" % ("Handler", "calls", "total(s)", "mean(us)", "p50(us)", "p99(us)", "max(us)"))
+        for name, stats in sorted(report['handlers'].items(), key=lambda item: -item[1]['total']):
+            lines.append("%-44s %8d %10.4f %10.2f %10.2f %10.2f %10.2f" % (
+                name, stats['calls'], stats['total'], stats['mean'] * 1e6,
+                stats['p50'] * 1e6, stats['p99'] * 1e6, stats['max'] * 1e6
+            ))
+
+        if report['memory']:
+            last = report['memory'][-1]
+            lines.append("Memory: " + ", ".join(
+                "%s %d rows / %.1f kB" % (name, last['%s_rows' % name], last['%s_bytes' % name] / 1024.0)
+                for name in ('all_holdings', 'all_positions') if '%s_rows' % name in last
+            ))
+
+        return "\n".join(lines)
+
+
+class LatencyTracker(object):
+    """
+    LatencyTracker measures the reaction time of a live trading stack driven by
+    an AsyncEventLoop: the tick-to-signal latency, from the arrival of a rate to
+    the dispatch of the signal it triggers on the same token, and the signal-to-order
+    latency, from the dispatch of a signal to the dispatch of the resulting order.
+    """
+
+    def __init__(self):
+
+        self.tick_times = {}
+        self.signal_times = {}
+
+        self.tick_to_signal = array('d')
+        self.signal_to_order = array('d')
+
+    def attach(self, event_loop):
+        """
+        Subscribes the tracker first to the SIGNAL and ORDER events of the loop.
+        """
+        event_loop.handlers[SIGNAL].insert(0, self.record_signal)
+        event_loop.handlers[ORDER].insert(0, self.record_order)
+
+    def record_tick(self, token):
+        self.tick_times[token] = time.perf_counter()
+
+    def record_signal(self, event):
+        now = time.perf_counter()
+        self.signal_times[event.token] = now
+        if event.token in self.tick_times:
+            self.tick_to_signal.append(now - self.tick_times[event.token])
+
+    def record_order(self, event):
+        now = time.perf_counter()
+        if event.token in self.signal_times:
+            self.signal_to_order.append(now - self.signal_times[event.token])
+
+    def report(self):
+        """
+        Returns the latency statistics (in seconds) of both measures,
+        None for a measure without any sample.
+        """
+        return dict(
+            (name, latency_stats(latencies) if len(latencies) > 0 else None)
+            for name, latencies in (('tick_to_signal', self.tick_to_signal), ('signal_to_order', self.signal_to_order))
+        )
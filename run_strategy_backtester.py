@@ -1,13 +1,38 @@
 from backtest import LongRateStrategyBacktest as LR
+from profiling import EventLoopProfiler
+import cProfile
+import tracemalloc
+import json
 import os
 
 def main(start_date_time="2021-04-01 00:00:00", end_date_time="2022-06-01 00:00:00", leverage=1.0, \
-            initial_capital=1.0):
+            initial_capital=1.0, profile=False, cprofile=None, tracemalloc_dump=None, checkpoint_dir=None,
+            checkpoint_interval=1000, resume=None, valuation='book'):
     
-    backtest = LR(start_date_time=start_date_time,end_date_time=end_date_time, leverage=leverage, initial_capital=initial_capital)
+    profiler = EventLoopProfiler() if profile else None
+
+    backtest = LR(start_date_time=start_date_time,end_date_time=end_date_time, leverage=leverage, initial_capital=initial_capital,
+                  profiler=profiler, checkpoint_dir=checkpoint_dir, checkpoint_interval=checkpoint_interval,
+                  valuation=valuation)
+
+    # Carry on from a checkpoint of a previous run, if any
+    if resume:
+        backtest.resume(resume)
+
+    if tracemalloc_dump:
+        tracemalloc.start()
+    cProfiler = cProfile.Profile() if cprofile else None
 
     # Run the backtest and get the output portfolio object
-    output_portfolio = backtest.run_backtest()
+    if cProfiler is not None:
+        output_portfolio = cProfiler.runcall(backtest.run_backtest)
+        cProfiler.dump_stats(cprofile)
+    else:
+        output_portfolio = backtest.run_backtest()
+
+    if tracemalloc_dump:
+        tracemalloc.take_snapshot().dump(tracemalloc_dump)
+        tracemalloc.stop()
 
     # Extract the equity curve for computing performance metics
     output_portfolio.create_equity_curve_dataframe()
@@ -21,6 +46,12 @@ def main(start_date_time="2021-04-01 00:00:00", end_date_time="2022-06-01 00:00:
         os.makedirs(f"./reports/{end}")
     output_portfolio.equity_curve.to_csv(f"./reports/{end}/df_LongOnly_leverage_{leverage}.csv")
 
+    if profiler is not None:
+        print("Event loop profile:")
+        print(profiler.format_report())
+        with open(f"./reports/{end}/profile_LongOnly_leverage_{leverage}.json", "w") as f:
+            json.dump(profiler.report(), f, indent=2)
+
     print("Backtest summary:")
     print(stats)
     for s in stats:
@@ -35,6 +66,14 @@ if __name__=="__main__":
     parser.add_argument("-ed", "--end_date_time", type=str, help="Ending date for backtest", default="2022-06-01 00:00:00")
     parser.add_argument("-l", "--leverage", type=float, help="Leverage (notional / margin)", default=1.0)
     parser.add_argument("-i", "--initial_capital", type=float, help="Initial capital (notional before leverage)", default=1.0)
+    parser.add_argument("-p", "--profile", action="store_true", help="Profile the event loop and report it alongside the results")
+    parser.add_argument("--cprofile", type=str, help="Path of a cProfile stats dump of the backtest run (see pstats)")
+    parser.add_argument("--tracemalloc_dump", type=str, help="Path of a tracemalloc snapshot dump taken after the backtest run")
+    parser.add_argument("--checkpoint_dir", type=str, help="Directory where the backtest state is checkpointed")
+    parser.add_argument("--checkpoint_interval", type=int, help="Number of bars between two checkpoints", default=1000)
+    parser.add_argument("--resume", type=str, help="Path of a checkpoint to resume the backtest from")
+    parser.add_argument("--valuation", type=str, choices=["book", "netted"],
+                        help="Valuation of the positions: exact per position (book) or constant time running sums (netted)")
 
     params = parser.parse_args()
     param_dict = dict((k, v) for k, v in vars(params).items() if v is not None)
@@ -0,0 +1,163 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ingestion import to_epoch_nanos
+
+STORE_VERSION = 1
+
+
+class RateStore(object):
+    """
+    RateStore is a columnar on-disk store of preprocessed rates. Each token
+    is kept as two headerless binary columns, int64 epoch timestamps (UTC
+    nanoseconds) and float64 liquidity indices, next to a small JSON header
+    holding the number of rows.
+
+    The columns are opened as read-only memory maps, so opening a token is
+    instant and many backtest processes reading the same dataset share the
+    OS page cache instead of each holding a private copy.
+    """
+
+    def __init__(self, store_dir):
+        """
+        Parameters:
+        store_dir - Directory path of the store, created if needed.
+        """
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    def _paths(self, token):
+        base = os.path.join(self.store_dir, token)
+        return base + '.timestamps.bin', base + '.liquidityIndex.bin', base + '.json'
+
+    def tokens(self):
+        """
+        Returns the sorted list of tokens available in the store.
+        """
+        return sorted(f[:-len('.json')] for f in os.listdir(self.store_dir) if f.endswith('.json'))
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def write(self, token, df):
+        """
+        Writes the preprocessed DataFrame (indexed on date, with a liquidityIndex
+        column) of a token, replacing any existing columns. Each file is replaced
+        atomically and the header is written last, so readers that already mapped
+        the previous columns keep a consistent view.
+        """
+        timestamps, liquidity_indices = self._columns(df)
+
+        timestamps_path, liquidity_indices_path, header_path = self._paths(token)
+        self._atomic_write(timestamps_path, timestamps.tobytes())
+        self._atomic_write(liquidity_indices_path, liquidity_indices.tobytes())
+        self._write_header(header_path, len(timestamps))
+
+    def _columns(self, df):
+        return (
+            np.ascontiguousarray(to_epoch_nanos(df.index)),
+            np.ascontiguousarray(df['liquidityIndex'].to_numpy(dtype='float64'))
+        )
+
+    def _write_header(self, header_path, length):
+        self._atomic_write(header_path, json.dumps({
+            'version': STORE_VERSION,
+            'length': length
+        }).encode('utf-8'))
+
+    def update(self, token, df, start=None):
+        """
+        Brings the columns of a token in line with the preprocessed DataFrame, rewriting
+        in place only the rows from the first one that changed (or from row start if
+        known) onwards. Rows are only ever overwritten with their new values or appended
+        before the header is updated, so readers that mapped the previous columns keep
+        seeing their rows; a DataFrame shorter than the stored columns is written anew.
+        """
+        timestamps_path, liquidity_indices_path, header_path = self._paths(token)
+        if not os.path.exists(header_path):
+            return self.write(token, df)
+
+        timestamps, liquidity_indices = self._columns(df)
+        stored_timestamps, stored_liquidity_indices = self.open(token)
+
+        length = len(stored_timestamps)
+        if len(timestamps) < length:
+            return self.write(token, df)
+
+        if start is None:
+            changed = np.flatnonzero(
+                (stored_timestamps != timestamps[:length]) | (stored_liquidity_indices != liquidity_indices[:length])
+            )
+            start = changed[0] if len(changed) > 0 else length
+        start = min(int(start), length)
+
+        if start == length == len(timestamps):
+            return
+
+        for path, column in ((timestamps_path, timestamps), (liquidity_indices_path, liquidity_indices)):
+            with open(path, 'r+b') as f:
+                f.seek(start * column.itemsize)
+                f.write(column[start:].tobytes())
+
+        self._write_header(header_path, len(timestamps))
+
+    def write_from_csv(self, csv_path, token, preprocessor):
+        """
+        Preprocesses a CSV file with a LiquidityIndexPreprocessor and
+        writes the result to the store.
+        """
+        self.write(token, preprocessor.preprocess(csv_path))
+
+    def refresh_from_csv(self, csv_path, token, preprocessor, cache):
+        """
+        Brings the columns of a token up to date with its CSV file. The preprocessed
+        rates come from a RateCache, which only parses the rows appended to the file
+        since the last refresh, and only the bars that changed are rewritten.
+        """
+        df, _ = cache.refresh(csv_path, preprocessor)
+        self.update(token, df)
+
+    def open(self, token):
+        """
+        Returns read-only memory maps of the int64 timestamps and
+        float64 liquidity indices of a token.
+        """
+        timestamps_path, liquidity_indices_path, header_path = self._paths(token)
+
+        with open(header_path) as f:
+            length = json.load(f)['length']
+
+        if length == 0:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='float64')
+
+        return (
+            np.memmap(timestamps_path, dtype='int64', mode='r', shape=(length,)),
+            np.memmap(liquidity_indices_path, dtype='float64', mode='r', shape=(length,))
+        )
+
+    def open_window(self, token, start_date_time=None, end_date_time=None):
+        """
+        Returns zero-copy slices of the timestamps and liquidity indices of a token
+        between the (inclusive) start and end datetimes, located by binary search.
+        """
+        timestamps, liquidity_indices = self.open(token)
+
+        start = 0
+        end = len(timestamps)
+        if start_date_time is not None:
+            start = np.searchsorted(timestamps, pd.Timestamp(start_date_time).value, side='left')
+        if end_date_time is not None:
+            end = np.searchsorted(timestamps, pd.Timestamp(end_date_time).value, side='right')
+
+        return timestamps[start:end], liquidity_indices[start:end]
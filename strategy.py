@@ -3,8 +3,10 @@ from signal import signal
 from turtle import pos
 from sqlalchemy import column
 from event import SignalEvent
+import numpy as np
+
+from utils import SECONDS_IN_YEAR
 
-SECONDS_IN_YEAR = 31536000
 class Strategy(object):
     """
     Strategy is an abstract base class providing an interface for
@@ -28,6 +30,19 @@ class Strategy(object):
         """
         raise NotImplementedError("Should implement calculate_signals()")
 
+    def get_state(self):
+        """
+        Returns the state of the strategy, for checkpointing.
+        Stateless strategies need not override it.
+        """
+        return {}
+
+    def set_state(self, state):
+        """
+        Restores a state returned by get_state().
+        """
+        pass
+
 class LongRateStrategy(Strategy):
     """
     This is an extremely simple strategy that goes LONG (VT) all of the
@@ -62,6 +77,12 @@ class LongRateStrategy(Strategy):
             aped[t] = False
         return aped
 
+    def get_state(self):
+        return {'aped': dict(self.aped)}
+
+    def set_state(self, state):
+        self.aped = dict(state['aped'])
+
     def calculate_signals(self, event):
         """
         For "VT and Hold" we generate a single signal per token
@@ -69,15 +90,49 @@ class LongRateStrategy(Strategy):
         constantly long the underlying rates market
         from the date of strategy initialisation.
 
+        Only the tokens that updated are looked at when the
+        MarketEvent lists them, and a token is only traded once
+        its fixed rate can be calculated (see DataHandler.get_latest_fixed_rate).
+
         Parameters
         event - A MarketEvent object
         """
         if event.type == 'MARKET':
-            for t in self.token_list:
+            for t in self.token_list if event.tokens is None else event.tokens:
+                # wait for the rates needed for the fixed rate of the position
+                if self.rates.get_latest_fixed_rate(t) is None:
+                    continue
                 rates = self.rates.get_latest_rates(t, N=1)
                 if rates is not None and rates != []:
                     if not self.aped[t]:
                         # (Token, Direction = LONG, SHORT or EXIT, Timestamp)
-                        signal = SignalEvent(rates[0][0], 'LONG', rates[0][1])
+                        signal = SignalEvent(rates[-1][0], 'LONG', rates[-1][1])
                         self.events.put(signal)
-                        self.aped[t] = True
\ No newline at end of file
+                        self.aped[t] = True
+
+    @staticmethod
+    def vectorised_signals(liquidity_indices, lookback=1):
+        """
+        Returns the signals of the strategy over a whole rate panel for
+        the VectorisedBacktest: a single LONG signal per token, at the first
+        bar whose fixed rate can be calculated, i.e. the first bar following
+        by lookback bars another bar with a liquidity index.
+
+        Parameters:
+        liquidity_indices - Array of shape (number of tokens, number of bars).
+        lookback - Number of bars the fixed rates are annualised over.
+        """
+        liquidity_indices = np.asarray(liquidity_indices, dtype='float64')
+        signals = np.zeros(liquidity_indices.shape, dtype='int8')
+
+        has_fixed_rate = np.zeros(liquidity_indices.shape, dtype=bool)
+        has_fixed_rate[:, lookback:] = (
+            ~np.isnan(liquidity_indices[:, lookback:]) & ~np.isnan(liquidity_indices[:, :-lookback])
+        )
+
+        for j, row in enumerate(has_fixed_rate):
+            bars = np.flatnonzero(row)
+            if len(bars) > 0:
+                signals[j, bars[0]] = 1
+
+        return signals
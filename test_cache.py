@@ -0,0 +1,138 @@
+import unittest
+from unittest import mock
+from data import HistoricCSVDataHandler
+from cache import RateCache
+from ingestion import LiquidityIndexPreprocessor
+import pandas as pd
+import tempfile
+import shutil
+import queue
+import os
+
+
+class TestRateCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        self.csv_dir = os.path.join(self.tmp_dir, "datasets")
+        os.makedirs(self.csv_dir)
+        shutil.copy(os.path.join("datasets", "aave_usdc.csv"), self.csv_dir)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def _build_data_handler(self, cache_dir=None, is_liquid_staking=False):
+
+        return HistoricCSVDataHandler(
+            events=queue.Queue(),
+            csv_dir=self.csv_dir,
+            token_list=["aave_usdc"],
+            is_liquid_staking=is_liquid_staking,
+            cache_dir=cache_dir
+        )
+
+    def test_warm_start_matches_uncached_data(self):
+
+        expected = self._build_data_handler()._load_token_data("aave_usdc")
+
+        # cold start populates the cache
+        self._build_data_handler(cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # warm start must not parse the csv file at all
+        with mock.patch.object(LiquidityIndexPreprocessor, "read_csv", side_effect=AssertionError):
+            dataHandler = self._build_data_handler(cache_dir=self.cache_dir)
+            cached = dataHandler._load_token_data("aave_usdc")
+
+        pd.testing.assert_frame_equal(cached, expected, check_freq=False)
+
+        dataHandler.update_rates()
+        self.assertEqual(str(dataHandler.get_latest_rates("aave_usdc")[0][1]), '2020-12-02 00:00:00')
+
+    def test_entry_keyed_by_parameters(self):
+
+        self._build_data_handler(cache_dir=self.cache_dir)
+        self._build_data_handler(cache_dir=self.cache_dir, is_liquid_staking=True)
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+        HistoricCSVDataHandler(
+            events=queue.Queue(),
+            csv_dir=self.csv_dir,
+            token_list=["aave_usdc"],
+            cache_dir=self.cache_dir,
+            interpolation_method='direct'
+        )
+
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+    def test_changed_file_invalidates_entry(self):
+
+        self._build_data_handler(cache_dir=self.cache_dir)
+
+        csv_path = os.path.join(self.csv_dir, "aave_usdc.csv")
+        with open(csv_path, "a") as f:
+            f.write("2022-07-01T00:00:00.000Z,1060000000000000000000000000\n")
+
+        cache = RateCache(self.cache_dir)
+        self.assertIsNone(cache.load(
+            csv_path, cache.file_digest(csv_path),
+            interpolation_frequency='H', backtest_frequency='D', is_liquid_staking=False
+        ))
+
+        cached = self._build_data_handler(cache_dir=self.cache_dir)._load_token_data("aave_usdc")
+        self.assertEqual(str(cached.index[-1].date()), '2022-07-01')
+        self.assertEqual(cached.iloc[-1]["liquidityIndex"], 1.06e27)
+
+    def test_appended_rows_extend_entry(self):
+
+        csv_path = os.path.join(self.csv_dir, "aave_usdc.csv")
+        with open(csv_path, "rb") as f:
+            lines = f.readlines()
+        with open(csv_path, "wb") as f:
+            f.writelines(lines[:-20])
+
+        self._build_data_handler(cache_dir=self.cache_dir)
+
+        with open(csv_path, "ab") as f:
+            f.writelines(lines[-20:])
+
+        # only the appended rows are parsed, the entry is extended rather than recomputed
+        with mock.patch.object(LiquidityIndexPreprocessor, "preprocess", side_effect=AssertionError), \
+                mock.patch.object(LiquidityIndexPreprocessor, "preprocess_with_state", side_effect=AssertionError):
+            extended = self._build_data_handler(cache_dir=self.cache_dir)._load_token_data("aave_usdc")
+
+        expected = self._build_data_handler()._load_token_data("aave_usdc")
+        pd.testing.assert_frame_equal(extended, expected, check_exact=True, check_freq=False)
+
+        cache = RateCache(self.cache_dir)
+        df, n_unchanged = cache.refresh(csv_path, LiquidityIndexPreprocessor())
+        self.assertEqual(n_unchanged, len(df))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_modified_rows_recompute_entry(self):
+
+        self._build_data_handler(cache_dir=self.cache_dir)
+
+        csv_path = os.path.join(self.csv_dir, "aave_usdc.csv")
+        with open(csv_path, "rb") as f:
+            lines = f.readlines()
+        with open(csv_path, "wb") as f:
+            f.writelines(lines[:1] + lines[2:])
+            f.write(b"2022-07-01T00:00:00.000Z,1060000000000000000000000000\n")
+
+        cache = RateCache(self.cache_dir)
+        self.assertIsNone(cache.extend(csv_path, LiquidityIndexPreprocessor()))
+
+        df, n_unchanged = cache.refresh(csv_path, LiquidityIndexPreprocessor())
+        self.assertEqual(n_unchanged, 0)
+        pd.testing.assert_frame_equal(
+            df, LiquidityIndexPreprocessor().preprocess(csv_path), check_exact=True, check_freq=False
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from backtest import LongRateStrategyBacktest, MultiPortfolioLongRateStrategyBacktest
+from checkpoint import Checkpointer
+from data import ArrayDataHandler
+from event import DequeEventQueue
+import pandas as pd
+import tempfile
+import shutil
+import os
+
+START_DATE_TIME = '2021-04-01 00:00:00'
+
+
+class TestCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+
+        self.checkpoint_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.checkpoint_dir)
+
+    def _equity_curve(self, backtest):
+
+        portfolio = backtest.run_backtest()
+        portfolio.create_equity_curve_dataframe()
+        return portfolio.equity_curve
+
+    def test_resume_matches_uninterrupted_run(self):
+
+        expected = self._equity_curve(LongRateStrategyBacktest(start_date_time=START_DATE_TIME, leverage=5.0))
+
+        checkpointed = self._equity_curve(LongRateStrategyBacktest(
+            start_date_time=START_DATE_TIME, leverage=5.0, checkpoint_dir=self.checkpoint_dir, checkpoint_interval=50
+        ))
+        pd.testing.assert_frame_equal(checkpointed, expected)
+
+        checkpoints = Checkpointer(self.checkpoint_dir).checkpoints()
+        self.assertEqual(len(checkpoints), (len(expected) - 2) // 50)
+
+        for checkpoint_path in [checkpoints[0], checkpoints[len(checkpoints) // 2], checkpoints[-1]]:
+            backtest = LongRateStrategyBacktest(start_date_time=START_DATE_TIME, leverage=5.0)
+            backtest.resume(checkpoint_path)
+            pd.testing.assert_frame_equal(self._equity_curve(backtest), expected)
+
+    def test_resume_several_portfolios(self):
+
+        portfolio_params = [{'leverage': 1.0}, {'leverage': 5.0, 'initial_capital': 2.0}]
+
+        def equity_curves(backtest):
+            portfolios = backtest.run_backtest()
+            for portfolio in portfolios:
+                portfolio.create_equity_curve_dataframe()
+            return [portfolio.equity_curve for portfolio in portfolios]
+
+        expected = equity_curves(MultiPortfolioLongRateStrategyBacktest(
+            portfolio_params, start_date_time=START_DATE_TIME,
+            checkpoint_dir=self.checkpoint_dir, checkpoint_interval=50
+        ))
+
+        checkpoints = Checkpointer(self.checkpoint_dir).checkpoints()
+        for checkpoint_path in [checkpoints[0], checkpoints[-1]]:
+            backtest = MultiPortfolioLongRateStrategyBacktest(portfolio_params, start_date_time=START_DATE_TIME)
+            backtest.resume(checkpoint_path)
+            for equity_curve, expected_curve in zip(equity_curves(backtest), expected):
+                pd.testing.assert_frame_equal(equity_curve, expected_curve)
+
+    def test_keep_latest_checkpoints(self):
+
+        checkpointer = Checkpointer(self.checkpoint_dir, interval=1, keep=2)
+        for bar in range(1, 5):
+            checkpointer.save({'bar': bar})
+
+        self.assertEqual([os.path.basename(p) for p in checkpointer.checkpoints()],
+                         ['checkpoint-0000000003.pkl', 'checkpoint-0000000004.pkl'])
+        self.assertEqual(Checkpointer.load(checkpointer.latest()), {'bar': 4})
+
+    def test_array_data_handler_state(self):
+
+        dataHandler = ArrayDataHandler(events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc"])
+        for _ in range(10):
+            dataHandler.update_rates()
+        state = dataHandler.get_state()
+
+        resumed = ArrayDataHandler(events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc"])
+        resumed.set_state(state)
+
+        self.assertEqual(resumed.get_latest_rates("aave_usdc", N=3), dataHandler.get_latest_rates("aave_usdc", N=3))
+
+
+if __name__ == '__main__':
+    unittest.main()
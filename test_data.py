@@ -1,6 +1,21 @@
 import unittest
-from data import HistoricCSVDataHandler
+from utils import annualize_variable_rate
+from data import DataHandler, HistoricCSVDataHandler, ArrayDataHandler, MemoryMappedDataHandler, ScheduledDataHandler, ReplayDataHandler
+from store import RateStore
+from ingestion import LiquidityIndexPreprocessor
+from strategy import LongRateStrategy
+from execution import SimulatedExecutionHandler
+from portfolio import NaivePortfolio
+from event_loop import EventLoop, AsyncEventLoop
+from event import MARKET
+from event import DequeEventQueue
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
 import queue
+import os
+import time
 
 
 class TestDataHandler(unittest.TestCase):
@@ -85,5 +100,474 @@ class TestDataHandler(unittest.TestCase):
         # todo: need a rigoruous test
 
 
+class TestArrayDataHandler(unittest.TestCase):
+
+    def _build_data_handlers(self, **kwargs):
+
+        return [
+            data_handler_class(
+                events=queue.Queue(),
+                csv_dir="datasets",
+                **kwargs
+            ) for data_handler_class in (HistoricCSVDataHandler, ArrayDataHandler)
+        ]
+
+    def test_rates_match_historic_csv_data_handler(self):
+
+        historicDataHandler, arrayDataHandler = self._build_data_handlers(
+            token_list=["lido_stETH"],
+            backtest_frequency='H',
+            is_liquid_staking=True
+        )
+
+        self.assertEqual(arrayDataHandler.get_latest_rates("lido_stETH"), [])
+
+        while historicDataHandler.continue_backtest:
+            historicDataHandler.update_rates()
+            arrayDataHandler.update_rates()
+
+            self.assertEqual(
+                arrayDataHandler.get_latest_rates("lido_stETH", N=2),
+                historicDataHandler.get_latest_rates("lido_stETH", N=2)
+            )
+
+        self.assertFalse(arrayDataHandler.continue_backtest)
+        self.assertEqual(arrayDataHandler.cursor, len(historicDataHandler.latest_token_data["lido_stETH"]))
+
+    def test_get_latest_rates_returns_views(self):
+
+        arrayDataHandler = ArrayDataHandler(
+            events=queue.Queue(),
+            csv_dir="datasets",
+            token_list=["aave_usdc"]
+        )
+
+        for _ in range(5):
+            arrayDataHandler.update_rates()
+
+        rates = arrayDataHandler.get_latest_rates("aave_usdc", N=3)
+
+        self.assertEqual(len(rates), 3)
+        self.assertEqual(rates[-1][0], "aave_usdc")
+        self.assertEqual(str(rates[-1][1]), '2020-12-06 00:00:00')
+        self.assertTrue(np.shares_memory(rates.liquidity_indices, arrayDataHandler.liquidity_indices))
+        self.assertTrue(np.shares_memory(rates.timestamps, arrayDataHandler.timestamps))
+
+    def test_aligned_rates_panel(self):
+
+        token_list = ["aave_usdc", "rocket_rETH", "compound_dai"]
+
+        arrayDataHandler = ArrayDataHandler(
+            events=queue.Queue(),
+            csv_dir="datasets",
+            token_list=token_list,
+            gap_policy='none'
+        )
+
+        union_index = arrayDataHandler.token_data["aave_usdc"].index
+        for t in token_list[1:]:
+            union_index = union_index.union(arrayDataHandler.token_data[t].index)
+
+        self.assertEqual(arrayDataHandler.liquidity_indices.shape, (3, len(union_index)))
+        self.assertTrue((arrayDataHandler.timestamps == union_index.values).all())
+
+        # rETH starts in September 2021, hence the leading gap
+        self.assertTrue(np.isnan(arrayDataHandler.liquidity_indices[1, 0]))
+
+        # a single cursor step advances every token
+        arrayDataHandler.update_rates()
+        timestamps, liquidity_indices = arrayDataHandler.get_latest_rates_panel(N=1)
+        self.assertEqual(str(pd.Timestamp(timestamps[0])), '2020-12-02 00:00:00')
+        self.assertEqual(liquidity_indices.shape, (3, 1))
+        self.assertEqual(liquidity_indices[0, 0], arrayDataHandler.get_latest_rates("aave_usdc")[0][2])
+
+    def test_gap_policies(self):
+
+        token_list = ["aave_usdc", "rocket_rETH"]
+
+        dataHandlers = dict(
+            (gap_policy, ArrayDataHandler(
+                events=queue.Queue(),
+                csv_dir="datasets",
+                token_list=token_list,
+                gap_policy=gap_policy
+            )) for gap_policy in ArrayDataHandler.GAP_POLICIES
+        )
+
+        rETH_index = dataHandlers['none'].token_data["rocket_rETH"].index
+        aave_index = dataHandlers['none'].token_data["aave_usdc"].index
+
+        # forward fill drops the leading bars before rETH is available, but keeps
+        # the trailing aave bars, padding rETH with its latest rate
+        ffill = dataHandlers['ffill']
+        self.assertEqual(ffill.timestamps[0], rETH_index.values[0])
+        self.assertEqual(ffill.timestamps[-1], max(rETH_index.values[-1], aave_index.values[-1]))
+        self.assertFalse(np.isnan(ffill.liquidity_indices).any())
+
+        intersect = dataHandlers['intersect']
+        self.assertEqual(len(intersect.timestamps), len(rETH_index.intersection(aave_index)))
+        self.assertFalse(np.isnan(intersect.liquidity_indices).any())
+
+        with self.assertRaises(ValueError):
+            ArrayDataHandler(events=queue.Queue(), csv_dir="datasets", token_list=token_list, gap_policy='bfill')
+
+    def test_historic_csv_data_handler_uses_union_index(self):
+
+        dataHandler = HistoricCSVDataHandler(
+            events=queue.Queue(),
+            csv_dir="datasets",
+            token_list=["rocket_rETH", "aave_usdc"]
+        )
+
+        n_bars = 0
+        while dataHandler.continue_backtest:
+            dataHandler.update_rates()
+            n_bars += dataHandler.continue_backtest
+
+        # aave_usdc history starts earlier than rETH, so it must not be truncated to the rETH dates
+        self.assertEqual(str(dataHandler.latest_token_data["aave_usdc"][0][1]), '2020-12-02 00:00:00')
+        self.assertEqual(n_bars, len(dataHandler.latest_token_data["aave_usdc"]))
+
+    def test_parallel_ingestion(self):
+
+        token_list = ["aave_usdc", "compound_dai", "rocket_rETH", "lido_stETH_50_blocks"]
+
+        serialDataHandler, parallelDataHandler = [
+            ArrayDataHandler(
+                events=queue.Queue(),
+                csv_dir="datasets",
+                token_list=token_list,
+                max_workers=max_workers
+            ) for max_workers in (1, 3)
+        ]
+
+        self.assertTrue((parallelDataHandler.timestamps == serialDataHandler.timestamps).all())
+        np.testing.assert_array_equal(parallelDataHandler.liquidity_indices, serialDataHandler.liquidity_indices)
+
+    def test_drop_in_for_portfolio_and_strategy(self):
+
+        equity_curves = []
+        for dataHandler in self._build_data_handlers(token_list=["aave_usdc"]):
+
+            dataHandler.update_rates()
+
+            portfolio = NaivePortfolio(
+                rates=dataHandler,
+                events=dataHandler.events,
+                start_date_time='2020-12-01 00:00:00',
+                initial_capital=1000.00,
+                leverage=10
+            )
+
+            eventLoop = EventLoop(
+                events=dataHandler.events,
+                rates=dataHandler,
+                strategy=LongRateStrategy(rates=dataHandler, events=dataHandler.events),
+                portfolio=portfolio,
+                executionHandler=SimulatedExecutionHandler(events=dataHandler.events)
+            )
+            eventLoop.run_outer_loop()
+
+            portfolio.create_equity_curve_dataframe()
+            equity_curves.append(portfolio.equity_curve)
+
+        pd.testing.assert_frame_equal(equity_curves[1], equity_curves[0])
+
+
+class TestMemoryMappedDataHandler(unittest.TestCase):
+
+    def setUp(self):
+
+        self.store_dir = tempfile.mkdtemp()
+        self.token_list = ["aave_usdc", "aave_dai", "rocket_rETH"]
+
+        store = RateStore(self.store_dir)
+        for t in self.token_list:
+            store.write_from_csv(os.path.join("datasets", "%s.csv" % t), t, LiquidityIndexPreprocessor())
+
+    def tearDown(self):
+
+        shutil.rmtree(self.store_dir)
+
+    def assert_same_rates(self, token_list, **kwargs):
+
+        arrayDataHandler = ArrayDataHandler(
+            events=queue.Queue(), csv_dir="datasets", token_list=token_list, **kwargs
+        )
+        memoryMappedDataHandler = MemoryMappedDataHandler(
+            events=queue.Queue(), store_dir=self.store_dir, token_list=token_list, **kwargs
+        )
+
+        self.assertEqual(memoryMappedDataHandler.n_bars, arrayDataHandler.n_bars)
+
+        while arrayDataHandler.continue_backtest:
+            arrayDataHandler.update_rates()
+            memoryMappedDataHandler.update_rates()
+            for t in token_list:
+                self.assertEqual(
+                    memoryMappedDataHandler.get_latest_rates(t, N=2),
+                    arrayDataHandler.get_latest_rates(t, N=2)
+                )
+
+        self.assertFalse(memoryMappedDataHandler.continue_backtest)
+
+        return memoryMappedDataHandler
+
+    def test_zero_copy_window(self):
+
+        dataHandler = self.assert_same_rates(
+            ["aave_usdc", "aave_dai"],
+            start_date_time='2022-04-15 17:01:55',
+            end_date_time='2022-06-05 12:42:24'
+        )
+
+        window = dataHandler.get_latest_rates("aave_dai", N=10)
+
+        self.assertIsInstance(window.liquidity_indices, np.memmap)
+        self.assertFalse(window.liquidity_indices.flags.owndata)
+        self.assertEqual(dataHandler.get_latest_rates_panel(N=3)[1].shape, (2, 3))
+
+    def test_aligned_window(self):
+
+        self.assert_same_rates(self.token_list, gap_policy='intersect')
+
+
+class TestScheduledDataHandler(unittest.TestCase):
+
+    def setUp(self):
+
+        self.dataHandler = ScheduledDataHandler(
+            events=DequeEventQueue(),
+            csv_dir="datasets",
+            token_list=["aave_usdc", "lido_stETH_50_blocks"],
+            start_date_time='2022-03-01 00:00:00',
+            end_date_time='2022-04-01 00:00:00',
+            backtest_frequencies={"lido_stETH_50_blocks": None},
+            liquid_staking_tokens=["lido_stETH_50_blocks"]
+        )
+
+    def _run_events(self, dataHandler):
+
+        events = []
+        while dataHandler.continue_backtest:
+            dataHandler.update_rates()
+            events.append(dataHandler.events.popleft())
+        return events
+
+    def test_merges_feeds_by_timestamp(self):
+
+        dataHandler = self.dataHandler
+        n_rates = dict((t, len(dataHandler.timestamps[t])) for t in dataHandler.token_list)
+
+        self.assertEqual(dataHandler.get_latest_rates("lido_stETH_50_blocks", N=2), [])
+
+        events = self._run_events(dataHandler)
+
+        # one event per distinct timestamp, listing only the tokens observed at that time
+        timestamps = [e.timestamp for e in events]
+        self.assertEqual(timestamps, sorted(set(timestamps)))
+        self.assertEqual(sum(len(e.tokens) for e in events), sum(n_rates.values()))
+        self.assertEqual(sum(e.tokens == ("aave_usdc",) for e in events), n_rates["aave_usdc"] - sum(len(e.tokens) == 2 for e in events))
+
+        for e in events:
+            if e.tokens == ("aave_usdc",):
+                self.assertEqual(e.timestamp, e.timestamp.normalize())
+
+        # the raw feed is neither resampled nor padded
+        self.assertFalse(all(t == t.normalize() for t in dataHandler.token_data["lido_stETH_50_blocks"].index))
+        self.assertEqual(
+            dataHandler.get_latest_rates("lido_stETH_50_blocks", N=1)[0][1],
+            dataHandler.token_data["lido_stETH_50_blocks"].index[-1]
+        )
+
+    def test_rates_match_historic_csv_data_handler(self):
+
+        kwargs = dict(
+            csv_dir="datasets", token_list=["aave_usdc"],
+            start_date_time='2022-03-01 00:00:00', end_date_time='2022-04-01 00:00:00'
+        )
+        historicDataHandler = HistoricCSVDataHandler(events=queue.Queue(), **kwargs)
+        scheduledDataHandler = ScheduledDataHandler(events=DequeEventQueue(), **kwargs)
+
+        while scheduledDataHandler.continue_backtest:
+            historicDataHandler.update_rates()
+            scheduledDataHandler.update_rates()
+            self.assertEqual(
+                scheduledDataHandler.get_latest_rates("aave_usdc", N=2),
+                historicDataHandler.get_latest_rates("aave_usdc", N=2)
+            )
+
+    def test_state_round_trip(self):
+
+        dataHandler = self.dataHandler
+        for _ in range(20):
+            dataHandler.update_rates()
+        dataHandler.events.clear()
+        state = dataHandler.get_state()
+        expected = self._run_events(dataHandler)
+
+        dataHandler.set_state(state)
+        dataHandler.continue_backtest = True
+        events = self._run_events(dataHandler)
+
+        self.assertEqual([(e.tokens, e.timestamp) for e in events], [(e.tokens, e.timestamp) for e in expected])
+
+    def test_event_time_valuation(self):
+
+        dataHandler = self.dataHandler
+        dataHandler.update_rates()
+
+        # the stETH feed has no rate yet at the first event
+        portfolio = NaivePortfolio(rates=dataHandler, events=DequeEventQueue(), start_date_time=None, leverage=10)
+        portfolio.update_timeindex(dataHandler.events[0])
+        self.assertEqual(dataHandler.events[0].tokens, ("aave_usdc",))
+        self.assertEqual(portfolio.all_holdings[1]['lido_stETH_50_blocks'], 0)
+        self.assertTrue(np.isnan(portfolio.all_holdings[1]['liquidityIndex_lido_stETH_50_blocks']))
+
+        portfolio = NaivePortfolio(
+            rates=dataHandler,
+            events=dataHandler.events,
+            start_date_time='2022-03-01 00:00:00',
+            leverage=10
+        )
+        EventLoop(
+            events=dataHandler.events,
+            rates=dataHandler,
+            strategy=LongRateStrategy(rates=dataHandler, events=dataHandler.events),
+            portfolio=portfolio,
+            executionHandler=SimulatedExecutionHandler(events=dataHandler.events)
+        ).run_outer_loop()
+
+        holdings = portfolio.all_holdings
+
+        # a row per event, dated at the event time
+        timestamps = np.concatenate(list(dataHandler.timestamps.values()))
+        self.assertEqual(len(holdings), 1 + len(np.unique(timestamps)))
+        self.assertEqual([h['datetime'] for h in holdings[1:]], list(pd.DatetimeIndex(np.unique(timestamps))))
+        self.assertEqual(holdings[1]['datetime'], pd.Timestamp('2022-03-01 00:00:00'))
+
+        # both positions are valued from their own latest rates
+        last = holdings[-1]
+        for t in dataHandler.token_list:
+            rates = dataHandler.get_latest_rates(t, N=1)
+            self.assertEqual(last[t], portfolio.compute_total_value_of_positions(portfolio.current_positions[t], rates[0]))
+            self.assertEqual(len(portfolio.current_positions[t]), 1)
+
+
+class TestReplayDataHandler(unittest.TestCase):
+
+    def _replay(self, handler=None, **kwargs):
+
+        dataHandler = ReplayDataHandler(
+            events=DequeEventQueue(),
+            csv_dir="datasets",
+            token_list=["aave_usdc", "aave_dai"],
+            start_date_time='2022-03-01 00:00:00',
+            end_date_time='2022-03-11 00:00:00',
+            **kwargs
+        )
+        eventLoop = AsyncEventLoop(events=dataHandler.events, rates=dataHandler)
+
+        received = []
+        eventLoop.subscribe(MARKET, lambda event: received.append((event.tokens[0], event.timestamp)))
+        if handler is not None:
+            eventLoop.subscribe(MARKET, handler)
+
+        start = time.perf_counter()
+        eventLoop.run_outer_loop()
+
+        return dataHandler, received, time.perf_counter() - start
+
+    def test_replays_raw_observations(self):
+
+        # ten days replayed in about 0.1s
+        dataHandler, received, elapsed = self._replay(speed=864000 * 10)
+
+        report = dataHandler.report()
+        n_rates = sum(len(dataHandler.timestamps[t]) for t in dataHandler.token_list)
+
+        self.assertEqual(len(received), n_rates)
+        self.assertEqual((report['total']['emitted'], report['total']['dropped']), (n_rates, 0))
+        self.assertGreater(elapsed, 0.05)
+        self.assertEqual(report['aave_dai']['lag']['calls'], len(dataHandler.timestamps['aave_dai']))
+
+        for t in dataHandler.token_list:
+            timestamps = [timestamp for token, timestamp in received if token == t]
+            self.assertEqual(timestamps, list(pd.DatetimeIndex(dataHandler.timestamps[t])))
+
+        # the two feeds are replayed on a common clock
+        timestamps = [timestamp for _, timestamp in received]
+        self.assertLess(sum(a > b for a, b in zip(timestamps, timestamps[1:])), 3)
+
+    def test_slow_consumer_drops_rates(self):
+
+        dataHandler, received, _ = self._replay(
+            handler=lambda event: time.sleep(0.03), speed=864000 * 10, max_queue_size=1, late_tolerance=0.005
+        )
+
+        report = dataHandler.report()['total']
+
+        self.assertGreater(report['dropped'], 0)
+        self.assertGreater(report['late'], 0)
+        self.assertEqual(len(received), report['emitted'])
+        self.assertGreater(report['lag']['max'], 0.03)
+
+    def test_as_fast_as_possible(self):
+
+        dataHandler, received, _ = self._replay(handler=lambda event: time.sleep(0.001), speed=None, max_queue_size=1)
+
+        self.assertEqual(len(received), sum(len(dataHandler.timestamps[t]) for t in dataHandler.token_list))
+        self.assertEqual(dataHandler.report()['total']['dropped'], 0)
+
+
+class TestFixedRates(unittest.TestCase):
+
+    def _assert_rates_equal(self, rate, expected):
+
+        if expected is None or np.isnan(expected):
+            self.assertTrue(rate is expected or np.isnan(rate))
+        else:
+            self.assertEqual(rate, expected)
+
+    def test_precomputed_fixed_rates_match_latest_rates(self):
+
+        for lookback in (1, 3):
+            for compounding in (True, False):
+                kwargs = dict(
+                    events=DequeEventQueue(), csv_dir="datasets", start_date_time='2022-03-01 00:00:00',
+                    end_date_time='2022-04-01 00:00:00', fixed_rate_lookback=lookback, fixed_rate_compounding=compounding
+                )
+                dataHandlers = [
+                    HistoricCSVDataHandler(token_list=["aave_usdc", "aave_dai"], backtest_frequency='H', **kwargs),
+                    ArrayDataHandler(token_list=["aave_usdc", "aave_dai"], backtest_frequency='H', **kwargs),
+                    ScheduledDataHandler(
+                        token_list=["aave_usdc", "lido_stETH_50_blocks"], backtest_frequencies={"lido_stETH_50_blocks": None},
+                        liquid_staking_tokens=["lido_stETH_50_blocks"], **kwargs
+                    )
+                ]
+
+                for dataHandler in dataHandlers:
+                    n_fixed_rates = 0
+                    while dataHandler.continue_backtest:
+                        dataHandler.update_rates()
+                        for t in dataHandler.token_list:
+                            fixed_rate = dataHandler.get_latest_fixed_rate(t)
+                            # the default implementation annualises the latest rates
+                            self._assert_rates_equal(fixed_rate, DataHandler.get_latest_fixed_rate(dataHandler, t))
+                            n_fixed_rates += fixed_rate is not None
+
+                    self.assertGreater(n_fixed_rates, 50)
+
+    def test_annualisation(self):
+
+        half_year = pd.Timedelta(days=182.5)
+
+        self.assertAlmostEqual(annualize_variable_rate(0.01, half_year, compounding=False), 0.02)
+        self.assertAlmostEqual(annualize_variable_rate(0.01, half_year), 0.0201)
+
+        with self.assertRaises(ValueError):
+            ArrayDataHandler(events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc"], fixed_rate_lookback=0)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
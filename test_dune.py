@@ -0,0 +1,184 @@
+import unittest
+from unittest import mock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from duneanalytics import DuneAnalytics
+from dune import Dune
+import pandas as pd
+import threading
+import tempfile
+import shutil
+import json
+import os
+
+ROWS = [
+    {'date': '2022-06-15T12:00:00.000Z', 'liquidityIndexUSDC': 1072000000000000000000000000},
+    {'date': '2022-06-17T12:00:00.000Z', 'liquidityIndexUSDC': 1073000000000000000000000000},
+    {'date': '2022-06-16T12:00:00.000Z', 'liquidityIndexUSDC': 1072500000000000000000000000},
+]
+
+
+class StubDuneClient(object):
+    """
+    Stands in for the DuneAnalytics client, serving canned query results.
+    """
+
+    def __init__(self, rows):
+
+        self.rows = rows
+        self.n_result_queries = 0
+
+    def query_result_id_v2(self, query_id):
+
+        return 'result-%d' % len(self.rows)
+
+    def query_result(self, result_id):
+
+        self.n_result_queries += 1
+        return {'data': {'get_result_by_result_id': [{'data': row} for row in self.rows]}}
+
+
+class FakeDuneRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves the GraphQL queries of the DuneAnalytics client, failing
+    the first result query of every query id with a 503.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        variables = payload['variables']
+
+        with server.lock:
+            server.connections.add(self.client_address)
+
+        if payload['operationName'] == 'GetResult':
+            body = {'data': {'get_result': {'result_id': 'result-%d' % variables['query_id']}}}
+        else:
+            query_id = int(variables['result_id'].split('-')[1])
+            with server.lock:
+                failed = query_id in server.failed
+                server.failed.add(query_id)
+            if not failed:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            rows = [{'date': row['date'], server.columns[query_id]: row['liquidityIndexUSDC']} for row in ROWS]
+            body = {'data': {'get_result_by_result_id': [{'data': row} for row in rows]}}
+
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+
+        pass
+
+
+class TestDune(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.client = StubDuneClient(ROWS)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_query_aave_liquidity_index(self):
+
+        df = Dune(client=self.client).query_aave_liquidity_index()
+
+        self.assertEqual(list(df.columns), ['date', 'liquidityIndex'])
+        self.assertEqual(list(df['date']), [row['date'] for row in ROWS])
+        self.assertEqual(list(df['liquidityIndex']), [row['liquidityIndexUSDC'] for row in ROWS])
+
+    def test_query_euler_interest_rates(self):
+
+        self.client.rows = [
+            {'date_trunc': '2022-06-15', 'symbol': 'USDC', 'usdc': 0.02},
+            {'date_trunc': '2022-06-15', 'symbol': 'DAI', 'usdc': None},
+            {'date_trunc': '2022-06-16', 'symbol': 'USDC', 'usdc': 0.03},
+        ]
+
+        df = Dune(client=self.client).query_euler_interest_rates(coin='usdc')
+
+        self.assertEqual(list(df['date']), ['2022-06-15', '2022-06-16'])
+        self.assertEqual(list(df['apy']), [0.02, 0.03])
+
+    def test_cached_query_result(self):
+
+        cache_dir = os.path.join(self.tmp_dir, "cache")
+        Dune(client=self.client, cache_dir=cache_dir).query_result(891837)
+        data = Dune(client=self.client, cache_dir=cache_dir).query_result(891837)
+
+        self.assertEqual(self.client.n_result_queries, 1)
+        self.assertEqual(len(data['data']['get_result_by_result_id']), 3)
+
+        # a new execution of the query has a new result id
+        self.client.rows = ROWS[:2]
+        Dune(client=self.client, cache_dir=cache_dir).query_result(891837)
+        self.assertEqual(self.client.n_result_queries, 2)
+
+    def test_sync_appends_newer_rows(self):
+
+        dune = Dune(client=StubDuneClient(ROWS[:1]))
+        self.assertEqual(dune.sync_aave_liquidity_index(csv_dir=self.tmp_dir), 1)
+
+        csv_path = os.path.join(self.tmp_dir, "aave_usdc.csv")
+        with open(csv_path, "rb") as f:
+            initial = f.read()
+
+        dune = Dune(client=StubDuneClient(ROWS))
+        self.assertEqual(dune.sync_aave_liquidity_index(csv_dir=self.tmp_dir), 2)
+        self.assertEqual(dune.sync_aave_liquidity_index(csv_dir=self.tmp_dir), 0)
+
+        with open(csv_path, "rb") as f:
+            self.assertTrue(f.read().startswith(initial))
+
+        df = pd.read_csv(csv_path)
+        self.assertEqual(list(df['date']), [ROWS[0]['date'], ROWS[2]['date'], ROWS[1]['date']])
+        self.assertEqual(str(dune.last_date(csv_path)), '2022-06-17 12:00:00+00:00')
+
+    def test_fetch_aave_liquidity_indices(self):
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FakeDuneRequestHandler)
+        server.lock = threading.Lock()
+        server.connections = set()
+        server.failed = set()
+        server.columns = {891837: 'liquidityIndexUSDC', 905965: 'liquidityIndexDAI', 1: 'liquidityIndexUSDT'}
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            client = DuneAnalytics('username', 'password')
+            client.token = 'token'
+            jobs = [(query_id, column, os.path.join(self.tmp_dir, '%s.csv' % column))
+                    for query_id, column in server.columns.items()]
+
+            with mock.patch('duneanalytics.duneanalytics.GRAPH_URL', 'http://127.0.0.1:%d/v1/graphql' % server.server_port), \
+                    mock.patch('builtins.print'):
+                n_rows = Dune(client=client).fetch_aave_liquidity_indices(jobs, max_workers=2, backoff=0.01)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(n_rows, dict((csv_path, 3) for _, _, csv_path in jobs))
+        # every query was retried once, over at most one connection per worker
+        self.assertEqual(server.failed, set(server.columns))
+        self.assertLessEqual(len(server.connections), 2)
+
+        for _, _, csv_path in jobs:
+            df = pd.read_csv(csv_path)
+            self.assertEqual(list(df['date']), [row['date'] for row in ROWS])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), sorted('%s.csv' % c for c in server.columns.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
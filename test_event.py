@@ -1,6 +1,7 @@
 import unittest
-from event import MarketEvent, FillEvent, OrderEvent, SignalEvent
+from event import MarketEvent, FillEvent, OrderEvent, SignalEvent, DequeEventQueue, MARKET, SIGNAL, ORDER, FILL
 from datetime import datetime
+import queue
 
 TOKEN = "Aave USDC"
 TIMESTAMP = datetime(2021, 11, 28, 23, 55, 59, 342380)
@@ -57,6 +58,31 @@ class TestEvent(unittest.TestCase):
         self.assertEqual(self.fillEvent.margin, 10)
         self.assertEqual(self.fillEvent.fee, 0)
 
+    def test_slotted_events(self):
+
+        events = [self.marketEvent, self.signalEvent, self.orderEvent, self.fillEvent]
+
+        self.assertEqual([event.type_id for event in events], [MARKET, SIGNAL, ORDER, FILL])
+        for event in events:
+            self.assertFalse(hasattr(event, '__dict__'))
+
+        with self.assertRaises(AttributeError):
+            self.signalEvent.notional = 1000
+
+    def test_deque_event_queue(self):
+
+        events = DequeEventQueue()
+        self.assertTrue(events.empty())
+
+        events.put(self.signalEvent)
+        events.put(self.orderEvent)
+        self.assertEqual(events.qsize(), 2)
+
+        self.assertIs(events.get(), self.signalEvent)
+        self.assertIs(events.get(False), self.orderEvent)
+        with self.assertRaises(queue.Empty):
+            events.get(False)
+
 
 
 if __name__ == '__main__':
@@ -1,9 +1,13 @@
 import unittest
 from strategy import LongRateStrategy
-from data import HistoricCSVDataHandler
+from data import HistoricCSVDataHandler, ScheduledDataHandler, SimulatedFeedDataHandler
 from execution import SimulatedExecutionHandler
 from portfolio import NaivePortfolio
-from event_loop import EventLoop
+from event_loop import EventLoop, AsyncEventLoop, MultiPortfolioEventLoop
+from ingestion import LiquidityIndexPreprocessor
+from profiling import LatencyTracker
+from event import DequeEventQueue, MARKET
+import pandas as pd
 import queue
 
 
@@ -58,6 +62,158 @@ class TestEventLoop(unittest.TestCase):
 
         self.assertEqual(equity_curve.iloc[-1, -1], 1.590334362052235)
 
+    def test_deque_event_queue(self):
+
+        equity_curves = []
+        for events_queue in [queue.Queue(), DequeEventQueue()]:
+            dataHandler = HistoricCSVDataHandler(events=events_queue, csv_dir="datasets", token_list=["aave_usdc"])
+            dataHandler.update_rates()
+            portfolio = NaivePortfolio(
+                rates=dataHandler, events=events_queue, start_date_time='2021-03-11 14:49',
+                initial_capital=1000.00, leverage=10
+            )
+            EventLoop(
+                events=events_queue,
+                rates=dataHandler,
+                strategy=LongRateStrategy(rates=dataHandler, events=events_queue),
+                portfolio=portfolio,
+                executionHandler=SimulatedExecutionHandler(events=events_queue)
+            ).run_outer_loop()
+
+            self.assertEqual(events_queue.qsize(), 0)
+            portfolio.create_equity_curve_dataframe()
+            equity_curves.append(portfolio.equity_curve)
+
+        pd.testing.assert_frame_equal(equity_curves[1], equity_curves[0])
+
+    def test_subscribers(self):
+
+        seen = {'MARKET': [], 'SIGNAL': [], 'ORDER': [], 'FILL': []}
+        for event_type in seen:
+            self.eventLoop.subscribe(event_type, lambda event: seen[event.type].append(event))
+
+        bars = []
+        record_bar = lambda event: bars.append(self.dataHandler.get_latest_rates("aave_usdc")[0][1])
+        self.eventLoop.subscribe(MARKET, record_bar)
+
+        self.eventLoop.run_outer_loop()
+
+        # every consumer sees the same stream, the held position being opened once
+        self.assertEqual(len(bars), len(seen['MARKET']))
+        self.assertEqual(len(seen['MARKET']), len(self.portfolio.all_holdings) - 1)
+        self.assertEqual([len(seen[t]) for t in ['SIGNAL', 'ORDER', 'FILL']], [1, 1, 1])
+
+        self.eventLoop.unsubscribe(MARKET, record_bar)
+        self.assertEqual(len(self.eventLoop.handlers[MARKET]), 3)
+
+    def test_fixed_rate_lookback(self):
+
+        kwargs = dict(
+            csv_dir="datasets", start_date_time='2022-03-01 00:00:00', end_date_time='2022-04-01 00:00:00',
+            fixed_rate_lookback=3
+        )
+        for data_handler_class, token_list, data_kwargs in [
+            (HistoricCSVDataHandler, ["aave_usdc", "aave_dai"], {}),
+            (ScheduledDataHandler, ["aave_usdc", "lido_stETH_50_blocks"],
+             {'backtest_frequencies': {"lido_stETH_50_blocks": None}, 'liquid_staking_tokens': ["lido_stETH_50_blocks"]})
+        ]:
+            events = DequeEventQueue()
+            dataHandler = data_handler_class(events=events, token_list=token_list, **dict(kwargs, **data_kwargs))
+            dataHandler.update_rates()
+
+            portfolio = NaivePortfolio(
+                rates=dataHandler, events=events, start_date_time='2022-03-01 00:00:00', leverage=1.0
+            )
+            EventLoop(
+                events=events,
+                rates=dataHandler,
+                strategy=LongRateStrategy(rates=dataHandler, events=events),
+                portfolio=portfolio,
+                executionHandler=SimulatedExecutionHandler(events=events)
+            ).run_outer_loop()
+
+            for t in token_list:
+                positions = portfolio.current_positions[t]
+                self.assertEqual(len(positions), 1)
+                self.assertIsNotNone(positions[0]['fixedRate'])
+                # the position opens with the fourth rate of the token
+                self.assertEqual(positions[0]['timestamp'], dataHandler.get_latest_rates(t, N=10 ** 6)[3][1])
+
+
+class TestAsyncEventLoop(unittest.TestCase):
+
+    def test_concurrent_feeds(self):
+
+        preprocessor = LiquidityIndexPreprocessor()
+        token_data = {
+            "aave_usdc": preprocessor.preprocess("datasets/aave_usdc.csv").iloc[:20],
+            "aave_dai": preprocessor.preprocess("datasets/aave_dai.csv").iloc[:10]
+        }
+
+        events = DequeEventQueue()
+        dataHandler = SimulatedFeedDataHandler(events, token_data, intervals={"aave_usdc": 0.001, "aave_dai": 0.002})
+        portfolio = NaivePortfolio(rates=dataHandler, events=events, start_date_time=None, leverage=10)
+        latencyTracker = LatencyTracker()
+
+        eventLoop = AsyncEventLoop(
+            events=events,
+            rates=dataHandler,
+            strategy=LongRateStrategy(rates=dataHandler, events=events),
+            portfolio=portfolio,
+            executionHandler=SimulatedExecutionHandler(events=events),
+            latency_tracker=latencyTracker
+        )
+        updated_tokens = []
+        eventLoop.subscribe(MARKET, lambda event: updated_tokens.append(event.tokens[0]))
+        eventLoop.run_outer_loop()
+
+        # every rate is handled as it arrives, the two feeds interleaving
+        self.assertEqual(eventLoop.n_bars, 30)
+        self.assertEqual(len(portfolio.all_holdings), 31)
+        self.assertEqual(set(updated_tokens[:5]), {"aave_usdc", "aave_dai"})
+        self.assertFalse(dataHandler.continue_backtest)
+
+        for t, df in token_data.items():
+            self.assertEqual([r[2] for r in dataHandler.get_latest_rates(t, N=100)], list(df['liquidityIndex']))
+            # the position is opened at the second rate, which gives the fixed rate
+            self.assertEqual(portfolio.current_positions[t][0]['timestamp'], df.index[1])
+
+        report = latencyTracker.report()
+        self.assertEqual(report['tick_to_signal']['calls'], 2)
+        self.assertEqual(report['signal_to_order']['calls'], 2)
+        self.assertGreaterEqual(report['tick_to_signal']['p50'], 0)
+
+
+class TestMultiPortfolioEventLoop(unittest.TestCase):
+
+    def test_portfolio_queues(self):
+
+        events = DequeEventQueue()
+        dataHandler = HistoricCSVDataHandler(events=events, csv_dir="datasets", token_list=["aave_usdc"])
+        strategy = LongRateStrategy(rates=dataHandler, events=events)
+
+        portfolio = NaivePortfolio(rates=dataHandler, events=events, start_date_time="2021-03-11 00:00:00", leverage=1.0)
+        with self.assertRaises(ValueError):
+            MultiPortfolioEventLoop(events, dataHandler, strategy, [portfolio], [SimulatedExecutionHandler(events=events)])
+
+        portfolio_events = DequeEventQueue()
+        portfolio = NaivePortfolio(rates=dataHandler, events=portfolio_events, start_date_time="2021-03-11 00:00:00", leverage=1.0)
+        with self.assertRaises(ValueError):
+            MultiPortfolioEventLoop(events, dataHandler, strategy, [portfolio], [])
+
+        dataHandler.update_rates()
+        eventLoop = MultiPortfolioEventLoop(
+            events, dataHandler, strategy, [portfolio], [SimulatedExecutionHandler(events=portfolio_events)]
+        )
+        for _ in range(30):
+            dataHandler.update_rates()
+            eventLoop.run_inner_loop()
+
+        self.assertFalse(events)
+        self.assertFalse(portfolio_events)
+        self.assertEqual(len(portfolio.all_holdings), 32)
+        self.assertGreater(len(portfolio.current_positions["aave_usdc"]), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import unittest
+from exposure import NetExposure
+from portfolio import NaivePortfolio
+from test_helpers import compare_portfolios, position_loop_value
+import pandas as pd
+import numpy as np
+
+
+class TestNetExposure(unittest.TestCase):
+
+    def test_value_matches_position_loop(self):
+
+        rng = np.random.default_rng(11)
+        start = pd.Timestamp('2022-01-01 00:00:00')
+
+        positions = []
+        exposure = NetExposure()
+        for i in range(500):
+            position = {
+                'timestamp': start + pd.Timedelta(hours=i, seconds=int(rng.integers(0, 3600))),
+                'direction': 'SHORT' if rng.random() < 0.3 else 'LONG',
+                'notional': float(rng.random() * 1e6),
+                'margin': float(rng.random() * 1e4),
+                'fixedRate': float(rng.random() * 0.1),
+                'startingRateValue': float(1e27 * (1 + 1e-4 * i)),
+                'fee': 0.0
+            }
+            positions.append(position)
+            exposure.append(position)
+
+            rate = ('aave_usdc', start + pd.Timedelta(hours=i + 1), 1e27 * (1 + 1e-4 * (i + 1)))
+            expected = position_loop_value(positions, rate)
+            self.assertAlmostEqual(exposure.value(rate), expected, delta=1e-9 * sum(p['notional'] for p in positions))
+
+        self.assertEqual(len(exposure), 500)
+        self.assertEqual(NetExposure().value(rate), 0)
+
+    def test_exposure(self):
+
+        timestamp = pd.Timestamp('2022-01-01 00:00:00')
+        exposure = NetExposure.from_positions([
+            {'timestamp': timestamp, 'direction': 'LONG', 'notional': 30.0, 'margin': 3.0, 'fixedRate': 0.04,
+             'startingRateValue': 1e27, 'fee': 0.0},
+            {'timestamp': timestamp, 'direction': 'LONG', 'notional': 10.0, 'margin': 1.0, 'fixedRate': 0.08,
+             'startingRateValue': 1e27, 'fee': 0.0},
+            {'timestamp': timestamp, 'direction': 'SHORT', 'notional': 15.0, 'margin': 2.0, 'fixedRate': 0.05,
+             'startingRateValue': 1e27, 'fee': 0.0}
+        ])
+
+        summary = exposure.exposure()
+        self.assertEqual(summary['LONG']['notional'], 40.0)
+        self.assertAlmostEqual(summary['LONG']['fixedRate'], 0.05)
+        self.assertEqual(summary['SHORT']['margin'], 2.0)
+        self.assertEqual(summary['net_notional'], 25.0)
+
+        # offsetting positions opened at the same rates leave only their margins
+        self.assertAlmostEqual(exposure.value(('aave_usdc', timestamp, 1e27)), 6.0)
+
+    def test_netted_portfolio_matches_book_portfolio(self):
+
+        with self.assertRaises(ValueError):
+            NaivePortfolio(rates=None, events=None, start_date_time='2022-03-01 00:00:00', leverage=1.0,
+                           valuation='exact')
+
+        compare_portfolios([{'valuation': valuation} for valuation in NaivePortfolio.VALUATIONS], rtol=1e-10)
+
+
+if __name__ == '__main__':
+    unittest.main()
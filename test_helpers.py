@@ -0,0 +1,99 @@
+from strategy import Strategy
+from portfolio import NaivePortfolio
+from data import HistoricCSVDataHandler
+from execution import SimulatedExecutionHandler
+from event_loop import EventLoop
+from event import SignalEvent, DequeEventQueue
+import pandas as pd
+import numpy as np
+
+# Shared by the tests which run the event loop on precomputed signals
+
+
+class ArraySignalStrategy(Strategy):
+    """
+    Replays precomputed signals in the event loop, once per bar.
+    """
+
+    def __init__(self, rates, events, signals):
+
+        self.rates = rates
+        self.events = events
+        self.signals = signals
+        self.bar = 0
+
+    def calculate_signals(self, event):
+
+        n_bars = len(self.rates.get_latest_rates(self.rates.token_list[0], N=len(self.signals[0])))
+        if n_bars - 1 < self.bar:
+            return
+        self.bar = n_bars
+
+        for j, t in enumerate(self.rates.token_list):
+            rates = self.rates.get_latest_rates(t, N=1)
+            if self.signals[j, n_bars - 1] != 0:
+                direction = 'LONG' if self.signals[j, n_bars - 1] > 0 else 'SHORT'
+                self.events.put(SignalEvent(t, direction, rates[0][1]))
+
+
+def run_signals(signals, token_list, start_date_time='2022-03-01 00:00:00', end_date_time='2022-06-01 00:00:00',
+                portfolio_class=NaivePortfolio, **portfolio_params):
+    """
+    Runs the event loop on the CSV datasets with an ArraySignalStrategy, and
+    returns the portfolio with its equity curve.
+
+    Parameters:
+    signals - int8 array of the signals, one row per token of token_list.
+    portfolio_class - Class of the portfolio, built with the portfolio_params
+                      besides rates, events and start_date_time.
+    """
+    events = DequeEventQueue()
+    dataHandler = HistoricCSVDataHandler(
+        events=events, csv_dir="datasets", token_list=token_list,
+        start_date_time=start_date_time, end_date_time=end_date_time
+    )
+    dataHandler.update_rates()
+
+    portfolio = portfolio_class(rates=dataHandler, events=events, start_date_time=start_date_time, **portfolio_params)
+    EventLoop(
+        events=events,
+        rates=dataHandler,
+        strategy=ArraySignalStrategy(dataHandler, events, signals),
+        portfolio=portfolio,
+        executionHandler=SimulatedExecutionHandler(events=events)
+    ).run_outer_loop()
+    portfolio.create_equity_curve_dataframe()
+
+    return portfolio
+
+
+def compare_portfolios(portfolio_params, **assert_params):
+    """
+    Trades aave_usdc on every other bar and aave_dai on every third bar with
+    portfolios of each of the portfolio_params (see run_signals), asserts that
+    their equity curves match and returns the portfolios.
+
+    Parameters:
+    assert_params - Keyword arguments of pd.testing.assert_frame_equal.
+    """
+    signals = np.zeros((2, 100), dtype='int8')
+    signals[0, 1::2] = 1
+    signals[1, 1::3] = -1
+
+    portfolios = [
+        run_signals(signals, ["aave_usdc", "aave_dai"], leverage=5.0, **params) for params in portfolio_params
+    ]
+    for portfolio in portfolios[1:]:
+        pd.testing.assert_frame_equal(portfolio.equity_curve, portfolios[0].equity_curve, **assert_params)
+
+    return portfolios
+
+
+def position_loop_value(positions, currentRateTuple):
+    """
+    Returns the value of the positions with the per position loop of
+    NaivePortfolio.compute_total_value_of_positions.
+    """
+    # the valuation methods of the portfolio do not depend on its rates
+    portfolio = NaivePortfolio.__new__(NaivePortfolio)
+    return portfolio.compute_total_value_of_positions(positions, currentRateTuple)
@@ -0,0 +1,170 @@
+import unittest
+from ingestion import LiquidityIndexPreprocessor, ChunkedPreprocessingState
+from data import HistoricCSVDataHandler
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import queue
+import os
+
+
+class TestLiquidityIndexPreprocessor(unittest.TestCase):
+
+    def assert_chunked_matches_in_memory(self, token, chunksizes, **kwargs):
+
+        csv_path = os.path.join("datasets", "%s.csv" % token)
+        expected = LiquidityIndexPreprocessor(**kwargs).preprocess(csv_path)
+
+        for chunksize in chunksizes:
+            chunked = LiquidityIndexPreprocessor(chunksize=chunksize, **kwargs).preprocess(csv_path)
+            pd.testing.assert_frame_equal(chunked, expected, check_exact=True, check_freq=False)
+
+    def test_chunked_daily_matches_in_memory(self):
+
+        # a chunk size of one puts every bucket boundary across chunks
+        self.assert_chunked_matches_in_memory("rocket_rETH", chunksizes=[1])
+
+        for token in ["aave_usdc", "compound_usdc"]:
+            self.assert_chunked_matches_in_memory(token, chunksizes=[50, 10000])
+
+    def test_chunked_liquid_staking_matches_in_memory(self):
+
+        for token in ["lido_stETH_50_blocks", "rocket_rETH"]:
+            self.assert_chunked_matches_in_memory(
+                token, chunksizes=[257, 5000], is_liquid_staking=True
+            )
+
+    def test_chunked_hourly_matches_in_memory(self):
+
+        self.assert_chunked_matches_in_memory(
+            "lido_stETH_50_blocks", chunksizes=[999], is_liquid_staking=True, backtest_frequency='H'
+        )
+        self.assert_chunked_matches_in_memory(
+            "aave_dai", chunksizes=[5], interpolation_frequency='15T', backtest_frequency='4H'
+        )
+
+    def test_chunked_requires_sorted_observations(self):
+
+        # lido_stETH.csv is made of two exports, the second one starting earlier than the end of the first one
+        preprocessor = LiquidityIndexPreprocessor(chunksize=1000, is_liquid_staking=True)
+
+        with self.assertRaises(ValueError):
+            preprocessor.preprocess(os.path.join("datasets", "lido_stETH.csv"))
+
+    def test_chunked_requires_fixed_interpolation_frequency(self):
+
+        preprocessor = LiquidityIndexPreprocessor(interpolation_frequency='M', chunksize=10)
+
+        with self.assertRaises(ValueError):
+            preprocessor.preprocess(os.path.join("datasets", "aave_usdc.csv"))
+
+    def test_equivalent_interpolation_matches_resample(self):
+
+        for token, kwargs in [
+            ("aave_usdc", {}),
+            ("lido_stETH", dict(is_liquid_staking=True)),
+            ("lido_stETH_50_blocks", dict(is_liquid_staking=True, backtest_frequency='H')),
+            ("compound_usdc", dict(interpolation_frequency='15T', backtest_frequency='7H')),
+        ]:
+            csv_path = os.path.join("datasets", "%s.csv" % token)
+
+            expected = LiquidityIndexPreprocessor(**kwargs).preprocess(csv_path)
+            equivalent = LiquidityIndexPreprocessor(interpolation_method='equivalent', **kwargs).preprocess(csv_path)
+
+            pd.testing.assert_frame_equal(equivalent, expected, check_exact=True, check_freq=False)
+
+    def test_direct_interpolation(self):
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            csv_path = os.path.join(tmp_dir, "token.csv")
+            with open(csv_path, "w") as f:
+                f.write("date,liquidityIndex\n")
+                f.write("2022-01-01T12:00:00.000Z,1000\n")
+                f.write("2022-01-02T06:00:00.000Z,1180\n")
+                f.write("2022-01-04T06:00:00.000Z,1280\n")
+
+            df = LiquidityIndexPreprocessor(interpolation_method='direct').preprocess(csv_path)
+
+            self.assertEqual([str(d) for d in df.index], [
+                '2022-01-02 00:00:00+00:00', '2022-01-03 00:00:00+00:00', '2022-01-04 00:00:00+00:00'
+            ])
+            self.assertEqual(list(df['liquidityIndex']), [1120.0, 1217.5, 1267.5])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        # the direct method interpolates in time rather than on the hourly grid, hence close but not equal
+        csv_path = os.path.join("datasets", "aave_usdc.csv")
+        expected = LiquidityIndexPreprocessor().preprocess(csv_path)
+        direct = LiquidityIndexPreprocessor(interpolation_method='direct').preprocess(csv_path)
+
+        pd.testing.assert_index_equal(direct.index, expected.index, exact=False)
+        np.testing.assert_allclose(direct['liquidityIndex'], expected['liquidityIndex'], rtol=1e-4)
+
+    def test_direct_interpolation_requires_fixed_frequencies(self):
+
+        with self.assertRaises(ValueError):
+            LiquidityIndexPreprocessor(interpolation_method='equivalent', backtest_frequency='M').preprocess(
+                os.path.join("datasets", "aave_usdc.csv")
+            )
+
+        with self.assertRaises(ValueError):
+            LiquidityIndexPreprocessor(interpolation_method='direct', chunksize=10)
+
+    def test_data_handler_chunked_ingestion(self):
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            rates = []
+            for chunksize, cache_dir in [(None, None), (50, None), (50, tmp_dir)]:
+                dataHandler = HistoricCSVDataHandler(
+                    events=queue.Queue(),
+                    csv_dir="datasets",
+                    token_list=["aave_usdc"],
+                    start_date_time='2022-04-15 17:01:55',
+                    end_date_time='2022-06-05 12:42:24',
+                    cache_dir=cache_dir,
+                    chunksize=chunksize
+                )
+                dataHandler.update_rates()
+                rates.append(dataHandler.get_latest_rates("aave_usdc"))
+
+            self.assertEqual(rates[1], rates[0])
+            self.assertEqual(rates[2], rates[0])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_saved_state_extends_with_appended_rows(self):
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for token, kwargs in [("aave_usdc", {}), ("rocket_rETH", {"is_liquid_staking": True}),
+                                  ("lido_stETH_50_blocks", {"backtest_frequency": "H", "chunksize": 100})]:
+                preprocessor = LiquidityIndexPreprocessor(**kwargs)
+                with open(os.path.join("datasets", "%s.csv" % token), "rb") as f:
+                    lines = f.readlines()
+
+                csv_path = os.path.join(tmp_dir, "%s.csv" % token)
+                expected = preprocessor.preprocess(os.path.join("datasets", "%s.csv" % token))
+
+                for n_lines in [2, len(lines) // 3, len(lines) - 1]:
+                    with open(csv_path, "wb") as f:
+                        f.writelines(lines[:n_lines])
+                    df, state = preprocessor.preprocess_with_state(csv_path)
+                    emitted = df.iloc[:state.n_emitted]
+
+                    with open(csv_path, "ab") as f:
+                        f.writelines(lines[n_lines:])
+                    state = ChunkedPreprocessingState.from_arrays(
+                        preprocessor, state.to_arrays(), str(df.index.tz), emitted=emitted
+                    )
+                    preprocessor.feed_csv(state, csv_path, offset=state.consumed_bytes)
+
+                    pd.testing.assert_frame_equal(state.finalize(), expected, check_exact=True, check_freq=False)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
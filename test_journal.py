@@ -0,0 +1,145 @@
+import unittest
+from backtest import LongRateStrategyBacktest
+from journal import EventJournal, replay_journal
+from event import MarketEvent, SignalEvent, OrderEvent, FillEvent
+from data import HistoricCSVDataHandler, ScheduledDataHandler
+from strategy import LongRateStrategy
+from portfolio import NaivePortfolio
+from execution import SimulatedExecutionHandler
+from event_loop import EventLoop
+from event import DequeEventQueue
+import pandas as pd
+import tempfile
+import shutil
+import os
+
+
+class TestEventJournal(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.tmp_dir, "journal.bin")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp_dir)
+
+    def test_record_and_read(self):
+
+        dataHandler = HistoricCSVDataHandler(
+            events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc", "aave_dai"]
+        )
+        timestamp = pd.Timestamp('2021-03-11 14:49')
+
+        journal = EventJournal(self.journal_path, dataHandler)
+        journal.record(MarketEvent())
+        dataHandler.update_rates()
+        journal.record(MarketEvent())
+        journal.record(SignalEvent("aave_dai", "SHORT", timestamp))
+        journal.record(OrderEvent("aave_dai", "SHORT", timestamp, 10.0, 1))
+        journal.record(FillEvent("aave_dai", 0, timestamp, 10.0, 1, "SHORT"))
+        journal.close()
+
+        token_list, events = EventJournal.read(self.journal_path)
+        events = list(events)
+
+        self.assertEqual(token_list, ["aave_usdc", "aave_dai"])
+        self.assertEqual([event.type for event, _ in events], ['MARKET', 'MARKET', 'SIGNAL', 'ORDER', 'FILL'])
+        self.assertEqual((events[1][0].tokens, events[1][0].timestamp), (None, None))
+        self.assertEqual(events[0][1], ({"aave_usdc": [], "aave_dai": []}, {"aave_usdc": None, "aave_dai": None}))
+        self.assertEqual(events[1][1][0]["aave_dai"], dataHandler.get_latest_rates("aave_dai", N=1))
+        self.assertIsNone(events[1][1][1]["aave_dai"])
+
+        dataHandler.update_rates()
+        journal = EventJournal(self.journal_path, dataHandler)
+        journal.record(MarketEvent())
+        journal.close()
+        _, recorded = EventJournal.read(self.journal_path)
+        self.assertEqual(next(recorded)[1][1]["aave_dai"], dataHandler.get_latest_fixed_rate("aave_dai"))
+
+        fill = events[-1][0]
+        self.assertEqual((fill.token, fill.direction, fill.timestamp), ("aave_dai", "SHORT", timestamp))
+        self.assertEqual((fill.notional, fill.margin, fill.fee), (10.0, 1, 0))
+        self.assertIsInstance(fill.margin, int)
+        self.assertIsInstance(fill.notional, float)
+
+    def test_replay_uses_recorded_fixed_rate_compounding(self):
+
+        dataHandler = HistoricCSVDataHandler(
+            events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc"], fixed_rate_compounding=False
+        )
+        journal = EventJournal(self.journal_path, dataHandler)
+        dataHandler.update_rates()
+        journal.record(MarketEvent())
+        journal.close()
+
+        portfolio = replay_journal(self.journal_path, start_date_time='2021-03-11 00:00:00', leverage=1.0)
+        self.assertFalse(portfolio.rates.fixed_rate_compounding)
+
+    def test_unknown_direction(self):
+
+        dataHandler = HistoricCSVDataHandler(events=DequeEventQueue(), csv_dir="datasets", token_list=["aave_usdc"])
+        journal = EventJournal(self.journal_path, dataHandler)
+
+        with self.assertRaises(ValueError):
+            journal.record(SignalEvent("aave_usdc", "SIDEWAYS", None))
+        journal.close()
+
+    def test_replay_matches_recorded_run(self):
+
+        for leverage in [1.0, 10]:
+            portfolio = LongRateStrategyBacktest(
+                start_date_time='2021-04-01 00:00:00', leverage=leverage, initial_capital=1000,
+                journal_path=self.journal_path
+            ).run_backtest()
+            portfolio.create_equity_curve_dataframe()
+
+            replayed = replay_journal(
+                self.journal_path, start_date_time='2021-04-01 00:00:00', leverage=leverage, initial_capital=1000
+            )
+            replayed.create_equity_curve_dataframe()
+
+            pd.testing.assert_frame_equal(replayed.equity_curve, portfolio.equity_curve, check_exact=True)
+
+
+    def test_replay_matches_scheduled_run(self):
+
+        start_date_time = '2022-03-01 00:00:00'
+        dataHandler = ScheduledDataHandler(
+            events=DequeEventQueue(),
+            csv_dir="datasets",
+            token_list=["lido_stETH_50_blocks", "aave_usdc"],
+            start_date_time=start_date_time,
+            end_date_time='2022-04-01 00:00:00',
+            backtest_frequencies={"lido_stETH_50_blocks": None},
+            liquid_staking_tokens=["lido_stETH_50_blocks"]
+        )
+        events = dataHandler.events
+        dataHandler.update_rates()
+
+        portfolio = NaivePortfolio(rates=dataHandler, events=events, start_date_time=start_date_time, leverage=10)
+        journal = EventJournal(self.journal_path, dataHandler)
+        EventLoop(
+            events=events,
+            rates=dataHandler,
+            strategy=LongRateStrategy(rates=dataHandler, events=events),
+            portfolio=portfolio,
+            executionHandler=SimulatedExecutionHandler(events=events),
+            journal=journal
+        ).run_outer_loop()
+        journal.close()
+        portfolio.create_equity_curve_dataframe()
+
+        _, recorded = EventJournal.read(self.journal_path)
+        market_event = next(event for event, _ in recorded)
+        self.assertEqual(market_event.tokens, ("aave_usdc",))
+        self.assertEqual(market_event.timestamp, pd.Timestamp(start_date_time))
+
+        replayed = replay_journal(self.journal_path, start_date_time=start_date_time, leverage=10)
+        replayed.create_equity_curve_dataframe()
+
+        pd.testing.assert_frame_equal(replayed.equity_curve, portfolio.equity_curve, check_exact=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from ledger import HoldingsLedger, PositionHistory
+from test_helpers import run_signals
+import pandas as pd
+import numpy as np
+
+
+class TestHoldingsLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = ['cash', 'fee', 'total', 'aave_usdc', 'fixedRate_aave_usdc', 'liquidityIndex_aave_usdc']
+
+    def test_matches_list_of_dicts(self):
+
+        start = pd.Timestamp('2022-01-01 00:00:00')
+        holdings = [{'datetime': start, 'cash': 1.0, 'fee': 0.0, 'total': 1.0}]
+        ledger = HoldingsLedger(self.columns, capacity=1)
+        ledger.append(holdings[0])
+
+        for i in range(1, 300):
+            values = [1.0 - 1e-3 * i, 1e-4 * i, 1.0 + 1e-3 * i, 2e-3 * i, None if i < 3 else 0.05, 1.1 + 1e-6 * i]
+            d = dict(zip(self.columns, values))
+            d['datetime'] = start + pd.Timedelta(hours=i)
+            holdings.append(d)
+            ledger.append_values(d['datetime'], values)
+
+        expected = pd.DataFrame(holdings)
+        expected.set_index('datetime', inplace=True)
+
+        frame = ledger.to_frame()
+        pd.testing.assert_frame_equal(frame, expected[self.columns].astype('float64'), check_exact=True)
+        self.assertTrue(np.shares_memory(frame.values, ledger.values))
+
+        self.assertEqual(len(ledger), 300)
+        self.assertEqual(ledger[5]['total'], holdings[5]['total'])
+        self.assertEqual(ledger[-1]['datetime'], holdings[-1]['datetime'])
+        self.assertTrue(np.isnan(ledger[0]['aave_usdc']))
+        self.assertEqual([row['cash'] for row in ledger[1:4]], [h['cash'] for h in holdings[1:4]])
+        self.assertEqual(ledger.nbytes, 300 * 8 * (1 + len(self.columns)))
+
+    def test_timezone_aware_datetimes(self):
+
+        ledger = HoldingsLedger(self.columns)
+        timestamp = pd.Timestamp('2022-01-01 00:00:00', tz='UTC')
+        ledger.append_values(timestamp, [1.0] * len(self.columns))
+
+        self.assertEqual(ledger[0]['datetime'], timestamp)
+        self.assertEqual(ledger.to_frame().index[0], timestamp)
+
+
+class TestPositionHistory(unittest.TestCase):
+
+    def test_positions_at_every_bar(self):
+
+        rng = np.random.default_rng(3)
+        start = pd.Timestamp('2022-01-01 00:00:00')
+        token_list = ['aave_usdc', 'aave_dai']
+
+        history = PositionHistory(token_list)
+        current = dict((t, {}) for t in token_list)
+        expected = []
+
+        for bar in range(200):
+            timestamp = start + pd.Timedelta(hours=bar)
+            history.mark_bar(timestamp)
+            expected.append(dict((t, list(current[t].values())) for t in token_list))
+
+            for _ in range(int(rng.integers(0, 3))):
+                t = token_list[int(rng.integers(0, 2))]
+                action = rng.random()
+                if action < 0.6 or not current[t]:
+                    position = {'timestamp': timestamp, 'notional': float(bar)}
+                    current[t][history.open(t, timestamp, position)] = position
+                else:
+                    position_id = list(current[t])[int(rng.integers(0, len(current[t])))]
+                    if action < 0.8:
+                        history.close(t, position_id, timestamp)
+                        del current[t][position_id]
+                    else:
+                        position = dict(current[t][position_id], notional=-1.0)
+                        history.modify(t, position_id, timestamp, position)
+                        current[t][position_id] = position
+
+        self.assertGreater(history.n_deltas, 100)
+        self.assertEqual(len(history), 200)
+        for bar in range(200):
+            self.assertEqual(history.positions_at(bar), expected[bar])
+        self.assertEqual(history[-1]['datetime'], start + pd.Timedelta(hours=199))
+        self.assertEqual(history[-1]['aave_dai'], expected[-1]['aave_dai'])
+
+        action, token, position_id, timestamp, position = next(history.deltas())
+        self.assertEqual((action, position_id), ('OPEN', 0))
+
+        with self.assertRaises(KeyError):
+            history.close('aave_usdc', 10 ** 6, start)
+
+    def test_memory_scales_with_trades(self):
+
+        timestamp = pd.Timestamp('2022-01-01 00:00:00')
+        history = PositionHistory(['aave_usdc'])
+
+        nbytes = []
+        for n in range(1, 4001):
+            history.mark_bar(timestamp)
+            history.open('aave_usdc', timestamp, {'notional': 1.0})
+            if n % 2000 == 0:
+                nbytes.append(history.nbytes)
+
+        # open positions are not copied: twice the trades take twice the memory
+        self.assertEqual(nbytes[1], 2 * nbytes[0])
+        self.assertEqual(len(history.positions_at(-1)['aave_usdc']), 3999)
+
+    def test_portfolio_history_does_not_alias_current_positions(self):
+
+        signals = np.zeros((1, 100), dtype='int8')
+        signals[0, 1::2] = 1
+
+        portfolio = run_signals(signals, ["aave_usdc"], leverage=5.0)
+
+        positions = portfolio.all_positions
+        n_positions = [len(row['aave_usdc']) for row in positions]
+
+        self.assertEqual(positions[0]['aave_usdc'], [])
+        self.assertEqual(n_positions, sorted(n_positions))
+        self.assertLess(n_positions[len(positions) // 2], n_positions[-1])
+        self.assertEqual(positions[-1]['aave_usdc'], portfolio.current_positions['aave_usdc'])
+        self.assertEqual(positions.n_deltas, len(portfolio.current_positions['aave_usdc']))
+
+
+if __name__ == '__main__':
+    unittest.main()
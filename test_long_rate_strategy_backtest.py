@@ -1,5 +1,7 @@
 import unittest
-from backtest import LongRateStrategyBacktest
+from backtest import LongRateStrategyBacktest, MultiPortfolioLongRateStrategyBacktest
+from portfolio import NaivePortfolio
+import pandas as pd
 
 
 class TestLongRateStrategyBacktest(unittest.TestCase):
@@ -38,5 +40,46 @@ class TestLongRateStrategyBacktest(unittest.TestCase):
         equity_curve = portfolio.equity_curve.dropna()
         self.assertEqual(equity_curve.iloc[-1, -1], 0.9895705735288505)
 
+
+class HalfNotionalPortfolio(NaivePortfolio):
+
+    def generate_naive_notional(self):
+
+        return self.initial_capital * self.leverage / 2
+
+
+class TestMultiPortfolioLongRateStrategyBacktest(unittest.TestCase):
+
+    def test_portfolios_match_separate_backtests(self):
+
+        portfolio_params = [
+            {'leverage': 1.0, 'initial_capital': 1.0},
+            {'leverage': 10.0, 'initial_capital': 1.0},
+            {'leverage': 2.0, 'initial_capital': 5.0},
+            {'leverage': 1.0, 'initial_capital': 1.0, 'portfolio_class': HalfNotionalPortfolio}
+        ]
+        portfolios = MultiPortfolioLongRateStrategyBacktest(
+            portfolio_params,
+            start_date_time="2022-04-01 00:00:00",
+            end_date_time="2022-06-01 00:00:00"
+        ).run_backtest()
+
+        # halving the notional is trading at half the leverage with the same margin
+        expected_params = portfolio_params[:3] + [{'leverage': 0.5, 'initial_capital': 1.0}]
+        for portfolio, params in zip(portfolios, expected_params):
+            expected = LongRateStrategyBacktest(
+                start_date_time="2022-04-01 00:00:00",
+                end_date_time="2022-06-01 00:00:00",
+                **params
+            ).run_backtest()
+
+            portfolio.create_equity_curve_dataframe()
+            expected.create_equity_curve_dataframe()
+            pd.testing.assert_frame_equal(portfolio.equity_curve, expected.equity_curve, check_exact=True)
+            self.assertEqual(len(portfolio.current_positions["aave_usdc"]), len(expected.current_positions["aave_usdc"]))
+
+        self.assertGreater(len(portfolios[0].current_positions["aave_usdc"]), 0)
+
+
 if __name__=="__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import unittest
+from position_book import PositionBook
+from portfolio import NaivePortfolio
+from test_helpers import compare_portfolios, position_loop_value
+import pandas as pd
+import numpy as np
+
+
+class LoopPortfolio(NaivePortfolio):
+    """
+    Values the positions with the per position loop of compute_total_value_of_positions.
+    """
+
+    def compute_token_holdings(self, token):
+
+        latest_rates = self.rates.get_latest_rates(token, N=1)
+        market_value = self.compute_total_value_of_positions(self.current_positions[token], latest_rates[0])
+        return market_value, self.get_current_fixed_rate(token), latest_rates[0][2] / 1e27
+
+
+class TestPositionBook(unittest.TestCase):
+
+    def test_value_matches_position_loop(self):
+
+        rng = np.random.default_rng(7)
+        start = pd.Timestamp('2022-01-01 00:00:00')
+
+        positions = []
+        book = PositionBook(capacity=1)
+        for i in range(200):
+            position = {
+                'timestamp': start + pd.Timedelta(int(rng.integers(0, 10 ** 15)), unit='ns'),
+                'direction': 'SHORT' if rng.random() < 0.3 else 'LONG',
+                'notional': int(rng.integers(1, 10 ** 6)) if i % 2 else float(rng.random() * 1e6),
+                'margin': int(rng.integers(1, 10 ** 4)) if i % 3 else float(rng.random() * 1e4),
+                'fixedRate': float(rng.random() * 0.1),
+                'startingRateValue': float(1e27 * (1 + rng.random())),
+                'fee': 0.0
+            }
+            positions.append(position)
+            book.append(position)
+
+            rate = ('aave_usdc', start + pd.Timedelta(int(rng.integers(10 ** 15, 10 ** 17)), unit='ns'), 1.5e27)
+            self.assertEqual(book.value(rate), position_loop_value(positions, rate))
+
+        self.assertEqual(len(book), 200)
+        self.assertEqual(PositionBook().value(rate), 0)
+
+    def test_portfolio_results_unchanged(self):
+
+        portfolios = compare_portfolios([{}, {'portfolio_class': LoopPortfolio}], check_exact=True)
+
+        self.assertGreater(len(portfolios[-1].current_positions["aave_usdc"]), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
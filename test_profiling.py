@@ -0,0 +1,49 @@
+import unittest
+from backtest import LongRateStrategyBacktest
+from profiling import EventLoopProfiler
+import pandas as pd
+
+
+class TestEventLoopProfiler(unittest.TestCase):
+
+    def test_report(self):
+
+        profiler = EventLoopProfiler(memory_interval=10)
+        backtest = LongRateStrategyBacktest(profiler=profiler)
+        portfolio = backtest.run_backtest()
+
+        report = profiler.report()
+        n_bars = len(portfolio.all_holdings) - 2
+
+        self.assertEqual(report['bars'], n_bars)
+        self.assertGreater(report['bars_per_second'], 0)
+        self.assertEqual(report['events'], {'MARKET': n_bars + 1, 'SIGNAL': 1, 'ORDER': 1, 'FILL': 1})
+
+        handlers = report['handlers']
+        self.assertEqual(handlers['HistoricCSVDataHandler.update_rates']['calls'], n_bars)
+        self.assertEqual(handlers['NaivePortfolio.update_timeindex']['calls'], n_bars + 1)
+        self.assertEqual(handlers['SimulatedExecutionHandler.execute_order']['calls'], 1)
+        for stats in handlers.values():
+            self.assertLessEqual(stats['p50'], stats['p99'])
+            self.assertLessEqual(stats['p99'], stats['max'])
+
+        self.assertEqual(len(report['memory']), n_bars // 10 + 1)
+        self.assertEqual(report['memory'][-1]['all_holdings_rows'], len(portfolio.all_holdings))
+        self.assertEqual(report['memory'][-1]['all_positions_rows'], len(portfolio.all_positions))
+        self.assertGreater(report['memory'][-1]['all_holdings_bytes'], report['memory'][0]['all_holdings_bytes'])
+
+        self.assertIn("NaivePortfolio.update_timeindex", profiler.format_report())
+
+    def test_profiled_results_unchanged(self):
+
+        equity_curves = []
+        for profiler in [None, EventLoopProfiler()]:
+            portfolio = LongRateStrategyBacktest(profiler=profiler).run_backtest()
+            portfolio.create_equity_curve_dataframe()
+            equity_curves.append(portfolio.equity_curve)
+
+        pd.testing.assert_frame_equal(equity_curves[1], equity_curves[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+from store import RateStore
+from cache import RateCache
+from ingestion import LiquidityIndexPreprocessor
+import pandas as pd
+import numpy as np
+import tempfile
+import shutil
+import os
+
+
+class TestRateStore(unittest.TestCase):
+
+    def setUp(self):
+
+        self.store_dir = tempfile.mkdtemp()
+        self.store = RateStore(self.store_dir)
+        self.preprocessor = LiquidityIndexPreprocessor()
+        self.store.write_from_csv(os.path.join("datasets", "aave_usdc.csv"), "aave_usdc", self.preprocessor)
+
+    def tearDown(self):
+
+        shutil.rmtree(self.store_dir)
+
+    def test_write_and_open(self):
+
+        expected = self.preprocessor.preprocess(os.path.join("datasets", "aave_usdc.csv"))
+
+        timestamps, liquidity_indices = self.store.open("aave_usdc")
+
+        self.assertIsInstance(liquidity_indices, np.memmap)
+        self.assertEqual(self.store.tokens(), ["aave_usdc"])
+        self.assertTrue((timestamps == expected.index.tz_localize(None).values.view('int64')).all())
+        self.assertTrue((liquidity_indices == expected['liquidityIndex'].values).all())
+
+    def test_open_window(self):
+
+        window_timestamps, window_liquidity_indices = self.store.open_window(
+            "aave_usdc", '2022-04-15 17:01:55', '2022-06-05 00:00:00'
+        )
+
+        self.assertEqual(str(pd.Timestamp(window_timestamps[0])), '2022-04-16 00:00:00')
+        self.assertEqual(str(pd.Timestamp(window_timestamps[-1])), '2022-06-05 00:00:00')
+        self.assertIsInstance(window_liquidity_indices, np.memmap)
+        self.assertFalse(window_liquidity_indices.flags.owndata)
+
+    def test_rewrite_keeps_mapped_columns_consistent(self):
+
+        timestamps, liquidity_indices = self.store.open("aave_usdc")
+        first_value = liquidity_indices[0]
+
+        df = pd.DataFrame(
+            {'liquidityIndex': [1.0, 2.0]},
+            index=pd.DatetimeIndex(['2022-01-01', '2022-01-02'], name='date')
+        )
+        self.store.write("aave_usdc", df)
+
+        self.assertEqual(liquidity_indices[0], first_value)
+        self.assertEqual(list(self.store.open("aave_usdc")[1]), [1.0, 2.0])
+
+    def test_update_rewrites_changed_rows_in_place(self):
+
+        timestamps, liquidity_indices = self.store.open("aave_usdc")
+        expected = self.preprocessor.preprocess(os.path.join("datasets", "aave_usdc.csv"))
+
+        df = expected.copy()
+        df.iloc[-3:] = 1.0
+        df = pd.concat([df, df.iloc[-2:].set_axis(df.index[-2:] + pd.Timedelta(days=2))])
+        self.store.update("aave_usdc", df)
+
+        updated_timestamps, updated_liquidity_indices = self.store.open("aave_usdc")
+        self.assertEqual(len(updated_timestamps), len(expected) + 2)
+        self.assertTrue((updated_liquidity_indices == df['liquidityIndex'].values).all())
+        self.assertTrue((updated_timestamps == df.index.tz_localize(None).values.view('int64')).all())
+
+        # the rows before the first change are those of the columns mapped beforehand
+        self.assertTrue((liquidity_indices[:-3] == expected['liquidityIndex'].values[:-3]).all())
+
+    def test_refresh_from_csv(self):
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            cache = RateCache(os.path.join(tmp_dir, "cache"))
+            csv_path = os.path.join(tmp_dir, "aave_usdc.csv")
+            with open(os.path.join("datasets", "aave_usdc.csv"), "rb") as f:
+                lines = f.readlines()
+
+            for n_lines in [len(lines) - 30, len(lines)]:
+                with open(csv_path, "wb") as f:
+                    f.writelines(lines[:n_lines])
+                self.store.refresh_from_csv(csv_path, "aave_usdc", self.preprocessor, cache)
+
+            expected = self.preprocessor.preprocess(csv_path)
+            timestamps, liquidity_indices = self.store.open("aave_usdc")
+            self.assertTrue((liquidity_indices == expected['liquidityIndex'].values).all())
+            self.assertTrue((timestamps == expected.index.tz_localize(None).values.view('int64')).all())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -32,6 +32,8 @@ class TestStrategy(unittest.TestCase):
     def test_calculate_signals(self):
 
         marketEvent = MarketEvent()
+        # the fixed rate of the position needs two rates
+        self.dataHandler.update_rates()
         self.dataHandler.update_rates()
         self.strategy.events = queue.Queue() # empty the queue
         self.strategy.calculate_signals(event=marketEvent)
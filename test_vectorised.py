@@ -0,0 +1,101 @@
+import unittest
+from backtest import LongRateStrategyBacktest, VectorisedLongRateStrategyBacktest
+from vectorised import VectorisedBacktest
+from data import ArrayDataHandler
+from strategy import LongRateStrategy
+from event import DequeEventQueue
+from test_helpers import run_signals
+import pandas as pd
+import numpy as np
+
+
+class TestVectorisedBacktest(unittest.TestCase):
+
+    def test_long_rate_strategy_parity(self):
+
+        for leverage in [1.0, 10.0]:
+            portfolio = LongRateStrategyBacktest(leverage=leverage).run_backtest()
+            portfolio.create_equity_curve_dataframe()
+
+            equity_curve = VectorisedLongRateStrategyBacktest(leverage=leverage).run_backtest()
+
+            pd.testing.assert_frame_equal(equity_curve, portfolio.equity_curve, check_exact=True, check_freq=False)
+
+        self.assertEqual(equity_curve.dropna().iloc[-1, -1], portfolio.equity_curve.dropna().iloc[-1, -1])
+
+    def test_fixed_rate_lookback_parity(self):
+
+        for lookback, compounding in [(3, True), (2, False)]:
+            kwargs = dict(leverage=10.0, fixed_rate_lookback=lookback, fixed_rate_compounding=compounding)
+            portfolio = LongRateStrategyBacktest(**kwargs).run_backtest()
+            portfolio.create_equity_curve_dataframe()
+
+            equity_curve = VectorisedLongRateStrategyBacktest(**kwargs).run_backtest()
+
+            pd.testing.assert_frame_equal(equity_curve, portfolio.equity_curve, check_exact=True, check_freq=False)
+            self.assertEqual(len(portfolio.current_positions["aave_usdc"]), 1)
+
+    def test_multiple_positions_parity(self):
+
+        token_list = ["aave_usdc", "aave_dai"]
+        start_date_time = '2022-03-01 00:00:00'
+        end_date_time = '2022-06-01 00:00:00'
+
+        array_data = ArrayDataHandler(
+            events=DequeEventQueue(), csv_dir="datasets", token_list=token_list,
+            start_date_time=start_date_time, end_date_time=end_date_time
+        )
+        signals = np.zeros(array_data.liquidity_indices.shape, dtype='int8')
+        signals[0, [1, 30]] = 1
+        signals[1, [1, 45]] = [-1, 1]
+
+        portfolio = run_signals(
+            signals, token_list, start_date_time=start_date_time, end_date_time=end_date_time,
+            leverage=5.0, initial_capital=1.0
+        )
+
+        backtest = VectorisedBacktest(
+            timestamps=array_data.timestamps,
+            liquidity_indices=array_data.liquidity_indices,
+            token_list=token_list,
+            signals=signals,
+            leverage=5.0,
+            initial_capital=1.0,
+            start_date_time=start_date_time
+        ).run()
+        backtest.create_equity_curve_dataframe(event_loop_layout=True)
+
+        pd.testing.assert_frame_equal(backtest.equity_curve, portfolio.equity_curve, check_exact=True, check_freq=False)
+        self.assertEqual(list(backtest.positions.iloc[-1]), [10.0, 0.0])
+
+    def test_vectorised_signals(self):
+
+        liquidity_indices = np.array([
+            [1.0, 1.1, 1.2, 1.3],
+            [np.nan, 1.0, 1.1, 1.2],
+            [np.nan, np.nan, np.nan, 1.0]
+        ])
+
+        signals = LongRateStrategy.vectorised_signals(liquidity_indices)
+
+        self.assertEqual(signals.tolist(), [[0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]])
+
+        signals = LongRateStrategy.vectorised_signals(liquidity_indices, lookback=2)
+
+        self.assertEqual(signals.tolist(), [[0, 0, 1, 0], [0, 0, 0, 1], [0, 0, 0, 0]])
+
+    def test_signal_without_fixed_rate(self):
+
+        backtest = VectorisedBacktest(
+            timestamps=np.array(['2022-01-01', '2022-01-02'], dtype='datetime64[ns]'),
+            liquidity_indices=np.array([[1.0, 1.1]]),
+            token_list=["aave_usdc"],
+            signals=np.array([[1, 0]])
+        )
+
+        with self.assertRaises(Exception):
+            backtest.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
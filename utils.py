@@ -0,0 +1,59 @@
+import numpy as np
+
+SECONDS_IN_YEAR = 31536000
+
+
+def annualize_variable_rate(variableRate, timeDelta, compounding=True):
+    """
+    Annualises a variable rate accrued over a period.
+
+    Parameters:
+    variableRate - The variable rate over the period, e.g. the liquidity index ratio minus one.
+    timeDelta - The length of the period as a Timedelta.
+    compounding - Whether the rate compounds over the periods of the year (APY)
+                  or is scaled linearly (APR).
+    """
+    if compounding:
+        numberOfCompoundingPeriodsInYear = SECONDS_IN_YEAR / timeDelta.total_seconds()
+        return (1 + variableRate)**(numberOfCompoundingPeriodsInYear) - 1
+
+    return variableRate * SECONDS_IN_YEAR / timeDelta.total_seconds()
+
+
+def fixed_rate_series(timestamps, liquidity_indices, lookback=1, compounding=True):
+    """
+    Returns the fixed rate implied at every bar of a liquidity index series:
+    the variable rate over the last lookback bars annualised with
+    annualize_variable_rate(), NaN over the first lookback bars.
+
+    The compounding is computed element by element with the scalar pow(), rather
+    than with np.power, because the SIMD np.power loop may differ from pow() in the
+    last bit: the series hence matches annualize_variable_rate() bit for bit.
+
+    Parameters:
+    timestamps - datetime64[ns] array of the bars.
+    liquidity_indices - float64 array of the liquidity indices, the bars along the last axis.
+    lookback - Number of bars the variable rate is taken over.
+    compounding - Whether the annualisation compounds, see annualize_variable_rate().
+    """
+    if lookback < 1:
+        raise ValueError("lookback must be at least one bar")
+
+    nanos = np.asarray(timestamps, dtype='datetime64[ns]').view('int64')
+    liquidity_indices = np.asarray(liquidity_indices, dtype='float64')
+
+    fixed_rates = np.full(liquidity_indices.shape, np.nan)
+    if liquidity_indices.shape[-1] <= lookback:
+        return fixed_rates
+
+    # Timedelta.total_seconds() has a microsecond resolution
+    seconds = (nanos[lookback:] - nanos[:-lookback]) // 1000 / 1e6
+    variable_rates = (liquidity_indices[..., lookback:] / liquidity_indices[..., :-lookback]) - 1.0
+
+    if compounding:
+        compounded = np.frompyfunc(pow, 2, 1)(1 + variable_rates, SECONDS_IN_YEAR / seconds).astype('float64')
+        fixed_rates[..., lookback:] = compounded - 1
+    else:
+        fixed_rates[..., lookback:] = variable_rates * SECONDS_IN_YEAR / seconds
+
+    return fixed_rates
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from strategy import SECONDS_IN_YEAR
+from utils import fixed_rate_series
+
+
+class VectorisedBacktest(object):
+    """
+    VectorisedBacktest computes the positions and holdings of a NaivePortfolio
+    over a whole rate panel at once with NumPy, for strategies whose signals only
+    depend on the rate series and can hence be precomputed as arrays
+    (see LongRateStrategy.vectorised_signals).
+
+    It follows the event-driven semantics bar by bar: a signal at bar k opens an IRS
+    position at bar k, with a notional of initial_capital * leverage, a margin of
+    initial_capital, the fixed rate annualised from bars k - fixed_rate_lookback and k
+    and the liquidity index of bar k, which is valued (and its margin paid out of cash) from bar k + 1 on.
+    Valuations perform the very same floating point operations as NaivePortfolio, so the
+    resulting holdings match the event loop exactly.
+    """
+
+    def __init__(self, timestamps, liquidity_indices, token_list, signals, leverage=1.0,
+                 initial_capital=1.0, fee=0.0, start_date_time=None, fixed_rate_lookback=1,
+                 fixed_rate_compounding=True):
+        """
+        Parameters:
+        timestamps - datetime64[ns] array of the bars.
+        liquidity_indices - float64 array of shape (number of tokens, number of bars).
+        token_list - The tokens of the rows of liquidity_indices.
+        signals - Integer array shaped as liquidity_indices, with 1 (LONG) or -1 (SHORT)
+                  at the bars where a position is opened and 0 elsewhere.
+        leverage - Notional to margin ratio of the positions.
+        initial_capital - The starting capital in USD, used as margin of every position.
+        fee - Fee paid for every position opened.
+        start_date_time - Datetime of the initial holdings in the event loop layout.
+        fixed_rate_lookback - Number of bars the fixed rates are annualised over.
+        fixed_rate_compounding - Whether the fixed rates are annualised with compounding.
+        """
+        self.timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        self.liquidity_indices = np.asarray(liquidity_indices, dtype='float64').reshape(len(token_list), -1)
+        self.token_list = list(token_list)
+        self.signals = np.asarray(signals).reshape(self.liquidity_indices.shape)
+        self.leverage = leverage
+        self.initial_capital = initial_capital
+        self.fee = fee
+        self.start_date_time = start_date_time
+        self.fixed_rate_lookback = fixed_rate_lookback
+        self.fixed_rate_compounding = fixed_rate_compounding
+
+    def fixed_rates(self):
+        """
+        Returns the fixed rates of the tokens at every bar, annualised from the variable
+        rate over the last fixed_rate_lookback bars (NaN over the first ones).
+        """
+        return fixed_rate_series(
+            self.timestamps, self.liquidity_indices,
+            lookback=self.fixed_rate_lookback, compounding=self.fixed_rate_compounding
+        )
+
+    def run(self):
+        """
+        Computes the positions (net notional per token) and holdings
+        DataFrames, with one row per bar.
+        """
+        n_tokens, n_bars = self.liquidity_indices.shape
+        nanos = self.timestamps.view('int64')
+        fixed_rates = self.fixed_rates()
+
+        notional = self.initial_capital * self.leverage
+        margin = self.initial_capital
+
+        # fills happen bar by bar in token order, as the signals come out of the event queue
+        fill_bars, fill_tokens = np.nonzero(self.signals.T)
+        if len(fill_bars) > 0 and fill_bars[0] == 0:
+            raise Exception("Cannot calculate the fixed rate")
+
+        cash = np.full(n_bars, float(self.initial_capital))
+        fees = np.zeros(n_bars)
+        running_cash = float(self.initial_capital)
+        running_fee = 0.0
+
+        positions = np.zeros((n_tokens, n_bars))
+        market_values = np.zeros((n_tokens, n_bars))
+
+        for k, j in zip(fill_bars, fill_tokens):
+            running_fee += self.fee
+            running_cash -= (self.fee + margin)
+            fees[k + 1:] = running_fee
+            cash[k + 1:] = running_cash
+
+            direction = np.sign(self.signals[j, k])
+            positions[j, k + 1:] += direction * notional
+
+            # cashflow from IRS initiation to every later bar, as in NaivePortfolio.compute_total_value_of_positions
+            years_since_swap_start = (nanos[k + 1:] - nanos[k]) / 1e9 / SECONDS_IN_YEAR
+            fixed_factor = fixed_rates[j, k] * years_since_swap_start
+            variable_factor = (self.liquidity_indices[j, k + 1:] / self.liquidity_indices[j, k] - 1)
+            cashflow = notional * (variable_factor - fixed_factor)
+            if direction < 0:
+                cashflow = -cashflow
+            market_values[j, k + 1:] += (cashflow + margin)
+
+        holdings = {'cash': cash, 'fee': fees, 'total': cash.copy()}
+        for j, t in enumerate(self.token_list):
+            holdings['total'] += market_values[j]
+            holdings[t] = market_values[j]
+            holdings['fixedRate_%s' % t] = fixed_rates[j]
+            holdings['liquidityIndex_%s' % t] = self.liquidity_indices[j] / 1e27
+
+        index = pd.DatetimeIndex(self.timestamps, name='datetime')
+        self.positions = pd.DataFrame(dict(zip(self.token_list, positions)), index=index)
+        self.holdings = pd.DataFrame(holdings, index=index)
+
+        return self
+
+    def event_loop_holdings(self):
+        """
+        Returns the holdings laid out as the all_holdings of a NaivePortfolio driven by
+        LongRateStrategyBacktest: an initial row at start_date_time, no row for the first
+        bar (which only primes the fixed rate), and the second and last bars recorded twice
+        (the data handler is updated once before the event loop starts and once more after
+        the last bar).
+        """
+        initial = pd.DataFrame(
+            {'cash': [self.initial_capital], 'fee': [0.0], 'total': [self.initial_capital]},
+            index=pd.DatetimeIndex([pd.Timestamp(self.start_date_time)], name='datetime')
+        )
+        rows = np.r_[1, np.arange(1, len(self.holdings)), len(self.holdings) - 1]
+
+        return pd.concat([initial, self.holdings.iloc[rows]])
+
+    def create_equity_curve_dataframe(self, event_loop_layout=False):
+        """
+        Creates the equity curve DataFrame from the holdings, optionally
+        in the event loop layout (see event_loop_holdings).
+        """
+        curve = self.event_loop_holdings() if event_loop_layout else self.holdings.copy()
+        curve['returns'] = curve['total'].pct_change()
+        curve['equity_curve'] = (1.0+curve['returns']).cumprod()
+
+        self.equity_curve = curve